@@ -15,6 +15,26 @@ jwt = JWTManager()
 socketio = SocketIO(cors_allowed_origins="*")  # Allow frontend React app
 
 
+def _socketio_queue_options():
+    """
+    Cross-worker Socket.IO message queue, selected with SOCKETIO_MESSAGE_QUEUE:
+      - "mongo": relay through a capped collection in our own MongoDB
+      - any other URL (redis://, amqp://, ...): handed to Flask-SocketIO as message_queue
+      - unset: single-process delivery
+    """
+    queue = os.getenv("SOCKETIO_MESSAGE_QUEUE", "")
+    if queue == "mongo":
+        from .utils.mongo_manager import MongoManager
+        return {"client_manager": MongoManager(
+            url=os.getenv("MONGO_URI", "mongodb://localhost:27017/"),
+            channel=os.getenv("SOCKETIO_CHANNEL", "acadwell"),
+            batch_interval=int(os.getenv("SOCKETIO_BUS_BATCH_MS", 5)) / 1000,
+        )}
+    if queue:
+        return {"message_queue": queue, "channel": os.getenv("SOCKETIO_CHANNEL", "acadwell")}
+    return {}
+
+
 def create_app():
     """Flask application factory pattern."""
     app = Flask(__name__)
@@ -26,11 +46,18 @@ def create_app():
     # ---------------- Initialize Extensions ----------------
     mongo.init_app(app)
     jwt.init_app(app)
-    socketio.init_app(app, cors_allowed_origins="*")
+    socketio.init_app(app, cors_allowed_origins="*", **_socketio_queue_options())
 
     # Attach MongoDB instance to app
     app.db = mongo.db
 
+    # Make sure hot query paths are index-backed
+    from .models import ensure_indexes
+    missing = ensure_indexes()
+    if missing:
+        app.logger.error(f"Unique indexes missing, data integrity is not enforced: {', '.join(missing)} "
+                         "(see the [MongoDB] lines above; `flask ensure-indexes` re-checks)")
+
     # ---------------- Enable CORS ----------------
     CORS(app, resources={r"/*": {"origins": os.getenv("CORS_ORIGINS", "*")}})
 
@@ -57,5 +84,13 @@ def create_app():
     app.register_blueprint(community_bp, url_prefix="/api/community")
     app.register_blueprint(wellness_bp, url_prefix="/api/wellness")
 
+    # ---------------- Realtime (Socket.IO) Handlers ----------------
+    from .socket_events import register_socket_events
+    register_socket_events(socketio)
+
+    # ---------------- CLI Commands ----------------
+    from .cli import register_commands
+    register_commands(app)
+
     print("✅ Flask app initialized successfully and connected to MongoDB")
     return app
@@ -3,6 +3,7 @@ from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, timedelta
+from app.utils.anon_ids import anon_ids
 
 auth_bp = Blueprint("auth", __name__, url_prefix="/api/auth")
 
@@ -152,6 +153,8 @@ def update_profile():
         update_fields = {k: v for k, v in data.items() if k not in ["_id", "password", "role", "id"]}
         if update_fields:
             current_app.db.users.update_one({"id": user_id}, {"$set": update_fields})
+            if "anonId" in update_fields:
+                anon_ids.invalidate(user_id)
         user = find_user_by_id(user_id)
         return jsonify({"success": True, "user": user}), 200
     except Exception as e:
@@ -2,7 +2,13 @@
 from flask import Blueprint, jsonify, request, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from datetime import datetime
-from app.models import users_col, requests_col, connections_col, messages_col
+from app.models import users_col, requests_col, connections_col, messages_col, conversations_col
+from app.utils.conversations import conversation_key, participant_slot, record_messages, mark_read
+from app.utils.activity import record_activity
+from bson import ObjectId
+from app.utils.connection_cache import connection_cache
+from app.utils.suggestions import get_suggestions_doc, mark_stale
+from app.utils.pagination import encode_cursor, decode_cursor, parse_limit, keyset_filter
 from pymongo.errors import PyMongoError
 
 chat_bp = Blueprint("chat", __name__, url_prefix="/api/chat")
@@ -28,32 +34,110 @@ def serialize_message(msg):
     }
 
 
+def hydrate_users(user_ids):
+    """Fetch many users in one $in query, returning {id: serialized user}."""
+    if not user_ids:
+        return {}
+    docs = users_col.find({"id": {"$in": list(user_ids)}}, {"_id": 1, "id": 1, "anonId": 1})
+    return {d.get("id") or str(d["_id"]): serialize_user(d) for d in docs}
+
+
+def _id_page(args, default=100, maximum=500):
+    """
+    Parse limit + `after` (an _id from next_cursor) for _id-ordered lists.
+    Without either param the limit is None and the whole list is returned,
+    which is what clients that don't follow next_cursor expect.
+    """
+    if "limit" not in args and "after" not in args:
+        return None, None
+    limit = parse_limit(args, default=default, maximum=maximum)
+    after = args.get("after")
+    if not after:
+        return limit, None
+    # connections mix uuid string _ids and ObjectIds
+    return limit, (ObjectId(after) if ObjectId.is_valid(after) else after)
+
+
+def _after_id(after):
+    """Filter for _ids sorting after `after`; strings sort before every ObjectId."""
+    if isinstance(after, ObjectId):
+        return {"_id": {"$gt": after}}
+    return {"$or": [{"_id": {"$gt": after}}, {"_id": {"$type": "objectId"}}]}
+
+
+def _id_list(collection, query, projection, limit, after):
+    """One _id-ordered page (everything when `limit` is None). Returns (docs, next_cursor)."""
+    if after is not None:
+        query = {"$and": [query, _after_id(after)]}
+    cursor = collection.find(query, projection).sort("_id", 1)
+    if limit is None:
+        return list(cursor), None
+    docs = list(cursor.limit(limit + 1))
+    if len(docs) > limit:
+        docs = docs[:limit]
+        return docs, str(docs[-1]["_id"])
+    return docs, None
+
+
 # ---------------- SUGGESTIONS ----------------
 @chat_bp.route("/suggestions", methods=["GET"])
 @jwt_required()
 def get_suggestions():
+    """
+    Ranked "people you may know", read from the precomputed per-user list.
+    Query params: limit (default 20, max 100), offset (next_offset of the previous page).
+    """
     try:
         current_user_id = str(get_jwt_identity())
-
-        # Get connected and pending user IDs
-        connected_ids = {
+        limit = parse_limit(request.args, default=20, maximum=100)
+        try:
+            offset = max(0, int(request.args.get("offset", 0)))
+        except ValueError:
+            return jsonify({"success": False, "message": "Invalid offset"}), 400
+
+        candidates = get_suggestions_doc(current_user_id).get("candidates", [])
+
+        # The list may predate recent connections/requests: re-check only this
+        # page (plus slack) with two small indexed reads.
+        window = candidates[offset:offset + limit * 2]
+        ids = [c["id"] for c in window]
+        taken = {
             c["user1"] if c["user2"] == current_user_id else c["user2"]
-            for c in connections_col.find({"$or": [
-                {"user1": current_user_id}, {"user2": current_user_id}
-            ]})
+            for c in connections_col.find(
+                {"conversation_id": {"$in": [conversation_key(current_user_id, i) for i in ids]}},
+                {"user1": 1, "user2": 1}
+            )
         }
-
-        pending_ids = {
+        taken |= {
             r["from"] if r["to"] == current_user_id else r["to"]
             for r in requests_col.find({"$or": [
-                {"from": current_user_id}, {"to": current_user_id}
-            ]})
+                {"from": current_user_id, "to": {"$in": ids}},
+                {"to": current_user_id, "from": {"$in": ids}}
+            ]}, {"from": 1, "to": 1})
         }
 
-        excluded = connected_ids.union(pending_ids).union({current_user_id})
-
-        suggestions = [serialize_user(u) for u in users_col.find({"id": {"$nin": list(excluded)}})]
-        return jsonify({"success": True, "users": suggestions})
+        page, consumed = [], 0
+        for c in window:
+            if len(page) == limit:
+                break
+            consumed += 1
+            if c["id"] not in taken:
+                page.append(c)
+
+        users = hydrate_users({c["id"] for c in page})
+        suggestions = [
+            {**users[c["id"]], "score": c["score"], "reasons": c.get("reasons", [])}
+            for c in page if c["id"] in users
+        ]
+        next_offset = offset + consumed
+        has_more = next_offset < len(candidates)
+
+        return jsonify({
+            "success": True,
+            "users": suggestions,
+            "next_offset": next_offset if has_more else None,
+            "has_more": has_more,
+        })
     except PyMongoError as e:
         current_app.logger.error(f"Error fetching suggestions: {e}")
         return jsonify({"success": False, "message": "Database error"}), 500
@@ -96,14 +180,18 @@ def send_follow(target_id):
 def get_pending():
     try:
         current_user_id = str(get_jwt_identity())
-        pending_requests = []
+        limit, after = _id_page(request.args)
+
+        reqs, next_cursor = _id_list(
+            requests_col, {"to": current_user_id, "status": "pending"}, {"from": 1}, limit, after
+        )
 
-        for r in requests_col.find({"to": current_user_id, "status": "pending"}):
-            user = users_col.find_one({"id": r["from"]})
-            if user:
-                pending_requests.append(serialize_user(user))
+        users = hydrate_users({r["from"] for r in reqs})
+        pending_requests = [users[r["from"]] for r in reqs if r["from"] in users]
 
-        return jsonify({"success": True, "requests": pending_requests})
+        return jsonify({
+            "success": True, "requests": pending_requests, "next_cursor": next_cursor, "has_more": bool(next_cursor)
+        })
     except PyMongoError as e:
         current_app.logger.error(f"Error fetching pending requests: {e}")
         return jsonify({"success": False, "message": "Database error"}), 500
@@ -120,8 +208,14 @@ def accept_follow(follower_id):
         if not req:
             return jsonify({"success": False, "message": "Request not found"}), 404
 
-        connections_col.insert_one({"user1": follower_id, "user2": current_user_id})
+        connections_col.insert_one({
+            "user1": follower_id,
+            "user2": current_user_id,
+            "conversation_id": conversation_key(follower_id, current_user_id)
+        })
         requests_col.delete_one({"_id": req["_id"]})
+        connection_cache.invalidate(follower_id, current_user_id)
+        mark_stale(follower_id, current_user_id)
 
         return jsonify({"success": True, "message": "Follow request accepted"})
     except PyMongoError as e:
@@ -135,15 +229,23 @@ def accept_follow(follower_id):
 def get_connections():
     try:
         current_user_id = str(get_jwt_identity())
-        connections = []
-
-        for c in connections_col.find({"$or": [{"user1": current_user_id}, {"user2": current_user_id}]}):
-            partner_id = c["user1"] if c["user2"] == current_user_id else c["user2"]
-            user = users_col.find_one({"id": partner_id})
-            if user:
-                connections.append(serialize_user(user))
-
-        return jsonify({"success": True, "connections": connections})
+        limit, after = _id_page(request.args)
+
+        docs, next_cursor = _id_list(
+            connections_col,
+            {"$or": [{"user1": current_user_id}, {"user2": current_user_id}]},
+            {"user1": 1, "user2": 1},
+            limit,
+            after,
+        )
+
+        partner_ids = [c["user1"] if c["user2"] == current_user_id else c["user2"] for c in docs]
+        users = hydrate_users(set(partner_ids))
+        connections = [users[pid] for pid in partner_ids if pid in users]
+
+        return jsonify({
+            "success": True, "connections": connections, "next_cursor": next_cursor, "has_more": bool(next_cursor)
+        })
     except PyMongoError as e:
         current_app.logger.error(f"Error fetching connections: {e}")
         return jsonify({"success": False, "message": "Database error"}), 500
@@ -161,14 +263,14 @@ def send_message(receiver_id):
         if not text:
             return jsonify({"success": False, "message": "Message text required"}), 400
 
-        # Must be connected
-        if not connections_col.find_one({"$or": [
-            {"user1": current_user_id, "user2": receiver_id},
-            {"user1": receiver_id, "user2": current_user_id}
-        ]}):
+        conversation_id = conversation_key(current_user_id, receiver_id)
+
+        # Must be connected (served from the per-worker adjacency cache)
+        if not connection_cache.are_connected(current_user_id, receiver_id):
             return jsonify({"success": False, "message": "Not connected"}), 403
 
         msg = {
+            "conversation_id": conversation_id,
             "sender_id": current_user_id,
             "receiver_id": receiver_id,
             "text": text,
@@ -176,6 +278,8 @@ def send_message(receiver_id):
         }
         inserted = messages_col.insert_one(msg)
         msg["_id"] = inserted.inserted_id
+        record_messages([msg])
+        record_activity(current_user_id, "messages", msg["timestamp"])
 
         return jsonify({"success": True, "message": "Message sent", "data": serialize_message(msg)})
     except PyMongoError as e:
@@ -187,19 +291,141 @@ def send_message(receiver_id):
 @chat_bp.route("/messages/<partner_id>", methods=["GET"])
 @jwt_required()
 def get_messages(partner_id):
+    """
+    Keyset-paginated history, always returned oldest -> newest.
+    Query params:
+      - limit: page size (default 50, max 200)
+      - before: cursor, fetch the page of messages older than it (default: latest page)
+      - after: cursor, fetch the page of messages newer than it
+    `next_cursor` continues in the same direction and is null when exhausted.
+    """
     try:
         current_user_id = str(get_jwt_identity())
-
-        msgs = list(messages_col.find({
-            "$or": [
-                {"sender_id": current_user_id, "receiver_id": partner_id},
-                {"sender_id": partner_id, "receiver_id": current_user_id}
-            ]
-        }).sort("timestamp", 1))
+        limit = parse_limit(request.args)
+        before = request.args.get("before")
+        after = request.args.get("after")
+
+        if before and after:
+            return jsonify({"success": False, "message": "Use either 'before' or 'after', not both"}), 400
+
+        try:
+            cursor = decode_cursor(after or before) if (after or before) else None
+        except ValueError as e:
+            return jsonify({"success": False, "message": str(e)}), 400
+
+        direction = 1 if after else -1
+        query = {"conversation_id": conversation_key(current_user_id, partner_id)}
+        if cursor:
+            query.update(keyset_filter(cursor, direction))
+
+        # Fetch one extra row to know whether another page exists
+        msgs = list(
+            messages_col.find(query)
+            .sort([("timestamp", direction), ("_id", direction)])
+            .limit(limit + 1)
+        )
+        has_more = len(msgs) > limit
+        msgs = msgs[:limit]
+
+        next_cursor = None
+        if has_more:
+            edge = msgs[-1]
+            next_cursor = encode_cursor(edge["timestamp"], edge["_id"])
+
+        if direction < 0:
+            msgs.reverse()
 
         formatted = [serialize_message(m) for m in msgs]
 
-        return jsonify({"success": True, "messages": formatted})
+        return jsonify({
+            "success": True,
+            "messages": formatted,
+            "next_cursor": next_cursor,
+            "has_more": has_more,
+        })
     except PyMongoError as e:
         current_app.logger.error(f"Error fetching messages: {e}")
         return jsonify({"success": False, "message": "Database error"}), 500
+
+
+# ---------------- CONNECTION CACHE STATS ----------------
+@chat_bp.route("/connection_cache/stats", methods=["GET"])
+@jwt_required()
+def get_connection_cache_stats():
+    """Hit/miss counters of this worker's connection cache."""
+    return jsonify({"success": True, "stats": connection_cache.stats()})
+
+
+# ---------------- INBOX ----------------
+@chat_bp.route("/inbox", methods=["GET"])
+@jwt_required()
+def get_inbox():
+    """
+    Most recent conversations first, one indexed query per page.
+    Query params: limit (default 20, max 100), before (cursor from next_cursor).
+    """
+    try:
+        current_user_id = str(get_jwt_identity())
+        limit = parse_limit(request.args, default=20, maximum=100)
+
+        query = {"participants": current_user_id}
+        before = request.args.get("before")
+        if before:
+            try:
+                query.update(keyset_filter(decode_cursor(before, id_type=str), -1, field="last_timestamp"))
+            except ValueError as e:
+                return jsonify({"success": False, "message": str(e)}), 400
+
+        convs = list(
+            conversations_col.find(query)
+            .sort([("last_timestamp", -1), ("_id", -1)])
+            .limit(limit + 1)
+        )
+        has_more = len(convs) > limit
+        convs = convs[:limit]
+
+        partner_ids = [
+            next((p for p in c["participants"] if p != current_user_id), current_user_id)
+            for c in convs
+        ]
+        partners = hydrate_users(set(partner_ids))
+
+        inbox = []
+        for c, partner_id in zip(convs, partner_ids):
+            last = c.get("last_message") or {}
+            inbox.append({
+                "conversation_id": c["_id"],
+                "partner": partners.get(partner_id, {"id": partner_id, "anonId": "Anonymous"}),
+                "last_message": {
+                    "id": last.get("id"),
+                    "from": last.get("sender_id"),
+                    "text": last.get("text"),
+                    "timestamp": last["timestamp"].isoformat() if last.get("timestamp") else None,
+                },
+                "unread": c.get("unread", {}).get(participant_slot(current_user_id, partner_id), 0),
+            })
+
+        next_cursor = None
+        if has_more:
+            edge = convs[-1]
+            next_cursor = encode_cursor(edge["last_timestamp"], edge["_id"])
+
+        return jsonify({"success": True, "conversations": inbox, "next_cursor": next_cursor, "has_more": has_more})
+    except PyMongoError as e:
+        current_app.logger.error(f"Error fetching inbox: {e}")
+        return jsonify({"success": False, "message": "Database error"}), 500
+
+
+# ---------------- MARK CONVERSATION READ ----------------
+@chat_bp.route("/inbox/<partner_id>/read", methods=["POST"])
+@jwt_required()
+def mark_conversation_read(partner_id):
+    try:
+        current_user_id = str(get_jwt_identity())
+        result = mark_read(current_user_id, partner_id)
+        if result.matched_count == 0:
+            return jsonify({"success": False, "message": "Conversation not found"}), 404
+        return jsonify({"success": True, "message": "Conversation marked as read"})
+    except PyMongoError as e:
+        current_app.logger.error(f"Error marking conversation read: {e}")
+        return jsonify({"success": False, "message": "Database error"}), 500
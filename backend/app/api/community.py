@@ -2,6 +2,8 @@ from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from bson import ObjectId
 from datetime import datetime
+from app.utils.activity import record_activity
+from app.utils.engagement import bump_engagement
 
 community_bp = Blueprint("community", __name__, url_prefix="/api/community")
 
@@ -82,6 +84,8 @@ def post_question():
     }
 
     res = current_app.db.community_posts.insert_one(post)
+    record_activity(user_id, "posts", post["createdAt"])
+    bump_engagement(user_id, "posts")
     post["_id"] = str(res.inserted_id)
     return jsonify(post), 201
 
@@ -113,14 +117,17 @@ def post_answer(post_id):
         "createdAt": datetime.utcnow(),
     }
 
-    res = current_app.db.community_posts.update_one(
+    post = current_app.db.community_posts.find_one_and_update(
         {"_id": ObjectId(post_id)},
-        {"$push": {"answers": answer}}
+        {"$push": {"answers": answer}},
+        projection={"userId": 1}
     )
 
-    if res.modified_count == 0:
+    if not post:
         return jsonify({"error": "Post not found"}), 404
 
+    record_activity(user_id, "answers", answer["createdAt"])
+    bump_engagement(post.get("userId"), "answersReceived")
     answer["_id"] = str(answer["_id"])
     return jsonify(answer), 201
 
@@ -1,10 +1,15 @@
 # app/api/grades.py
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from werkzeug.utils import secure_filename
-import pandas as pd
+from bson import ObjectId
 import datetime
-from io import BytesIO
+import os
+from app.utils.grade_import import IMPORT_MODES
+from app.utils.grade_jobs import FINISHED, upload_path, save_upload, create_job, cancel_job, serialize_job
+from app.utils.grade_export import export_filter, iter_rows, stream_csv, stream_xlsx
+from app.utils.grade_stats import stats_key, get_stats
+from app.utils.pagination import encode_cursor, decode_cursor, parse_limit, keyset_filter
 
 students_bp = Blueprint("students_bp", __name__)
 teacher_bp = Blueprint("teacher_bp", __name__)
@@ -14,14 +19,6 @@ ALLOWED_EXTENSIONS = {"csv", "xlsx"}
 def allowed_file(filename):
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def _find_column(df_cols, candidates):
-    """Return the first column name in df_cols that contains any candidate token."""
-    for c in df_cols:
-        for cand in candidates:
-            if cand in c:
-                return c
-    return None
-
 # ---------------- STUDENT: fetch my grades ----------------
 @students_bp.route("/my_grades", methods=["GET"])
 @jwt_required()
@@ -64,6 +61,9 @@ def upload_grades():
     Expects multipart/form-data:
       - file: .csv or .xlsx (with rollno, subject, marks columns -- tolerant to names)
       - date, semester, department, testType (as form fields)
+      - mode (optional): "upsert" (default, re-uploads overwrite existing grades)
+        or "insert" (grades already stored are kept)
+    Returns 202 with a jobId; poll /upload_jobs/<jobId> for progress.
     """
     try:
         teacher_id = get_jwt_identity()
@@ -84,102 +84,136 @@ def upload_grades():
         semester = request.form.get("semester")
         department = request.form.get("department")
         test_type = request.form.get("testType")
+        mode = request.form.get("mode", "upsert")
 
         if not all([date, semester, department, test_type]):
             return jsonify({"success": False, "message": "All fields (date, semester, department, testType) are required"}), 400
+        if mode not in IMPORT_MODES:
+            return jsonify({"success": False, "message": f"mode must be one of: {', '.join(IMPORT_MODES)}"}), 400
 
         filename = secure_filename(file_storage.filename)
 
-        # Read contents safely into pandas using BytesIO (works for both CSV & Excel)
-        file_bytes = file_storage.read()
-        buf = BytesIO(file_bytes)
+        # Save the sheet and queue it; a background worker does the import
+        job_id = ObjectId()
+        path = upload_path(job_id, filename)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        checksum, size = save_upload(file_storage, path)
+        create_job(job_id, teacher_id, filename, path, {
+            "teacherName": teacher_name,
+            "uploadedAt": datetime.datetime.utcnow(),
+            "date": date,
+            "semester": semester,
+            "department": department,
+            "testType": test_type
+        }, mode, checksum, size)
+
+        return jsonify({
+            "success": True,
+            "message": "Upload received, import queued",
+            "jobId": str(job_id),
+            "status": "queued"
+        }), 202
 
-        # use case-insensitive, whitespace tolerant column matching:
-        if filename.lower().endswith(".csv"):
-            df = pd.read_csv(buf, dtype=str)  # read everything as str to avoid parsing surprises
-        else:
-            # Excel: let pandas infer types, but convert column names below
-            df = pd.read_excel(buf, dtype=str)
-
-        if df.empty:
-            return jsonify({"success": False, "message": "Uploaded file is empty"}), 400
-
-        # normalize column names for robust matching
-        df.columns = [str(c).strip().lower() for c in df.columns]
-
-        # tolerant column detection
-        roll_col = _find_column(df.columns, ["roll", "reg", "regno", "reg_number", "registration"])
-        subject_col = _find_column(df.columns, ["subject", "sub"])
-        marks_col = _find_column(df.columns, ["mark", "score", "marks", "marks_obtained"])
-
-        missing = []
-        if not roll_col:
-            missing.append("rollno (or column containing 'roll'/'reg')")
-        if not subject_col:
-            missing.append("subject")
-        if not marks_col:
-            missing.append("marks")
-
-        if missing:
-            return jsonify({"success": False, "message": f"Missing required columns: {', '.join(missing)}"}), 400
-
-        uploaded_time = datetime.datetime.utcnow()
-        inserted = 0
-
-        # iterate rows safely
-        for idx, row in df.iterrows():
-            # Use .get to be safe — pandas Series.get returns NaN if not present
-            raw_roll = row.get(roll_col)
-            raw_subject = row.get(subject_col)
-            raw_marks = row.get(marks_col)
-
-            if pd.isna(raw_roll) or pd.isna(raw_subject) or pd.isna(raw_marks):
-                # skip incomplete rows
-                continue
-
-            rollno = str(raw_roll).strip()
-            subject = str(raw_subject).strip()
-            marks_val = raw_marks
-            # try cast numeric marks if possible
-            try:
-                if isinstance(marks_val, str):
-                    marks_val = marks_val.strip()
-                    # allow numeric strings like "85.5"
-                    if marks_val == "":
-                        continue
-                    marks_numeric = float(marks_val) if any(ch.isdigit() for ch in marks_val) else marks_val
-                else:
-                    marks_numeric = float(marks_val)
-            except Exception:
-                marks_numeric = raw_marks  # fallback to raw if casting fails
-
-            # match student by regNumber
-            student = current_app.db.users.find_one({"regNumber": rollno, "role": "student"})
-            if not student:
-                # skip unknown roll numbers (do not insert)
-                continue
-
-            # insert grade doc (store regNumber to allow direct matching later)
-            current_app.db.grades.insert_one({
-                "studentId": student["id"],
-                "regNumber": rollno,
-                "subject": subject,
-                "marks": marks_numeric,
-                "teacherId": teacher_id,
-                "teacherName": teacher_name,
-                "uploadedAt": uploaded_time,
-                "fileName": filename,
-                "date": date,
-                "semester": semester,
-                "department": department,
-                "testType": test_type
-            })
-            inserted += 1
+    except Exception as e:
+        # return helpful error message (in prod consider logging and returning generic message)
+        return jsonify({"success": False, "message": str(e)}), 500
 
-        return jsonify({"success": True, "message": f"{inserted} grades uploaded successfully"}), 200
 
+# ---------------- TEACHER: import job progress / cancellation ----------------
+def _job_id(raw):
+    return ObjectId(raw) if ObjectId.is_valid(raw) else None
+
+
+@teacher_bp.route("/upload_jobs/<job_id>", methods=["GET"])
+@jwt_required()
+def upload_job_status(job_id):
+    try:
+        teacher_id = get_jwt_identity()
+        job = current_app.db.grade_import_jobs.find_one({"_id": _job_id(job_id), "teacherId": teacher_id})
+        if not job:
+            return jsonify({"success": False, "message": "Job not found"}), 404
+        return jsonify({"success": True, "job": serialize_job(job)}), 200
+    except Exception as e:
+        return jsonify({"success": False, "message": str(e)}), 500
+
+
+@teacher_bp.route("/upload_jobs/<job_id>/cancel", methods=["POST"])
+@jwt_required()
+def cancel_upload_job(job_id):
+    try:
+        teacher_id = get_jwt_identity()
+        job = cancel_job(_job_id(job_id), teacher_id)
+        if not job:
+            return jsonify({"success": False, "message": "Job not found"}), 404
+        if job["status"] in FINISHED and job["status"] != "cancelled":
+            return jsonify({"success": False, "message": f"Job already {job['status']}", "job": serialize_job(job)}), 409
+        return jsonify({"success": True, "job": serialize_job(job)}), 200
+    except Exception as e:
+        return jsonify({"success": False, "message": str(e)}), 500
+
+
+# ---------------- TEACHER: class statistics ----------------
+@teacher_bp.route("/grade_stats", methods=["GET"])
+@jwt_required()
+def grade_stats():
+    """
+    Mean, median, std, percentiles, histogram and pass rate of one cohort.
+    Query params (all required): department, semester, subject, testType.
+    """
+    try:
+        teacher_id = get_jwt_identity()
+        if not current_app.db.users.find_one({"id": teacher_id, "role": "teacher"}, {"_id": 1}):
+            return jsonify({"success": False, "message": "Teacher not found"}), 404
+
+        department = request.args.get("department")
+        semester = request.args.get("semester")
+        subject = request.args.get("subject")
+        test_type = request.args.get("testType")
+        if not all([department, semester, subject, test_type]):
+            return jsonify({"success": False, "message": "department, semester, subject and testType are required"}), 400
+
+        key = stats_key(department, semester, subject, test_type)
+        stats, cached = get_stats(current_app.db, key)
+        return jsonify({"success": True, **key, "stats": stats, "cached": cached}), 200
+    except Exception as e:
+        return jsonify({"success": False, "message": str(e)}), 500
+
+
+# ---------------- TEACHER: export grades ----------------
+@teacher_bp.route("/export_grades", methods=["GET"])
+@jwt_required()
+def export_grades():
+    """
+    Stream grades as a file.
+    Query params: department (required), semester, subject, testType,
+    format ("csv" default or "xlsx"), pivot ("student" for one row per student).
+    """
+    try:
+        teacher_id = get_jwt_identity()
+        if not current_app.db.users.find_one({"id": teacher_id, "role": "teacher"}, {"_id": 1}):
+            return jsonify({"success": False, "message": "Teacher not found"}), 404
+        if not request.args.get("department"):
+            return jsonify({"success": False, "message": "department is required"}), 400
+
+        fmt = request.args.get("format", "csv").lower()
+        if fmt not in ("csv", "xlsx"):
+            return jsonify({"success": False, "message": "format must be csv or xlsx"}), 400
+        pivot = request.args.get("pivot") == "student"
+
+        query = export_filter(request.args)
+        rows = iter_rows(current_app.db.grades, query, pivot=pivot)
+        name = secure_filename("_".join(["grades"] + [str(v) for v in query.values()])) + f".{fmt}"
+
+        if fmt == "csv":
+            body, mimetype = stream_csv(rows), "text/csv"
+        else:
+            body, mimetype = stream_xlsx(rows), "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        return Response(
+            stream_with_context(body),
+            mimetype=mimetype,
+            headers={"Content-Disposition": f"attachment; filename={name}"}
+        )
     except Exception as e:
-        # return helpful error message (in prod consider logging and returning generic message)
         return jsonify({"success": False, "message": str(e)}), 500
 
 
@@ -187,43 +221,48 @@ def upload_grades():
 @teacher_bp.route("/my_uploads", methods=["GET"])
 @jwt_required()
 def my_uploads():
+    """
+    The teacher's upload manifests, newest first.
+    Query params: limit (default 50, max 200), before (next_cursor of the previous page).
+    """
     try:
         teacher_id = get_jwt_identity()
-        # fetch only this teacher's uploads
-        docs = list(current_app.db.grades.find({"teacherId": teacher_id}))
-        # group by file + metadata to produce concise history
-        history_map = {}
-        for g in docs:
-            key = (
-                g.get("fileName", "Unknown File"),
-                g.get("date"),
-                g.get("semester"),
-                g.get("department"),
-                g.get("testType")
-            )
-            # keep latest uploadedAt for that key
-            existing = history_map.get(key)
-            if not existing or (g.get("uploadedAt") and g.get("uploadedAt") > existing["uploadedAt"]):
-                history_map[key] = {
-                    "fileName": key[0],
-                    "date": key[1],
-                    "semester": key[2],
-                    "department": key[3],
-                    "testType": key[4],
-                    "uploadedAt": g.get("uploadedAt")
-                }
+        limit = parse_limit(request.args, default=50, maximum=200)
+        query = {"teacherId": teacher_id}
+        before = request.args.get("before")
+        if before:
+            try:
+                query.update(keyset_filter(decode_cursor(before), -1, field="uploadedAt"))
+            except ValueError as e:
+                return jsonify({"success": False, "message": str(e)}), 400
+
+        docs = list(
+            current_app.db.grade_uploads.find(query)
+            .sort([("uploadedAt", -1), ("_id", -1)])
+            .limit(limit + 1)
+        )
+        has_more = len(docs) > limit
+        docs = docs[:limit]
 
         result = []
-        for v in history_map.values():
+        for d in docs:
             result.append({
-                "fileName": v["fileName"],
-                "date": v["date"],
-                "semester": v["semester"],
-                "department": v["department"],
-                "testType": v["testType"],
-                "uploadedAt": v["uploadedAt"].isoformat() if v["uploadedAt"] else None
+                "uploadId": str(d["_id"]),
+                "fileName": d.get("fileName", "Unknown File"),
+                "date": d.get("date"),
+                "semester": d.get("semester"),
+                "department": d.get("department"),
+                "testType": d.get("testType"),
+                "uploadedAt": d["uploadedAt"].isoformat() if d.get("uploadedAt") else None,
+                "status": d.get("status"),
+                "rows": d.get("rows"),
+                "checksum": d.get("checksum")
             })
+        # Undated manifests (older backfills) sort last and can't be a keyset position
+        if has_more and not docs[-1].get("uploadedAt"):
+            has_more = False
+        next_cursor = encode_cursor(docs[-1]["uploadedAt"], docs[-1]["_id"]) if has_more else None
 
-        return jsonify({"success": True, "files": result}), 200
+        return jsonify({"success": True, "files": result, "next_cursor": next_cursor, "has_more": has_more}), 200
     except Exception as e:
         return jsonify({"success": False, "message": str(e)}), 500
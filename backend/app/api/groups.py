@@ -3,22 +3,68 @@ from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from bson import ObjectId
 from datetime import datetime
+from pymongo.errors import DuplicateKeyError
+from app import socketio
+from app.utils.activity import record_activity
+from app.utils.anon_ids import anon_ids
+from app.utils.engagement import bump_engagement
+from app.utils.group_discovery import rank_groups, activity_increment
+from app.utils.pagination import encode_cursor, decode_cursor, parse_limit, keyset_filter
 
 groups_bp = Blueprint("groups", __name__, url_prefix="/api/groups")
 
 
 # ---------------- UTILS ----------------
+MEMBER_PREVIEW = 50  # anonIds embedded in group details; the rest via /<id>/members
+
+
 def serialize_group(group):
     """Convert MongoDB group doc to JSON-safe dict"""
     group["_id"] = str(group["_id"])
     group.pop("createdBy", None)  # hide creator for anonymity
+    group.pop("members", None)    # legacy roster array (now in group_members)
+    group.pop("activityScore", None)  # forward-decay internal, only meaningful for ranking
     return group
 
 
-def get_anon_id(user_id):
-    """Fetch anonId of user, fallback to 'Anonymous'"""
-    user = current_app.db.users.find_one({"id": user_id})
-    return user.get("anonId", "Anonymous") if user else "Anonymous"
+def member_group_ids(user_id):
+    """Ids (str) of every group `user_id` belongs to, newest membership first."""
+    return [
+        m["groupId"] for m in
+        current_app.db.group_members.find({"userId": user_id}, {"_id": 0, "groupId": 1}).sort("joinedAt", -1)
+    ]
+
+
+def group_room(group_id, user_id):
+    """
+    Socket.IO room of one member's sockets subscribed to a group. Rooms are
+    per member so delivery follows the current roster: a member who leaves
+    over REST stops receiving messages even while their sockets stay joined.
+    """
+    return f"group:{group_id}:{user_id}"
+
+
+def is_member(group_id, user_id):
+    return current_app.db.group_members.count_documents({"groupId": group_id, "userId": user_id}, limit=1) > 0
+
+
+def serialize_group_message(message):
+    """JSON-safe group message (senderId is never exposed)."""
+    m = {k: v for k, v in message.items() if k != "senderId"}
+    m["_id"] = str(m["_id"])
+    if isinstance(m.get("timestamp"), datetime):
+        m["timestamp"] = m["timestamp"].isoformat() + "Z"
+    return m
+
+
+def broadcast_group_message(group_id, message):
+    """Push a stored message once to the subscribed sockets of current members."""
+    rooms = [
+        group_room(group_id, m["userId"]) for m in
+        current_app.db.group_members.find({"groupId": group_id}, {"_id": 0, "userId": 1})
+    ]
+    if rooms:
+        socketio.emit("group_message", serialize_group_message(message), to=rooms)
 
 
 # ---------------- CREATE GROUP ----------------
@@ -43,13 +89,19 @@ def create_group():
             "profilePic": profile_pic,
             "isPrivate": is_private,
             "createdBy": user_id,
-            "members": [user_id],
+            "memberCount": 1,
             "createdAt": datetime.utcnow()
         }
 
         result = current_app.db.groups.insert_one(new_group)
         new_group["_id"] = str(result.inserted_id)
         new_group.pop("createdBy", None)
+        current_app.db.group_members.insert_one({
+            "groupId": new_group["_id"],
+            "userId": user_id,
+            "joinedAt": new_group["createdAt"]
+        })
+        bump_engagement(user_id, "joinedGroups")
 
         # Initial system message
         current_app.db.group_messages.insert_one({
@@ -73,41 +125,44 @@ def create_group():
 def my_groups():
     try:
         user_id = get_jwt_identity()
-        groups = list(current_app.db.groups.find({"members": user_id}))
+        group_ids = [ObjectId(gid) for gid in member_group_ids(user_id)]
+        groups = list(current_app.db.groups.find({"_id": {"$in": group_ids}}, {"members": 0}))
+        order = {gid: i for i, gid in enumerate(group_ids)}
+        groups.sort(key=lambda g: order[g["_id"]])
         return jsonify({"success": True, "groups": [serialize_group(g) for g in groups]}), 200
     except Exception as e:
         current_app.logger.error(f"Error fetching my groups: {e}")
         return jsonify({"success": False, "message": str(e)}), 500
 
 
-# ---------------- SUGGESTED GROUPS ----------------
+# ---------------- DISCOVER / SUGGESTED GROUPS ----------------
+@groups_bp.route("/discover", methods=["GET"])
 @groups_bp.route("/suggestions", methods=["GET"])
 @jwt_required()
 def suggestions():
+    """
+    Groups the user can join, ranked by members, recent activity and how many
+    of their connections are in them.
+    Query params: limit (default 20, max 100), offset (next_offset of the previous page).
+    """
     try:
         user_id = get_jwt_identity()
-
-        # User connections
-        connections_docs = list(current_app.db.connections.find({
-            "$or": [{"user1": user_id}, {"user2": user_id}]
-        }))
-        connections = [doc["user2"] if doc["user1"] == user_id else doc["user1"] for doc in connections_docs]
-
-        # Public groups not joined
-        public_groups = list(current_app.db.groups.find({
-            "isPrivate": False,
-            "members": {"$ne": user_id}
-        }))
-
-        # Private groups by connections
-        private_groups = list(current_app.db.groups.find({
-            "isPrivate": True,
-            "createdBy": {"$in": connections},
-            "members": {"$ne": user_id}
-        }))
-
-        all_groups = public_groups + private_groups
-        return jsonify({"success": True, "groups": [serialize_group(g) for g in all_groups]}), 200
+        limit = parse_limit(request.args, default=20, maximum=100)
+        try:
+            offset = max(0, int(request.args.get("offset", 0)))
+        except ValueError:
+            return jsonify({"success": False, "message": "Invalid offset"}), 400
+
+        ranked = rank_groups(user_id, member_group_ids(user_id))
+        page = ranked[offset:offset + limit]
+        has_more = offset + limit < len(ranked)
+
+        return jsonify({
+            "success": True,
+            "groups": [serialize_group(g) for g in page],
+            "next_offset": offset + limit if has_more else None,
+            "has_more": has_more,
+        }), 200
 
     except Exception as e:
         current_app.logger.error(f"Error fetching suggested groups: {e}")
@@ -120,23 +175,32 @@ def suggestions():
 def join_group(group_id):
     try:
         user_id = get_jwt_identity()
-        group = current_app.db.groups.find_one({"_id": ObjectId(group_id)})
+        group = current_app.db.groups.find_one({"_id": ObjectId(group_id)}, {"_id": 1})
         if not group:
             return jsonify({"success": False, "message": "Group not found"}), 404
 
-        if user_id in group.get("members", []):
+        try:
+            current_app.db.group_members.insert_one({
+                "groupId": group_id,
+                "userId": user_id,
+                "joinedAt": datetime.utcnow()
+            })
+        except DuplicateKeyError:
             return jsonify({"success": False, "message": "Already a member"}), 400
 
-        current_app.db.groups.update_one({"_id": ObjectId(group_id)}, {"$addToSet": {"members": user_id}})
+        current_app.db.groups.update_one({"_id": ObjectId(group_id)}, {"$inc": {"memberCount": 1}})
+        bump_engagement(user_id, "joinedGroups")
 
-        anon_id = get_anon_id(user_id)
-        current_app.db.group_messages.insert_one({
+        anon_id = anon_ids.resolve(user_id)
+        system_message = {
             "groupId": group_id,
             "senderId": None,
             "message": f"🟢 {anon_id} joined the group!",
             "timestamp": datetime.utcnow(),
             "system": True
-        })
+        }
+        current_app.db.group_messages.insert_one(system_message)
+        broadcast_group_message(group_id, system_message)
 
         return jsonify({"success": True, "message": "Joined group successfully"}), 200
 
@@ -151,16 +215,22 @@ def join_group(group_id):
 def leave_group(group_id):
     try:
         user_id = get_jwt_identity()
-        current_app.db.groups.update_one({"_id": ObjectId(group_id)}, {"$pull": {"members": user_id}})
-
-        anon_id = get_anon_id(user_id)
-        current_app.db.group_messages.insert_one({
+        removed = current_app.db.group_members.delete_one({"groupId": group_id, "userId": user_id})
+        if removed.deleted_count == 0:
+            return jsonify({"success": False, "message": "Not a member"}), 400
+        current_app.db.groups.update_one({"_id": ObjectId(group_id)}, {"$inc": {"memberCount": -1}})
+        bump_engagement(user_id, "joinedGroups", -1)
+
+        anon_id = anon_ids.resolve(user_id)
+        system_message = {
             "groupId": group_id,
             "senderId": None,
             "message": f"⚪ {anon_id} left the group",
             "timestamp": datetime.utcnow(),
             "system": True
-        })
+        }
+        current_app.db.group_messages.insert_one(system_message)
+        broadcast_group_message(group_id, system_message)
 
         return jsonify({"success": True, "message": "Left group successfully"}), 200
 
@@ -173,13 +243,58 @@ def leave_group(group_id):
 @groups_bp.route("/<group_id>/messages", methods=["GET"])
 @jwt_required()
 def get_messages(group_id):
+    """
+    Without cursors: the latest `limit` messages (default 100, max 200).
+    With `before=<next_cursor>`: the page of messages older than it, for scrolling back.
+    With `since=<cursor>`: messages newer than the cursor, for catch-up after a
+    reconnect; repeat with `cursor` while `has_more` is true.
+    Messages are always returned oldest -> newest; `cursor` marks the newest one.
+    On latest/`before` pages, `has_more` means older messages exist and
+    `next_cursor` (the oldest message) fetches them.
+    """
     try:
-        messages = list(current_app.db.group_messages.find({"groupId": group_id}).sort("timestamp", 1))
+        limit = parse_limit(request.args, default=100, maximum=200)
+        query = {"groupId": group_id}
+        since = request.args.get("since")
+        before = request.args.get("before")
+        if since and before:
+            return jsonify({"success": False, "message": "Use either 'since' or 'before', not both"}), 400
+        if since or before:
+            try:
+                query.update(keyset_filter(decode_cursor(since or before), 1 if since else -1))
+            except ValueError as e:
+                return jsonify({"success": False, "message": str(e)}), 400
+        direction = 1 if since else -1
+
+        messages = list(
+            current_app.db.group_messages.find(query)
+            .sort([("timestamp", direction), ("_id", direction)])
+            .limit(limit + 1)
+        )
+        has_more = len(messages) > limit
+        messages = messages[:limit]
+        next_cursor = None
+        if direction < 0:
+            if has_more:
+                next_cursor = encode_cursor(messages[-1]["timestamp"], messages[-1]["_id"])
+            messages.reverse()
+
+        cursor = encode_cursor(messages[-1]["timestamp"], messages[-1]["_id"]) if messages else since
+        senders = anon_ids.resolve_many(
+            m["senderId"] for m in messages if not m.get("system") and m.get("senderId")
+        )
+        result = []
         for m in messages:
-            m["_id"] = str(m["_id"])
             if not m.get("system") and m.get("senderId"):
-                m["anonId"] = get_anon_id(m["senderId"])
-        return jsonify({"success": True, "messages": messages}), 200
+                m["anonId"] = senders[m["senderId"]]
+            result.append(serialize_group_message(m))
+        return jsonify({
+            "success": True,
+            "messages": result,
+            "cursor": cursor,
+            "next_cursor": next_cursor,
+            "has_more": has_more
+        }), 200
 
     except Exception as e:
         current_app.logger.error(f"Error fetching group messages: {e}")
@@ -206,11 +321,19 @@ def send_message(group_id):
             "system": False
         }
 
-        result = current_app.db.group_messages.insert_one(message)
-        message["_id"] = str(result.inserted_id)
-        message.pop("senderId", None)
+        current_app.db.group_messages.insert_one(message)
+        # Forward-decayed activity for discovery ranking (see utils/group_discovery)
+        current_app.db.groups.update_one(
+            {"_id": ObjectId(group_id)},
+            {"$inc": {"activityScore": activity_increment(message["timestamp"])},
+             "$set": {"lastActivityAt": message["timestamp"]}}
+        )
+        record_activity(user_id, "groupMessages", message["timestamp"])
+        bump_engagement(user_id, "groupMessages")
+        message["anonId"] = anon_ids.resolve(user_id)
+        broadcast_group_message(group_id, message)
 
-        return jsonify({"success": True, "message": message}), 201
+        return jsonify({"success": True, "message": serialize_group_message(message)}), 201
 
     except Exception as e:
         current_app.logger.error(f"Error sending group message: {e}")
@@ -222,13 +345,19 @@ def send_message(group_id):
 @jwt_required()
 def get_group_details(group_id):
     try:
-        group = current_app.db.groups.find_one({"_id": ObjectId(group_id)})
+        group = current_app.db.groups.find_one({"_id": ObjectId(group_id)}, {"members": 0})
         if not group:
             return jsonify({"success": False, "message": "Group not found"}), 404
 
-        members_anon = [get_anon_id(uid) for uid in group.get("members", [])]
-        group["_id"] = str(group["_id"])
-        group.pop("createdBy", None)
+        # Only the first page of the roster; /<group_id>/members pages through the rest
+        members = [
+            m["userId"] for m in
+            current_app.db.group_members.find({"groupId": group_id}, {"_id": 0, "userId": 1})
+            .sort("joinedAt", 1).limit(MEMBER_PREVIEW)
+        ]
+        resolved = anon_ids.resolve_many(members)
+        members_anon = [resolved[uid] for uid in members]
+        group = serialize_group(group)
         group["membersAnonIds"] = members_anon
 
         return jsonify({"success": True, "group": group}), 200
@@ -236,3 +365,39 @@ def get_group_details(group_id):
     except Exception as e:
         current_app.logger.error(f"Error fetching group details: {e}")
         return jsonify({"success": False, "message": str(e)}), 500
+
+
+# ---------------- LIST GROUP MEMBERS ----------------
+@groups_bp.route("/<group_id>/members", methods=["GET"])
+@jwt_required()
+def list_members(group_id):
+    """Members in join order. Query params: limit (default 50, max 200), after (cursor)."""
+    try:
+        limit = parse_limit(request.args, default=50, maximum=200)
+        query = {"groupId": group_id}
+        after = request.args.get("after")
+        if after:
+            try:
+                query.update(keyset_filter(decode_cursor(after), 1, field="joinedAt"))
+            except ValueError as e:
+                return jsonify({"success": False, "message": str(e)}), 400
+
+        rows = list(
+            current_app.db.group_members.find(query, {"userId": 1, "joinedAt": 1})
+            .sort([("joinedAt", 1), ("_id", 1)])
+            .limit(limit + 1)
+        )
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        resolved = anon_ids.resolve_many(r["userId"] for r in rows)
+        members = [
+            {"anonId": resolved[r["userId"]], "joinedAt": r["joinedAt"].isoformat() + "Z"}
+            for r in rows
+        ]
+        next_cursor = encode_cursor(rows[-1]["joinedAt"], rows[-1]["_id"]) if has_more else None
+
+        return jsonify({"success": True, "members": members, "next_cursor": next_cursor, "has_more": has_more}), 200
+
+    except Exception as e:
+        current_app.logger.error(f"Error listing group members: {e}")
+        return jsonify({"success": False, "message": str(e)}), 500
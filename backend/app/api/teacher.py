@@ -1,5 +1,6 @@
 from flask import Blueprint, jsonify, request, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from app.utils.anon_ids import anon_ids
 
 teacher_profile_bp = Blueprint("teacher_profile", __name__, url_prefix="/api/teacher")
 
@@ -64,6 +65,9 @@ def update_teacher_profile():
         if result.modified_count == 0:
             return jsonify({"success": False, "message": "No changes made"}), 200
 
+        if "anonId" in safe_fields:
+            anon_ids.invalidate(user_id)
+
         teacher = find_user_by_id(user_id)
         return jsonify({"success": True, "message": "Profile updated successfully", "user": teacher}), 200
 
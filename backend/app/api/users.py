@@ -2,6 +2,8 @@ from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 import uuid
 from datetime import datetime
+from app.utils.conversations import conversation_key
+from app.utils.connection_cache import connection_cache
 
 users_bp = Blueprint("users", __name__, url_prefix="/api/users")
 
@@ -99,11 +101,13 @@ def accept_request():
             "_id": str(uuid.uuid4()),
             "from_id": req["from_id"],
             "to_id": req["to_id"],
+            "conversation_id": conversation_key(req["from_id"], req["to_id"]),
             "status": "accepted",
             "created_at": datetime.utcnow()
         }
 
         current_app.db.connections.insert_one(connection_data)
+        connection_cache.invalidate(req["from_id"], req["to_id"])
 
         return jsonify({"success": True, "message": "Request accepted and connection added"}), 200
 
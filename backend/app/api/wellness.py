@@ -1,14 +1,34 @@
 # app/api/wellness.py
 from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from datetime import datetime
-from app.models import messages_col, wellness_moods_col, users_col, groups_col, community_col
+from bson import ObjectId
+from bson.errors import InvalidId
+from datetime import date, datetime
 from pymongo.errors import PyMongoError
+from app.models import risk_alerts_col
+from app.utils.activity import record_activity, activity_summary
+from app.utils.moods import (
+    GRANULARITIES, DEFAULT_RANGE, MAX_RANGE, valid_mood, record_mood, recent_moods, mood_series,
+)
+from app.utils.mood_risk import track_mood, serialize_alert
+from app.utils.pagination import encode_cursor, decode_cursor, parse_limit, keyset_filter
+from app.utils.cohorts import DIMENSIONS, MIN_COHORT_SIZE, cohort_report, rollup_computed_at
+from app.utils.engagement import get_engagement_doc, correlation_impacts, REFRESH_AFTER as ENGAGEMENT_REFRESH_AFTER
 
 wellness_bp = Blueprint("wellness", __name__, url_prefix="/api/wellness")
 
+COHORT_ROLES = ("teacher", "counselor")
+ALERT_ROLES = COHORT_ROLES  # teachers are the staff accounts registration creates
+ALERT_STATUSES = ("open", "acknowledged")
+
 
 # ---------------- HELPER FUNCTIONS ----------------
+def has_role(user_id, roles):
+    """Whether the user exists and has one of `roles`."""
+    user = current_app.db.users.find_one({"id": user_id}, {"role": 1})
+    return bool(user) and user.get("role") in roles
+
+
 def calculate_peer_sessions(user_id):
     """Count how many unique peers a student has connections with."""
     try:
@@ -40,21 +60,18 @@ def calculate_peer_contributions(user_id):
 def save_mood():
     try:
         user_id = get_jwt_identity()
-        data = request.get_json()
+        data = request.get_json() or {}
         mood = data.get("mood")
 
         if not mood:
             return jsonify({"success": False, "message": "Mood is required"}), 400
 
-        record = {
-            "userId": user_id,
-            "mood": mood,
-            "date": datetime.utcnow().strftime("%Y-%m-%d"),
-            "time": datetime.utcnow().strftime("%H:%M:%S"),
-            "createdAt": datetime.utcnow(),
-        }
+        if not valid_mood(mood):
+            return jsonify({"success": False, "message": "Invalid mood"}), 400
 
-        wellness_moods_col.insert_one(record)
+        entry = record_mood(user_id, mood)
+        record_activity(user_id, "moods", entry["at"])
+        track_mood(user_id, mood, entry["at"])
         return jsonify({"success": True, "message": "Mood saved successfully"}), 201
     except PyMongoError as e:
         current_app.logger.error(f"Error saving mood: {e}")
@@ -69,15 +86,14 @@ def save_mood():
 def get_mood_history():
     try:
         user_id = get_jwt_identity()
-        moods = wellness_moods_col.find({"userId": user_id}).sort("createdAt", -1).limit(30)
         history = [
             {
-                "_id": str(m["_id"]),
+                "_id": str(m["id"]),
                 "mood": m.get("mood"),
-                "date": m.get("date"),
-                "time": m.get("time"),
+                "date": m["at"].strftime("%Y-%m-%d"),
+                "time": m["at"].strftime("%H:%M:%S"),
             }
-            for m in moods
+            for m in recent_moods(user_id, limit=30)
         ]
         return jsonify({"success": True, "history": history}), 200
     except PyMongoError as e:
@@ -86,35 +102,60 @@ def get_mood_history():
 
 
 # ------------------------------------------------------------
-# 3️⃣ DASHBOARD SUMMARY
+# 2️⃣b MOOD SERIES (downsampled)
 # ------------------------------------------------------------
-@wellness_bp.route("/summary", methods=["GET"])
+@wellness_bp.route("/history/series", methods=["GET"])
 @jwt_required()
-def wellness_summary():
+def get_mood_series():
+    """
+    Mood counts per day/week/month with the dominant mood of each period.
+    Query params: granularity (day | week | month, default day),
+    from / to (YYYY-MM-DD, inclusive; default: a range suited to the granularity ending today).
+    """
     try:
         user_id = get_jwt_identity()
+        granularity = request.args.get("granularity", "day")
+        if granularity not in GRANULARITIES:
+            return jsonify({"success": False, "message": f"granularity must be one of: {', '.join(GRANULARITIES)}"}), 400
 
-        messages = list(messages_col.find({"sender_id": user_id}, {"_id": 0, "timestamp": 1}))
-        if not messages:
-            return jsonify({
-                "success": True,
-                "peerSessions": 0,
-                "peerContributions": 0,
-                "wellnessStreak": 0
-            }), 200
+        try:
+            end = date.fromisoformat(request.args["to"]) if request.args.get("to") else datetime.utcnow().date()
+            start = (
+                date.fromisoformat(request.args["from"]) if request.args.get("from")
+                else end - DEFAULT_RANGE[granularity]
+            )
+        except ValueError:
+            return jsonify({"success": False, "message": "from/to must be YYYY-MM-DD"}), 400
+        if start > end or end - start > MAX_RANGE:
+            return jsonify({"success": False, "message": "Invalid date range"}), 400
+
+        series = mood_series(user_id, start, end, granularity)
+        return jsonify({
+            "success": True,
+            "granularity": granularity,
+            "from": start.isoformat(),
+            "to": end.isoformat(),
+            "series": series
+        }), 200
+    except PyMongoError as e:
+        current_app.logger.error(f"Error fetching mood series: {e}")
+        return jsonify({"success": False, "message": "Database error"}), 500
 
-        dates = sorted({msg["timestamp"].date() for msg in messages}, reverse=True)
 
-        streak = 1
-        for i in range(1, len(dates)):
-            delta = (dates[i-1] - dates[i]).days
-            if delta == 1:
-                streak += 1
-            else:
-                break
+# ------------------------------------------------------------
+# 3️⃣ DASHBOARD SUMMARY
+# ------------------------------------------------------------
+@wellness_bp.route("/summary", methods=["GET"])
+@jwt_required()
+def wellness_summary():
+    try:
+        user_id = get_jwt_identity()
 
-        peer_sessions = len(dates)
-        peer_contributions = len(messages)
+        # Served from the daily rollups: a handful of small docs per user
+        messages = activity_summary(user_id, "messages")
+        peer_sessions = messages["days"]
+        peer_contributions = messages["total"]
+        streak = messages["streak"]
 
         return jsonify({
             "success": True,
@@ -136,44 +177,137 @@ def get_correlation():
     try:
         user_id = get_jwt_identity()
 
-        total_groups = groups_col.count_documents({})
-        joined_groups = groups_col.count_documents({"members": {"$in": [user_id]}})
-        messages_sent = messages_col.count_documents({"sender_id": user_id, "type": "group"})
+        # Precomputed per-user counters, kept current by the write paths
+        doc = get_engagement_doc(user_id)
+        correlation = correlation_impacts(doc)
+        computed_at = doc["computedAt"]
 
-        study_group_activity = min(100, ((joined_groups + messages_sent) / max(total_groups, 1)) * 50)
+        return jsonify({
+            "success": True,
+            "correlation": correlation,
+            "computedAt": computed_at.isoformat() + "Z",
+            "stale": datetime.utcnow() - computed_at > ENGAGEMENT_REFRESH_AFTER
+        }), 200
+    except PyMongoError as e:
+        current_app.logger.error(f"Error fetching correlation analytics: {e}")
+        return jsonify({"success": False, "message": "Database error"}), 500
 
-        badges_given = list(
-            users_col.aggregate([
-                {"$unwind": "$peerBadges"},
-                {"$match": {"peerBadges.givenBy": user_id}}
-            ])
-        )
-        peer_help_given = min(100, len(badges_given) * 10)
-
-        posts = community_col.find({"userId": user_id})
-        total_posts, total_answers = 0, 0
-        for p in posts:
-            total_posts += 1
-            total_answers += len(p.get("answers", []))
-        answers_received = min(100, (total_answers / total_posts) * 100) if total_posts else 0
-
-        total_private_msgs = messages_col.count_documents({"sender_id": user_id, "type": "private"})
-        msgs_to_connections = messages_col.count_documents(
-            {"sender_id": user_id, "type": "private", "isConnection": True}
-        )
-        anonymous_discussions = (
-            min(100, (msgs_to_connections / total_private_msgs) * 100)
-            if total_private_msgs else 0
-        )
 
-        correlation = [
-            {"activity": "Study Group Activity", "impact": round(study_group_activity, 2)},
-            {"activity": "Peer Help Given", "impact": round(peer_help_given, 2)},
-            {"activity": "Answers Received", "impact": round(answers_received, 2)},
-            {"activity": "Anonymous Discussions", "impact": round(anonymous_discussions, 2)},
-        ]
+# ------------------------------------------------------------
+# 5️⃣ COHORT DASHBOARD (teachers / counselors)
+# ------------------------------------------------------------
+@wellness_bp.route("/cohorts", methods=["GET"])
+@jwt_required()
+def get_cohort_wellness():
+    """
+    Anonymized mood distribution and trend per cohort, from the daily cohort rollups.
+    Query params: dimension (university | department | year | field, default department),
+    granularity (day | week | month, default week), from / to (YYYY-MM-DD).
+    Cohorts and periods with fewer than MIN_COHORT_SIZE students are suppressed.
+    """
+    try:
+        if not has_role(get_jwt_identity(), COHORT_ROLES):
+            return jsonify({"success": False, "message": "Only teachers and counselors can view cohort data"}), 403
+
+        dimension = request.args.get("dimension", "department")
+        granularity = request.args.get("granularity", "week")
+        if dimension not in DIMENSIONS:
+            return jsonify({"success": False, "message": f"dimension must be one of: {', '.join(DIMENSIONS)}"}), 400
+        if granularity not in GRANULARITIES:
+            return jsonify({"success": False, "message": f"granularity must be one of: {', '.join(GRANULARITIES)}"}), 400
+
+        try:
+            end = date.fromisoformat(request.args["to"]) if request.args.get("to") else datetime.utcnow().date()
+            start = (
+                date.fromisoformat(request.args["from"]) if request.args.get("from")
+                else end - DEFAULT_RANGE[granularity]
+            )
+        except ValueError:
+            return jsonify({"success": False, "message": "from/to must be YYYY-MM-DD"}), 400
+        if start > end or end - start > MAX_RANGE:
+            return jsonify({"success": False, "message": "Invalid date range"}), 400
 
-        return jsonify({"success": True, "correlation": correlation}), 200
+        cohorts, suppressed = cohort_report(dimension, start, end, granularity)
+        computed_at = rollup_computed_at()
+        return jsonify({
+            "success": True,
+            "dimension": dimension,
+            "granularity": granularity,
+            "from": start.isoformat(),
+            "to": end.isoformat(),
+            "minCohortSize": MIN_COHORT_SIZE,
+            "cohorts": cohorts,
+            "suppressedCohorts": suppressed,
+            "computedAt": computed_at.isoformat() + "Z" if computed_at else None
+        }), 200
     except PyMongoError as e:
-        current_app.logger.error(f"Error fetching correlation analytics: {e}")
+        current_app.logger.error(f"Error fetching cohort wellness: {e}")
+        return jsonify({"success": False, "message": "Database error"}), 500
+
+
+# ------------------------------------------------------------
+# 6️⃣ AT-RISK ALERTS (teachers / counselors)
+# ------------------------------------------------------------
+@wellness_bp.route("/risk_alerts", methods=["GET"])
+@jwt_required()
+def list_risk_alerts():
+    """
+    At-risk alerts raised on the mood path, newest first.
+    Query params: status (open | acknowledged, default open),
+    limit (default 50, max 200), before (next_cursor of the previous page).
+    """
+    try:
+        if not has_role(get_jwt_identity(), ALERT_ROLES):
+            return jsonify({"success": False, "message": "Only teachers and counselors can view risk alerts"}), 403
+
+        status = request.args.get("status", "open")
+        if status not in ALERT_STATUSES:
+            return jsonify({"success": False, "message": f"status must be one of: {', '.join(ALERT_STATUSES)}"}), 400
+        limit = parse_limit(request.args, default=50, maximum=200)
+        query = {"status": status}
+        before = request.args.get("before")
+        if before:
+            try:
+                query.update(keyset_filter(decode_cursor(before), -1, field="createdAt"))
+            except ValueError as e:
+                return jsonify({"success": False, "message": str(e)}), 400
+
+        docs = list(risk_alerts_col.find(query).sort([("createdAt", -1), ("_id", -1)]).limit(limit + 1))
+        has_more = len(docs) > limit
+        docs = docs[:limit]
+
+        user_ids = list({d.get("userId") for d in docs})
+        names = {u["id"]: u.get("name") for u in current_app.db.users.find({"id": {"$in": user_ids}}, {"id": 1, "name": 1})}
+
+        return jsonify({
+            "success": True,
+            "alerts": [serialize_alert(d, names) for d in docs],
+            "next_cursor": encode_cursor(docs[-1]["createdAt"], docs[-1]["_id"]) if has_more else None
+        }), 200
+    except PyMongoError as e:
+        current_app.logger.error(f"Error fetching risk alerts: {e}")
+        return jsonify({"success": False, "message": "Database error"}), 500
+
+
+@wellness_bp.route("/risk_alerts/<alert_id>/acknowledge", methods=["POST"])
+@jwt_required()
+def acknowledge_risk_alert(alert_id):
+    try:
+        staff_id = get_jwt_identity()
+        if not has_role(staff_id, ALERT_ROLES):
+            return jsonify({"success": False, "message": "Only teachers and counselors can acknowledge risk alerts"}), 403
+        try:
+            oid = ObjectId(alert_id)
+        except (InvalidId, TypeError):
+            return jsonify({"success": False, "message": "Invalid alert id"}), 400
+
+        result = risk_alerts_col.update_one(
+            {"_id": oid, "status": "open"},
+            {"$set": {"status": "acknowledged", "acknowledgedBy": staff_id, "acknowledgedAt": datetime.utcnow()}}
+        )
+        if not result.matched_count:
+            return jsonify({"success": False, "message": "Alert not found or already acknowledged"}), 404
+        return jsonify({"success": True, "message": "Alert acknowledged"}), 200
+    except PyMongoError as e:
+        current_app.logger.error(f"Error acknowledging risk alert: {e}")
         return jsonify({"success": False, "message": "Database error"}), 500
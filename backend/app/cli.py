@@ -0,0 +1,481 @@
+# backend/app/cli.py
+"""
+Maintenance commands, run with the Flask CLI from backend/:
+    flask --app run <command> [options]
+"""
+from datetime import datetime
+
+import click
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+
+from app.models import (
+    messages_col, connections_col, conversations_col, users_col, groups_col, group_members_col, grades_col,
+    grade_uploads_col, grade_stats_col, group_messages_col, wellness_moods_col, mood_days_col, community_col,
+    activity_daily_col, mood_risk_col, risk_alerts_col, ensure_indexes, GRADE_KEY_INDEX,
+)
+from app.utils.conversations import conversation_key, PREVIEW_LENGTH
+from app.utils.suggestions import refresh_suggestions
+from app.utils.moods import valid_mood, MAX_ENTRIES_PER_DAY
+from app.utils.cohorts import refresh_cohort_rollups
+from app.utils.mood_risk import MOOD_SCORES, update_state, alert_doc
+
+
+def _pair(doc):
+    """Return the two user ids of a message/connection doc, whichever schema it uses."""
+    for a, b in (("sender_id", "receiver_id"), ("user1", "user2"), ("from_id", "to_id")):
+        if doc.get(a) and doc.get(b):
+            return doc[a], doc[b]
+    return None
+
+
+# _id types found in the wild (connections mix uuid strings and ObjectIds)
+ID_TYPES = ("objectId", "string", "number")
+
+
+def _backfill_conversation_ids(col, fields, batch_size):
+    """
+    Stamp conversation_id on every doc of `col` that lacks it, in _id order.
+    Only docs still missing the field are selected, so an interrupted run
+    resumes where it stopped when re-invoked.
+
+    `$gt` only compares _ids of the same BSON type, so each _id type is
+    paged separately; a mixed collection would otherwise stop at the first
+    batch that ends on a different type.
+    """
+    projection = {f: 1 for f in fields}
+    query = {"conversation_id": {"$exists": False}}
+    updated, skipped = 0, 0
+
+    for id_type in ID_TYPES:
+        last_id = None
+        while True:
+            id_filter = {"$type": id_type}
+            if last_id is not None:
+                id_filter["$gt"] = last_id
+            batch = list(col.find({**query, "_id": id_filter}, projection).sort("_id", 1).limit(batch_size))
+            if not batch:
+                break
+
+            ops = []
+            for doc in batch:
+                pair = _pair(doc)
+                if not pair:
+                    skipped += 1
+                    continue
+                update = {"conversation_id": conversation_key(*pair)}
+                # Older socket writes stored ISO strings; normalise so sorting is consistent
+                ts = doc.get("timestamp")
+                if isinstance(ts, str):
+                    try:
+                        update["timestamp"] = datetime.fromisoformat(ts)
+                    except ValueError:
+                        pass
+                ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": update}))
+
+            if ops:
+                updated += col.bulk_write(ops, ordered=False).modified_count
+            last_id = batch[-1]["_id"]
+            click.echo(f"  {col.name}: {updated} updated, {skipped} skipped (last _id {last_id})")
+
+    # Anything left has an _id of another type: report it rather than claim success
+    other = col.count_documents({"$and": [query] + [{"_id": {"$not": {"$type": t}}} for t in ID_TYPES]})
+    if other:
+        click.echo(f"  {col.name}: {other} doc(s) with unsupported _id types left without conversation_id")
+    return updated, skipped + other
+
+
+@click.command("backfill-conversations")
+@click.option("--batch-size", default=1000, show_default=True, help="Documents per bulk write.")
+def backfill_conversations_command(batch_size):
+    """Add canonical conversation_id to existing messages and connections."""
+    try:
+        for col, fields in (
+            (connections_col, ["user1", "user2", "from_id", "to_id"]),
+            (messages_col, ["sender_id", "receiver_id", "timestamp"]),
+        ):
+            updated, skipped = _backfill_conversation_ids(col, fields, batch_size)
+            click.echo(f"✅ {col.name}: {updated} updated, {skipped} skipped (no user pair or unsupported _id)")
+    except PyMongoError as e:
+        raise click.ClickException(f"Backfill interrupted (safe to re-run): {e}")
+
+
+@click.command("rebuild-inbox")
+@click.option("--batch-size", default=500, show_default=True, help="Summaries per bulk write.")
+def rebuild_inbox_command(batch_size):
+    """Seed conversation summaries (last message) from existing history. Run after backfill-conversations."""
+    pipeline = [
+        {"$match": {"conversation_id": {"$exists": True}}},
+        {"$sort": {"conversation_id": 1, "timestamp": 1}},
+        {"$group": {
+            "_id": "$conversation_id",
+            "id": {"$last": "$_id"},
+            "sender_id": {"$last": "$sender_id"},
+            "receiver_id": {"$last": "$receiver_id"},
+            "text": {"$last": "$text"},
+            "timestamp": {"$last": "$timestamp"},
+        }},
+    ]
+    try:
+        ops, written = [], 0
+        for row in messages_col.aggregate(pipeline, allowDiskUse=True):
+            # Unread counters only track messages sent from now on
+            ops.append(UpdateOne({"_id": row["_id"]}, {
+                "$set": {
+                    "last_message": {
+                        "id": str(row["id"]),
+                        "sender_id": row["sender_id"],
+                        "text": (row.get("text") or "")[:PREVIEW_LENGTH],
+                        "timestamp": row["timestamp"],
+                    },
+                    "last_timestamp": row["timestamp"],
+                },
+                "$setOnInsert": {"participants": sorted([row["sender_id"], row["receiver_id"]])},
+            }, upsert=True))
+            if len(ops) >= batch_size:
+                written += conversations_col.bulk_write(ops, ordered=False).upserted_count
+                ops = []
+        if ops:
+            written += conversations_col.bulk_write(ops, ordered=False).upserted_count
+        click.echo(f"✅ conversations: {written} summaries created")
+    except PyMongoError as e:
+        raise click.ClickException(f"Inbox rebuild failed: {e}")
+
+
+@click.command("refresh-suggestions")
+@click.option("--user", "user_id", default=None, help="Only this user id (default: every user).")
+def refresh_suggestions_command(user_id):
+    """Precompute "people you may know" lists."""
+    try:
+        ids = [user_id] if user_id else (u["id"] for u in users_col.find({"id": {"$exists": True}}, {"id": 1}))
+        count = 0
+        for uid in ids:
+            refresh_suggestions(uid)
+            count += 1
+        click.echo(f"✅ suggestions refreshed for {count} user(s)")
+    except PyMongoError as e:
+        raise click.ClickException(f"Suggestion refresh failed: {e}")
+
+
+@click.command("migrate-group-members")
+@click.option("--batch-size", default=1000, show_default=True, help="Memberships per bulk write.")
+def migrate_group_members_command(batch_size):
+    """Move embedded group `members` arrays into group_members and set memberCount."""
+    try:
+        migrated = 0
+        # Groups are only unset once fully copied, so re-running resumes
+        for group in groups_col.find({"members": {"$exists": True}}, {"members": 1, "createdAt": 1}):
+            group_id = str(group["_id"])
+            joined_at = group.get("createdAt") or group["_id"].generation_time.replace(tzinfo=None)
+            members = [m for m in dict.fromkeys(group.get("members") or []) if m]
+            for i in range(0, len(members), batch_size):
+                group_members_col.bulk_write([
+                    UpdateOne(
+                        {"groupId": group_id, "userId": uid},
+                        {"$setOnInsert": {"joinedAt": joined_at}},
+                        upsert=True,
+                    ) for uid in members[i:i + batch_size]
+                ], ordered=False)
+            count = group_members_col.count_documents({"groupId": group_id})
+            groups_col.update_one({"_id": group["_id"]}, {"$set": {"memberCount": count}, "$unset": {"members": ""}})
+            migrated += 1
+        click.echo(f"✅ group_members: {migrated} group(s) migrated")
+    except PyMongoError as e:
+        raise click.ClickException(f"Migration interrupted (safe to re-run): {e}")
+
+
+@click.command("ensure-indexes")
+def ensure_indexes_command():
+    """Create every index; exits non-zero if a unique index could not be created."""
+    missing = ensure_indexes()
+    if missing:
+        raise click.ClickException(f"Unique index(es) missing: {', '.join(missing)} (fixes printed above)")
+    click.echo("✅ All indexes in place")
+
+
+@click.command("dedupe-group-members")
+def dedupe_group_members_command():
+    """Keep the earliest membership per (groupId, userId), fix memberCount, then add the unique index."""
+    try:
+        groups = group_members_col.aggregate([
+            {"$sort": {"joinedAt": 1, "_id": 1}},
+            {"$group": {"_id": {"groupId": "$groupId", "userId": "$userId"}, "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+            {"$match": {"count": {"$gt": 1}}},
+        ], allowDiskUse=True)
+        stale, affected = [], set()
+        for g in groups:
+            stale.extend(g["ids"][1:])  # earliest first: keep ids[0]
+            affected.add(g["_id"]["groupId"])
+        removed = 0
+        for i in range(0, len(stale), 1000):
+            removed += group_members_col.delete_many({"_id": {"$in": stale[i:i + 1000]}}).deleted_count
+        for group_id in affected:
+            try:
+                oid = ObjectId(group_id)
+            except InvalidId:
+                continue
+            groups_col.update_one({"_id": oid}, {"$set": {"memberCount": group_members_col.count_documents({"groupId": group_id})}})
+        click.echo(f"🧹 group_members: removed {removed} duplicate(s) across {len(affected)} group(s)")
+    except PyMongoError as e:
+        raise click.ClickException(f"Dedupe interrupted (safe to re-run): {e}")
+    if "group_member" in ensure_indexes():
+        raise click.ClickException("Unique index 'group_member' still missing (see above)")
+
+
+@click.command("dedupe-grades")
+@click.option("--dry-run", is_flag=True, help="Only count the duplicate grades.")
+def dedupe_grades_command(dry_run):
+    """Keep the latest grade per (regNumber, subject, semester, testType, date), then add the unique index."""
+    try:
+        key = {k: f"${k}" for k in ("regNumber", "subject", "semester", "testType", "date")}
+        groups = grades_col.aggregate([
+            {"$sort": {"uploadedAt": -1, "_id": -1}},
+            {"$group": {"_id": key, "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+            {"$match": {"count": {"$gt": 1}}},
+        ], allowDiskUse=True)
+
+        stale, removed, duplicated = [], 0, 0
+        for g in groups:
+            duplicated += 1
+            stale.extend(g["ids"][1:])  # newest first: keep ids[0]
+            if len(stale) >= 1000 and not dry_run:
+                removed += grades_col.delete_many({"_id": {"$in": stale}}).deleted_count
+                stale = []
+        if dry_run:
+            click.echo(f"{duplicated} grade(s) have duplicates, {len(stale)} extra copies would be removed")
+            return
+        if stale:
+            removed += grades_col.delete_many({"_id": {"$in": stale}}).deleted_count
+        if removed:
+            grade_stats_col.delete_many({})
+        click.echo(f"🧹 grades: removed {removed} duplicate(s) across {duplicated} grade(s)")
+        missing = ensure_indexes()
+    except PyMongoError as e:
+        raise click.ClickException(f"Dedupe interrupted (safe to re-run): {e}")
+    if GRADE_KEY_INDEX in missing:
+        raise click.ClickException(f"Unique index '{GRADE_KEY_INDEX}' still missing (see above)")
+
+
+@click.command("backfill-upload-manifests")
+def backfill_upload_manifests_command():
+    """Create grade_uploads manifests for uploads made before manifests existed."""
+    try:
+        fields = ("teacherId", "fileName", "date", "semester", "department", "testType")
+        # Only dated grades that predate the first real manifest: later uploads already
+        # have one, and an undated upload would get a manifest that can't be paged past
+        match = {"teacherId": {"$exists": True}, "uploadedAt": {"$type": "date"}}
+        first = grade_uploads_col.find_one(
+            {"backfilled": {"$ne": True}, "uploadedAt": {"$ne": None}}, {"uploadedAt": 1}, sort=[("uploadedAt", 1)]
+        )
+        if first:
+            match["uploadedAt"]["$lt"] = first["uploadedAt"]
+        uploads = grades_col.aggregate([
+            {"$match": match},
+            {"$group": {
+                "_id": {f: f"${f}" for f in fields},
+                "uploadedAt": {"$max": "$uploadedAt"},
+                "rows": {"$sum": 1},
+            }},
+        ], allowDiskUse=True)
+
+        # Keyed on the upload metadata + backfilled flag, so re-running is a no-op
+        ops = [
+            UpdateOne(
+                {**u["_id"], "backfilled": True},
+                {"$setOnInsert": {
+                    "uploadedAt": u["uploadedAt"],
+                    "checksum": None,
+                    "sizeBytes": None,
+                    "status": "done",
+                    "rows": {"total": u["rows"], "inserted": u["rows"], "updated": 0, "unchanged": 0, "rejected": 0},
+                }},
+                upsert=True,
+            )
+            for u in uploads
+        ]
+        created = 0
+        for i in range(0, len(ops), 1000):
+            created += grade_uploads_col.bulk_write(ops[i:i + 1000], ordered=False).upserted_count
+        # Undated manifests left by earlier runs of this command
+        removed = grade_uploads_col.delete_many({"backfilled": True, "uploadedAt": None}).deleted_count
+        click.echo(f"✅ grade_uploads: {created} manifest(s) backfilled from {len(ops)} upload(s)"
+                   + (f", {removed} undated one(s) removed" if removed else ""))
+    except PyMongoError as e:
+        raise click.ClickException(f"Backfill interrupted (safe to re-run): {e}")
+
+
+@click.command("migrate-moods")
+@click.option("--batch-size", default=500, show_default=True, help="Day buckets per bulk write.")
+def migrate_moods_command(batch_size):
+    """Fold legacy one-doc-per-mood records into per-day mood buckets."""
+    ensure_indexes()
+    pipeline = [
+        {"$match": {"userId": {"$nin": [None, ""]}, "mood": {"$type": "string"}, "createdAt": {"$type": "date"}}},
+        {"$sort": {"createdAt": 1}},
+        {"$group": {
+            "_id": {
+                "userId": "$userId",
+                "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$createdAt"}},
+            },
+            "entries": {"$push": {"id": "$_id", "mood": "$mood", "at": "$createdAt"}},
+        }},
+    ]
+    try:
+        # $set the whole bucket so re-running converges instead of double counting
+        ops, buckets = [], 0
+        for row in wellness_moods_col.aggregate(pipeline, allowDiskUse=True):
+            entries = [e for e in row["entries"] if valid_mood(e["mood"])]
+            if not entries:
+                continue
+            counts = {}
+            for e in entries:
+                counts[e["mood"]] = counts.get(e["mood"], 0) + 1
+            ops.append(UpdateOne(
+                {"userId": row["_id"]["userId"], "day": row["_id"]["day"]},
+                {"$set": {"entries": entries[-MAX_ENTRIES_PER_DAY:], "counts": counts, "total": len(entries)}},
+                upsert=True,
+            ))
+            if len(ops) >= batch_size:
+                mood_days_col.bulk_write(ops, ordered=False)
+                buckets += len(ops)
+                ops = []
+        if ops:
+            mood_days_col.bulk_write(ops, ordered=False)
+            buckets += len(ops)
+    except PyMongoError as e:
+        raise click.ClickException(f"Migration interrupted (safe to re-run): {e}")
+    click.echo(f"✅ wellness_mood_days: {buckets} day bucket(s) written")
+
+
+@click.command("rebuild-cohort-rollups")
+@click.option("--full", is_flag=True, help="Recompute every day, not just days since the last run.")
+def rebuild_cohort_rollups_command(full):
+    """Bring the anonymized cohort mood rollups up to date."""
+    ensure_indexes()
+    try:
+        days = refresh_cohort_rollups(full=full)
+    except PyMongoError as e:
+        raise click.ClickException(f"Rollup interrupted (safe to re-run with --full): {e}")
+    click.echo(f"✅ cohort_mood_daily: {days} day(s) recomputed")
+
+
+@click.command("replay-mood-risk")
+@click.option("--with-alerts", is_flag=True, help="Also queue the alerts history would have raised (run once: repeats queue them again).")
+@click.option("--batch-size", default=1000, show_default=True, help="State docs per bulk write.")
+def replay_mood_risk_command(with_alerts, batch_size):
+    """Rebuild at-risk detection state from the mood history in one streaming pass."""
+    ensure_indexes()
+    # Walks the user_mood_day index backwards: all of a user's days together, oldest
+    # first, and each bucket's entries are already in logging order. Only the
+    # current user's state is held in memory.
+    buckets = mood_days_col.find({}, {"_id": 0, "userId": 1, "entries": 1}) \
+        .sort([("userId", -1), ("day", 1)]).batch_size(batch_size)
+
+    ops, alerts, users, raised = [], [], 0, 0
+    current, state = None, {}
+
+    def flush_user():
+        nonlocal users
+        if current is not None and state:
+            ops.append(UpdateOne({"_id": current}, {"$set": state}, upsert=True))
+            users += 1
+
+    def flush_writes(force=False):
+        nonlocal ops, alerts
+        if ops and (force or len(ops) >= batch_size):
+            mood_risk_col.bulk_write(ops, ordered=False)
+            ops = []
+        if alerts and (force or len(alerts) >= batch_size):
+            risk_alerts_col.insert_many(alerts, ordered=False)
+            alerts = []
+
+    try:
+        for bucket in buckets:
+            if bucket["userId"] != current:
+                flush_user()
+                flush_writes()
+                current, state = bucket["userId"], {}
+            for entry in bucket.get("entries", []):
+                score = MOOD_SCORES.get(entry.get("mood"))
+                if score is None:
+                    continue
+                state, raised_now = update_state(state, score, entry["at"])
+                raised += len(raised_now)
+                if with_alerts:
+                    alerts += [alert_doc(current, entry["mood"], score, entry["at"], a) for a in raised_now]
+        flush_user()
+        flush_writes(force=True)
+    except PyMongoError as e:
+        raise click.ClickException(f"Replay interrupted (safe to re-run): {e}")
+
+    click.echo(f"✅ mood_risk_state: {users} user(s) replayed, {raised} alert(s) "
+               f"{'queued' if with_alerts else 'found (not queued)'}")
+
+
+def _daily_counts(unwind, user_field, ts_field, extra=None):
+    """Pipeline counting raw docs per (user, UTC day)."""
+    pipeline = [{"$unwind": unwind}] if unwind else []
+    return pipeline + [
+        {"$match": {user_field: {"$nin": [None, ""]}, ts_field: {"$type": "date"}, **(extra or {})}},
+        {"$group": {
+            "_id": {
+                "user": f"${user_field}",
+                "day": {"$dateToString": {"format": "%Y-%m-%d", "date": f"${ts_field}"}},
+            },
+            "n": {"$sum": 1},
+        }},
+    ]
+
+
+@click.command("backfill-activity")
+@click.option("--batch-size", default=1000, show_default=True, help="Rollup upserts per bulk write.")
+def backfill_activity_command(batch_size):
+    """Rebuild activity_daily counters from raw messages, moods and community posts."""
+    # counter -> (collection, pipeline yielding {_id: {user, day}, n})
+    sources = {
+        "messages": (messages_col, _daily_counts(None, "sender_id", "timestamp")),
+        "groupMessages": (group_messages_col, _daily_counts(None, "senderId", "timestamp", {"system": {"$ne": True}})),
+        # Moods are already bucketed per day (run migrate-moods first)
+        "moods": (mood_days_col, [
+            {"$match": {"userId": {"$nin": [None, ""]}, "total": {"$gt": 0}}},
+            {"$project": {"_id": {"user": "$userId", "day": "$day"}, "n": "$total"}},
+        ]),
+        "posts": (community_col, _daily_counts(None, "userId", "createdAt")),
+        "answers": (community_col, _daily_counts("$answers", "answers.userId", "answers.createdAt")),
+    }
+    try:
+        for counter, (col, pipeline) in sources.items():
+            # $set (not $inc) so re-running converges on the same counts
+            ops, written = [], 0
+            for row in col.aggregate(pipeline, allowDiskUse=True):
+                ops.append(UpdateOne(
+                    {"user_id": row["_id"]["user"], "day": row["_id"]["day"]},
+                    {"$set": {counter: row["n"]}},
+                    upsert=True,
+                ))
+                if len(ops) >= batch_size:
+                    written += activity_daily_col.bulk_write(ops, ordered=False).upserted_count
+                    ops = []
+            if ops:
+                written += activity_daily_col.bulk_write(ops, ordered=False).upserted_count
+            click.echo(f"✅ activity_daily: {counter} backfilled ({written} new day doc(s))")
+    except PyMongoError as e:
+        raise click.ClickException(f"Backfill interrupted (safe to re-run): {e}")
+
+
+def register_commands(app):
+    """Attach maintenance commands to the Flask CLI."""
+    app.cli.add_command(backfill_conversations_command)
+    app.cli.add_command(rebuild_inbox_command)
+    app.cli.add_command(refresh_suggestions_command)
+    app.cli.add_command(migrate_group_members_command)
+    app.cli.add_command(dedupe_group_members_command)
+    app.cli.add_command(ensure_indexes_command)
+    app.cli.add_command(dedupe_grades_command)
+    app.cli.add_command(backfill_upload_manifests_command)
+    app.cli.add_command(migrate_moods_command)
+    app.cli.add_command(backfill_activity_command)
+    app.cli.add_command(rebuild_cohort_rollups_command)
+    app.cli.add_command(replay_mood_risk_command)
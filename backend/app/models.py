@@ -1,6 +1,7 @@
 # app/models.py
 import os
-from pymongo import MongoClient
+from pymongo import MongoClient, ASCENDING, DESCENDING
+from pymongo.errors import PyMongoError
 
 # ------------------ MONGODB CONNECTION ------------------
 # Local fallback URI (for development)
@@ -25,9 +26,159 @@ grades_col = db["grades"]
 connections_col = db["connections"]    # mutual connections
 requests_col = db["requests"]          # pending follow requests
 community_col = db["community_posts"]
-wellness_moods_col = db["wellness_moods"]
+wellness_moods_col = db["wellness_moods"]  # legacy one-doc-per-mood layout (see migrate-moods)
+mood_days_col = db["wellness_mood_days"]   # moods bucketed per (userId, day)
 badges_col = db["badges"]
 groups_col = db["groups"]
+conversations_col = db["conversations"]  # per-DM inbox summary (last message, unread counters)
+group_messages_col = db["group_messages"]
+group_members_col = db["group_members"]  # one doc per (groupId, userId) membership
+suggestions_col = db["user_suggestions"]  # precomputed "people you may know" per user
+grade_jobs_col = db["grade_import_jobs"]  # queued/running grade sheet imports
+grade_uploads_col = db["grade_uploads"]    # one manifest per grade sheet upload (teacher history)
+engagement_col = db["engagement_metrics"]  # per-user engagement counters behind /wellness/correlation
+activity_daily_col = db["activity_daily"]  # per-user daily activity counters (dashboard rollups)
+grade_stats_col = db["grade_stats"]        # cached class statistics per (department, semester, subject, testType)
+cohort_moods_col = db["cohort_mood_daily"]  # anonymized mood counts per (dimension, value, day)
+rollup_state_col = db["rollup_state"]       # watermarks of incremental rollups
+mood_risk_col = db["mood_risk_state"]       # per-user running mood statistics (at-risk detection)
+presence_col = db["presence"]               # online users per (worker, user), shared by socket workers
+presence_counts_col = db["presence_counts"] # number of workers holding each online user
+risk_alerts_col = db["risk_alerts"]         # at-risk alerts queued for staff review
+
+# ------------------ INDEXES ------------------
+GRADE_KEY_INDEX = "grade_key"
+PRESENCE_TIMEOUT = int(os.getenv("PRESENCE_TIMEOUT", 90))  # seconds without a heartbeat before a session expires
+
+# (collection, keys, name, how to fix duplicates that block it)
+UNIQUE_INDEXES = [
+    # One membership per group and user; join_group relies on it to detect "Already a member"
+    (group_members_col, [("groupId", ASCENDING), ("userId", ASCENDING)], "group_member",
+     "run `flask dedupe-group-members`"),
+    # One grade per student/subject/assessment; the upload path upserts on it
+    (grades_col, [
+        ("regNumber", ASCENDING),
+        ("subject", ASCENDING),
+        ("semester", ASCENDING),
+        ("testType", ASCENDING),
+        ("date", ASCENDING),
+    ], GRADE_KEY_INDEX, "run `flask dedupe-grades`"),
+    # Activity rollups and mood buckets: one doc per user and day ($inc upserts)
+    (activity_daily_col, [("user_id", ASCENDING), ("day", DESCENDING)], "user_day",
+     "drop activity_daily and run `flask backfill-activity`"),
+    (mood_days_col, [("userId", ASCENDING), ("day", DESCENDING)], "user_mood_day",
+     "merge duplicate (userId, day) buckets"),
+    # Cohort rollups: one doc per dimension value and day
+    (cohort_moods_col, [("dimension", ASCENDING), ("day", ASCENDING), ("value", ASCENDING)], "cohort_day",
+     "run `flask rebuild-cohort-rollups --full`"),
+]
+
+
+def ensure_indexes():
+    """Create the indexes the API query paths rely on (idempotent)."""
+    try:
+        # Chat history: one equality on the canonical pair + keyset on (timestamp, _id)
+        messages_col.create_index([
+            ("conversation_id", ASCENDING),
+            ("timestamp", DESCENDING),
+            ("_id", DESCENDING),
+        ], name="conversation_history")
+        connections_col.create_index("conversation_id", name="connection_pair")
+        # Connection / pending lists: equality + stable _id order for pagination
+        connections_col.create_index([("user1", ASCENDING), ("_id", ASCENDING)], name="connections_user1")
+        connections_col.create_index([("user2", ASCENDING), ("_id", ASCENDING)], name="connections_user2")
+        connections_col.create_index([("from_id", ASCENDING), ("status", ASCENDING)], name="connections_from_id")
+        connections_col.create_index([("to_id", ASCENDING), ("status", ASCENDING)], name="connections_to_id")
+        requests_col.create_index([("to", ASCENDING), ("status", ASCENDING), ("_id", ASCENDING)], name="pending_to")
+        # Group chat: latest page and since=<cursor> catch-up per group
+        group_messages_col.create_index([
+            ("groupId", ASCENDING),
+            ("timestamp", DESCENDING),
+            ("_id", DESCENDING),
+        ], name="group_history")
+        # Group discovery: most active public groups, private groups by creator
+        groups_col.create_index([("isPrivate", ASCENDING), ("activityScore", DESCENDING)], name="group_discovery")
+        groups_col.create_index("createdBy", name="groups_created_by")
+        # Group membership: roster per group, groups per user
+        group_members_col.create_index([("groupId", ASCENDING), ("joinedAt", ASCENDING), ("_id", ASCENDING)], name="group_roster")
+        group_members_col.create_index([("userId", ASCENDING), ("joinedAt", DESCENDING)], name="member_groups")
+        # Suggestions: user lookups by id / profile, stale-first refresh
+        users_col.create_index("id", name="user_id")
+        users_col.create_index([("university", ASCENDING), ("field", ASCENDING), ("year", ASCENDING)], name="user_profile")
+        users_col.create_index([("regNumber", ASCENDING), ("role", ASCENDING)], name="user_reg_number")
+        requests_col.create_index("from", name="requests_from")
+        suggestions_col.create_index("computedAt", name="suggestions_computed_at")
+        # Inbox: most recent conversations of a participant
+        conversations_col.create_index([
+            ("participants", ASCENDING),
+            ("last_timestamp", DESCENDING),
+            ("_id", DESCENDING),
+        ], name="inbox")
+        # Grade import jobs: oldest queued first, stale running jobs, per-teacher lists
+        grade_jobs_col.create_index([("status", ASCENDING), ("createdAt", ASCENDING)], name="grade_jobs_queue")
+        grade_jobs_col.create_index([("status", ASCENDING), ("heartbeatAt", ASCENDING)], name="grade_jobs_heartbeat")
+        # Cohort rollups: incremental day scans, one dimension over a date range
+        mood_days_col.create_index("day", name="mood_days_by_day")
+        # Presence: online lookups by user, per-worker refresh, crashed workers' stale docs.
+        # Stale docs are released by a live worker's sweep (which also decrements
+        # presence_counts), so they must not expire on their own
+        presence_col.create_index([("userId", ASCENDING), ("seenAt", ASCENDING)], name="presence_user")
+        presence_col.create_index("worker", name="presence_worker")
+        if "presence_ttl" in presence_col.index_information():
+            presence_col.drop_index("presence_ttl")
+        presence_col.create_index("seenAt", name="presence_seen")
+        # At-risk alerts: review queue by status, newest first
+        risk_alerts_col.create_index([
+            ("status", ASCENDING),
+            ("createdAt", DESCENDING),
+            ("_id", DESCENDING),
+        ], name="risk_alert_queue")
+        # Engagement metrics: stale-first refresh and the per-user counting queries
+        engagement_col.create_index("computedAt", name="engagement_computed_at")
+        group_messages_col.create_index("senderId", name="group_messages_sender")
+        messages_col.create_index([("sender_id", ASCENDING), ("type", ASCENDING)], name="messages_sender_type")
+        community_col.create_index("userId", name="posts_user")
+        users_col.create_index("peerBadges.givenBy", name="peer_badges_given_by")
+        # Class statistics: every mark of one cohort
+        grades_col.create_index([
+            ("department", ASCENDING),
+            ("semester", ASCENDING),
+            ("subject", ASCENDING),
+            ("testType", ASCENDING),
+        ], name="grade_cohort")
+        # Exports: a department's grades in export order (regNumber, subject, date), so the
+        # sort is read off the index instead of done in memory. Supersedes the
+        # (department, regNumber) index of earlier versions
+        if "grade_department_student" in grades_col.index_information():
+            grades_col.drop_index("grade_department_student")
+        grades_col.create_index([
+            ("department", ASCENDING),
+            ("regNumber", ASCENDING),
+            ("subject", ASCENDING),
+            ("date", ASCENDING),
+        ], name="grade_export")
+        # Upload history: a teacher's manifests, newest first
+        grade_uploads_col.create_index([
+            ("teacherId", ASCENDING),
+            ("uploadedAt", DESCENDING),
+            ("_id", DESCENDING),
+        ], name="teacher_uploads")
+        print("[MongoDB] Indexes ensured")
+    except PyMongoError as e:
+        print(f"[MongoDB] Index creation failed: {e}")
+
+    # Unique indexes enforce correctness (upserts, "already a member" checks), so each
+    # is created on its own: an unrelated failure above can't skip it, and a missing
+    # one is reported with its fix. Returns the names of the ones that failed.
+    missing = []
+    for collection, keys, name, fix in UNIQUE_INDEXES:
+        try:
+            collection.create_index(keys, unique=True, name=name)
+        except PyMongoError as e:
+            missing.append(name)
+            print(f"[MongoDB] ❌ Unique index '{name}' on {collection.name} NOT created ({fix}): {e}")
+    return missing
+
 
 # ------------------ HELPER ------------------
 def check_connection():
@@ -1,37 +1,186 @@
-from flask_socketio import emit, join_room, leave_room
-from app.models import chats_col
+# app/socket_events.py
+"""
+Realtime messaging over Socket.IO. This is the only socket module; it is
+registered by create_app via register_socket_events(socketio).
+
+Client protocol:
+    socket.emit("join", { token })                          -> joins the user's private room
+        <- "online_users" [ids of the user's connections that are online]
+        <- "presence" { online: [...], offline: [...] } batched diffs afterwards
+    socket.emit("heartbeat")                                -> keeps the session from expiring
+    socket.emit("join_group", { group_id }) / ("leave_group", { group_id })
+        <- "group_message" for every message posted to the group (members only)
+    socket.emit("send_message", { receiver_id, text, client_id })
+        <- "receive_message" to the receiver (and the sender's other tabs), immediately
+        <- "message_ack" { client_id, id, status } to the sending socket once persisted
+           (status "saved" | "failed", or "retry" when the write buffer is full)
+        <- "error" { msg, client_id } when the message was rejected
+    Sessions live per socket: clients re-send "join" after every (re)connect.
+"""
+import atexit
+import os
 from datetime import datetime
 
+from bson import ObjectId
+from flask import request
+from flask_socketio import emit, join_room, leave_room
+from flask_jwt_extended import decode_token
+
+from app.models import messages_col, presence_col, presence_counts_col, PRESENCE_TIMEOUT
+from app.api.groups import group_room, is_member
+from app.utils.conversations import conversation_key, record_messages
+from app.utils.activity import record_activity_many
+from app.utils.connection_cache import connection_cache
+from app.utils.presence import PresenceTracker
+from app.utils.write_behind import WriteBehindQueue
+
+# sid -> user_id of every authenticated socket on this worker
+sessions = {}
+
+# Write-behind buffer for chat messages and presence tracker (created by register_socket_events)
+message_writer = None
+presence = None
+
+
+def serialize_socket_message(msg, client_id=None):
+    """JSON-friendly payload of a stored message for socket emits."""
+    return {
+        "_id": str(msg["_id"]),
+        "conversation_id": msg["conversation_id"],
+        "sender_id": msg["sender_id"],
+        "receiver_id": msg["receiver_id"],
+        "text": msg["text"],
+        "timestamp": msg["timestamp"].isoformat(),
+        "client_id": client_id,
+    }
+
+
 def register_socket_events(socketio):
+    global message_writer, presence
+
+    def on_messages_flushed(saved, failed):
+        """Runs after each insert_many: update inbox summaries and rollups, then ack senders."""
+        if saved:
+            docs = [doc for doc, _ in saved]
+            record_messages(docs)
+            record_activity_many((d["sender_id"], "messages", d["timestamp"]) for d in docs)
+        for items, status in ((saved, "saved"), (failed, "failed")):
+            for doc, meta in items:
+                socketio.emit("message_ack", {
+                    "client_id": meta.get("client_id"),
+                    "id": str(doc["_id"]),
+                    "status": status,
+                }, to=meta["sid"])
 
-    @socketio.on("join_room")
+    message_writer = WriteBehindQueue(
+        socketio,
+        messages_col,
+        on_flush=on_messages_flushed,
+        max_batch=int(os.getenv("CHAT_WRITE_BATCH", 500)),
+        flush_interval=int(os.getenv("CHAT_WRITE_INTERVAL_MS", 50)) / 1000,
+        max_pending=int(os.getenv("CHAT_WRITE_MAX_PENDING", 10000)),
+    )
+    # Flush buffered messages on interpreter exit (run.py maps SIGTERM to exit)
+    atexit.register(message_writer.drain)
+
+    presence = PresenceTracker(
+        socketio,
+        partners_fn=connection_cache.partners,
+        store=presence_col,
+        counts=presence_counts_col,
+        flush_interval=int(os.getenv("PRESENCE_FLUSH_MS", 500)) / 1000,
+        session_timeout=PRESENCE_TIMEOUT,
+    )
+    atexit.register(presence.close)
+
+    @socketio.on("join")
     def handle_join(data):
-        room = data["room"]
-        join_room(room)
-        emit("system_message", {"msg": f"{data['role']} joined the room"}, to=room)
+        """Authenticate the socket with its JWT and join the user's private room."""
+        token = (data or {}).get("token")
+        if not token:
+            emit("error", {"msg": "Missing token"})
+            return
+
+        try:
+            user_id = decode_token(token).get("sub")
+        except Exception as e:
+            emit("error", {"msg": f"Join failed: {str(e)}"})
+            return
+
+        if not user_id:
+            emit("error", {"msg": "Invalid token: no user_id"})
+            return
+
+        sessions[request.sid] = user_id
+        join_room(user_id)
+        presence.connect(request.sid, user_id)
+        emit("status", {"msg": f"✅ User {user_id} joined room"})
+        emit("online_users", presence.online_among(connection_cache.partners(user_id)))
 
-    @socketio.on("leave_room")
-    def handle_leave(data):
-        room = data["room"]
-        leave_room(room)
-        emit("system_message", {"msg": f"{data['role']} left the room"}, to=room)
+    @socketio.on("heartbeat")
+    def handle_heartbeat(*args):
+        presence.heartbeat(request.sid)
+
+    @socketio.on("disconnect")
+    def handle_disconnect(*args):
+        sessions.pop(request.sid, None)
+        presence.disconnect(request.sid)
+
+    @socketio.on("join_group")
+    def handle_join_group(data):
+        """Subscribe this socket to a group's live messages (members only)."""
+        user_id = sessions.get(request.sid)
+        group_id = (data or {}).get("group_id")
+        if not user_id or not group_id:
+            emit("error", {"msg": "Join with a valid token and a group_id"})
+            return
+        if not is_member(group_id, user_id):
+            emit("error", {"msg": "Not a member of this group"})
+            return
+        join_room(group_room(group_id, user_id))
+        emit("status", {"msg": f"Subscribed to group {group_id}"})
+
+    @socketio.on("leave_group")
+    def handle_leave_group(data):
+        user_id = sessions.get(request.sid)
+        group_id = (data or {}).get("group_id")
+        if user_id and group_id:
+            leave_room(group_room(group_id, user_id))
 
     @socketio.on("send_message")
     def handle_message(data):
-        room = data["room"]
+        """Deliver a DM right away and persist it through the write-behind queue."""
+        data = data or {}
+        sender_id = sessions.get(request.sid)
+        receiver_id = data.get("receiver_id")
+        text = data.get("text")
+        client_id = data.get("client_id")
+
+        if not sender_id:
+            emit("error", {"msg": "Join with a valid token before sending", "client_id": client_id})
+            return
+        presence.heartbeat(request.sid)
+        if not receiver_id or not text:
+            emit("error", {"msg": "❌ Missing fields in message", "client_id": client_id})
+            return
+        if not connection_cache.are_connected(sender_id, receiver_id):
+            emit("error", {"msg": "Not connected", "client_id": client_id})
+            return
+
         msg = {
-            "sender": data["sender"],  # real user id
-            "role": data["role"],      # student/teacher
-            "message": data["message"],
-            "timestamp": datetime.utcnow()
+            "_id": ObjectId(),
+            "conversation_id": conversation_key(sender_id, receiver_id),
+            "sender_id": sender_id,
+            "receiver_id": receiver_id,
+            "text": text,
+            "timestamp": datetime.utcnow(),
         }
-        chats_col.insert_one(msg)
 
-        # 👇 Masked role-based name
-        display_name = "Anonymous " + data["role"].capitalize()
+        if not message_writer.submit(msg, {"sid": request.sid, "client_id": client_id}):
+            # Backpressure: buffer is full (or draining), the client should retry
+            emit("message_ack", {"client_id": client_id, "id": None, "status": "retry"})
+            return
 
-        emit("receive_message", {
-            "sender": display_name,
-            "message": data["message"],
-            "timestamp": msg["timestamp"].strftime("%H:%M")
-        }, to=room)
+        payload = serialize_socket_message(msg, client_id)
+        emit("receive_message", payload, to=receiver_id)
+        emit("receive_message", payload, to=sender_id, skip_sid=request.sid)
@@ -0,0 +1,78 @@
+# backend/app/utils/activity.py
+"""
+Per-user daily activity rollups: one `activity_daily` doc per (user_id, day)
+with counters bumped by `$inc` upserts from the write paths:
+
+    messages        direct messages sent (REST and socket)
+    groupMessages   group chat messages sent
+    moods           moods logged
+    posts           community questions posted
+    answers         community answers posted
+
+Dashboards read these few small docs instead of scanning raw activity.
+"""
+from collections import Counter
+from datetime import datetime, timedelta
+
+from pymongo import UpdateOne
+
+from app.models import activity_daily_col
+
+COUNTERS = ("messages", "groupMessages", "moods", "posts", "answers")
+
+
+def day_key(ts=None):
+    """Rollup day of a UTC timestamp, as YYYY-MM-DD."""
+    return (ts or datetime.utcnow()).strftime("%Y-%m-%d")
+
+
+def _rollup_update(user_id, day, incs):
+    return UpdateOne({"user_id": user_id, "day": day}, {"$inc": incs}, upsert=True)
+
+
+def record_activity(user_id, counter, ts=None, amount=1):
+    """Bump one counter of `user_id`'s rollup for the day of `ts`."""
+    activity_daily_col.update_one(
+        {"user_id": user_id, "day": day_key(ts)}, {"$inc": {counter: amount}}, upsert=True
+    )
+
+
+def record_activity_many(events):
+    """
+    Fold (user_id, counter, ts) events into the rollups with one bulk write:
+    events for the same user and day become a single upsert.
+    """
+    totals = Counter((user_id, day_key(ts), counter) for user_id, counter, ts in events)
+    if not totals:
+        return
+    per_doc = {}
+    for (user_id, day, counter), n in totals.items():
+        per_doc.setdefault((user_id, day), {})[counter] = n
+    activity_daily_col.bulk_write(
+        [_rollup_update(user_id, day, incs) for (user_id, day), incs in per_doc.items()], ordered=False
+    )
+
+
+def activity_summary(user_id, counter="messages"):
+    """
+    Active days, total count and current streak (consecutive active days
+    ending at the most recent one) for one counter.
+    """
+    active = {"user_id": user_id, counter: {"$gt": 0}}
+    totals = list(activity_daily_col.aggregate([
+        {"$match": active},
+        {"$group": {"_id": None, "days": {"$sum": 1}, "total": {"$sum": f"${counter}"}}},
+    ]))
+    if not totals:
+        return {"days": 0, "total": 0, "streak": 0}
+
+    # Newest first, stopping at the first gap: reads streak + 1 docs at most
+    streak, previous = 0, None
+    for doc in activity_daily_col.find(active, {"_id": 0, "day": 1}).sort("day", -1):
+        day = datetime.strptime(doc["day"], "%Y-%m-%d").date()
+        if previous is not None and previous - day != timedelta(days=1):
+            break
+        streak += 1
+        previous = day
+
+    return {"days": totals[0]["days"], "total": totals[0]["total"], "streak": streak}
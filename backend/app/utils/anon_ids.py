@@ -0,0 +1,72 @@
+# backend/app/utils/anon_ids.py
+"""
+Shared user id -> anonId resolver. Misses are fetched in one $in query per
+batch and kept in a bounded per-process LRU; profile updates that change an
+anonId call invalidate(), and a TTL bounds staleness on other workers.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+
+DEFAULT_ANON_ID = "Anonymous"
+
+
+class AnonIdResolver:
+    def __init__(self, max_entries=50000, ttl=600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # user_id -> (anonId, expires_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def resolve_many(self, user_ids):
+        """Return {user_id: anonId} for every id, with one query for all misses."""
+        now = time.monotonic()
+        result, missing = {}, []
+        with self._lock:
+            for uid in set(u for u in user_ids if u):
+                entry = self._entries.get(uid)
+                if entry and entry[1] > now:
+                    self._entries.move_to_end(uid)
+                    result[uid] = entry[0]
+                    self.hits += 1
+                else:
+                    missing.append(uid)
+            self.misses += len(missing)
+
+        if missing:
+            found = {
+                u["id"]: u.get("anonId", DEFAULT_ANON_ID)
+                for u in current_app.db.users.find({"id": {"$in": missing}}, {"_id": 0, "id": 1, "anonId": 1})
+            }
+            with self._lock:
+                for uid in missing:
+                    anon_id = found.get(uid, DEFAULT_ANON_ID)
+                    result[uid] = anon_id
+                    self._entries[uid] = (anon_id, now + self.ttl)
+                    self._entries.move_to_end(uid)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return result
+
+    def resolve(self, user_id):
+        return self.resolve_many([user_id]).get(user_id, DEFAULT_ANON_ID)
+
+    def invalidate(self, *user_ids):
+        with self._lock:
+            for uid in user_ids:
+                self._entries.pop(uid, None)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+anon_ids = AnonIdResolver(
+    max_entries=int(os.getenv("ANON_ID_CACHE_SIZE", 50000)),
+    ttl=int(os.getenv("ANON_ID_CACHE_TTL", 600)),
+)
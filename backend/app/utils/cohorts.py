@@ -0,0 +1,165 @@
+# backend/app/utils/cohorts.py
+"""
+Anonymized cohort mood rollups behind /api/wellness/cohorts.
+
+`cohort_mood_daily` holds one doc per (dimension, value, day), e.g.
+{dimension: "field", value: "CS", day, counts: {happy: 40, ...}, total, students},
+built from the per-day mood buckets joined to the student's profile. The
+refresh is incremental: `rollup_state` keeps the last day processed and each
+run recomputes that day (it may have been partial) and every newer one, so a
+dashboard over any number of students reads (values x days) small docs.
+
+Cells are attributed with the profile at rollup time; run
+`flask rebuild-cohort-rollups --full` after bulk profile edits or mood migrations.
+
+Privacy: a cell is published only when at least MIN_COHORT_SIZE distinct
+students logged a mood in it. Distinct students are not additive across
+days, so the largest daily count is used as a lower bound for a period.
+Cohort totals are summed from published periods only, so a suppressed
+period can't be recovered by subtracting the others from the total.
+"""
+import os
+from datetime import date, datetime, timedelta
+from itertools import groupby
+
+from pymongo import InsertOne
+
+from app.models import cohort_moods_col, rollup_state_col, mood_days_col, users_col
+from app.utils.moods import period_start
+
+DIMENSIONS = ("university", "department", "year", "field")
+MIN_COHORT_SIZE = int(os.getenv("COHORT_MIN_STUDENTS", 5))
+REFRESH_AFTER = timedelta(minutes=30)
+STATE_ID = "cohort_moods"
+BATCH_SIZE = 5000
+
+
+def _profiles(user_ids, cache):
+    """Cohort attributes of the given students, fetched once per refresh run."""
+    missing = [u for u in user_ids if u not in cache]
+    for u in missing:
+        cache[u] = None  # not a student / deleted user
+    if missing:
+        for user in users_col.find(
+            {"id": {"$in": missing}, "role": "student"}, {"_id": 0, "id": 1, **{d: 1 for d in DIMENSIONS}}
+        ):
+            cache[user["id"]] = {d: user[d] for d in DIMENSIONS if user.get(d) not in (None, "")}
+    return cache
+
+
+def _day_cells(buckets, cache):
+    """Fold one day's mood buckets into {(dimension, value): cell}."""
+    buckets = list(buckets)
+    _profiles({b["userId"] for b in buckets}, cache)
+    cells = {}
+    for b in buckets:
+        profile = cache.get(b["userId"])
+        if not profile:
+            continue
+        for dimension, value in profile.items():
+            cell = cells.setdefault((dimension, value), {"counts": {}, "total": 0, "students": 0})
+            for mood, n in (b.get("counts") or {}).items():
+                cell["counts"][mood] = cell["counts"].get(mood, 0) + n
+            cell["total"] += b.get("total", 0)
+            cell["students"] += 1  # one bucket per student and day
+    return cells
+
+
+def refresh_cohort_rollups(full=False):
+    """
+    Recompute cohort rows from the watermark day onwards (everything when
+    `full`). Returns the number of days recomputed.
+    """
+    state = None if full else rollup_state_col.find_one({"_id": STATE_ID})
+    since = state["through"] if state and state.get("through") else None
+
+    query = {"day": {"$gte": since}} if since else {}
+    if full:
+        cohort_moods_col.delete_many({})
+    buckets = mood_days_col.find(query, {"_id": 0, "userId": 1, "day": 1, "counts": 1, "total": 1}) \
+        .sort("day", 1).batch_size(BATCH_SIZE)
+
+    cache, days, through = {}, 0, since
+    for day, day_buckets in groupby(buckets, key=lambda b: b["day"]):
+        cells = _day_cells(day_buckets, cache)
+        # Replace the day as a whole so cohorts that emptied out disappear too
+        cohort_moods_col.delete_many({"dimension": {"$in": list(DIMENSIONS)}, "day": day})
+        if cells:
+            cohort_moods_col.bulk_write([
+                InsertOne({"dimension": dimension, "value": value, "day": day, **cell})
+                for (dimension, value), cell in cells.items()
+            ], ordered=False)
+        days, through = days + 1, day
+
+    rollup_state_col.update_one(
+        {"_id": STATE_ID}, {"$set": {"through": through, "computedAt": datetime.utcnow()}}, upsert=True
+    )
+    return days
+
+
+def refresh_stale_cohort_rollups():
+    """Background job: incremental refresh once the last one is past REFRESH_AFTER."""
+    state = rollup_state_col.find_one({"_id": STATE_ID})
+    if state and datetime.utcnow() - state["computedAt"] < REFRESH_AFTER:
+        return 0
+    return refresh_cohort_rollups()
+
+
+def rollup_computed_at():
+    state = rollup_state_col.find_one({"_id": STATE_ID}, {"computedAt": 1})
+    return state["computedAt"] if state else None
+
+
+def _dominant(counts):
+    return min(counts, key=lambda m: (-counts[m], m)) if counts else None
+
+
+def cohort_report(dimension, start, end, granularity="week"):
+    """
+    Mood distribution and trend of every `dimension` value between `start`
+    and `end` (dates, inclusive). Returns (cohorts, suppressed_count).
+    """
+    rows = cohort_moods_col.find(
+        {"dimension": dimension, "day": {"$gte": start.isoformat(), "$lte": end.isoformat()}},
+        {"_id": 0, "value": 1, "day": 1, "counts": 1, "total": 1, "students": 1},
+    )
+
+    # value -> period -> {counts, total, students (max daily)}
+    grid = {}
+    for row in rows:
+        period = period_start(date.fromisoformat(row["day"]), granularity)
+        p = grid.setdefault(row["value"], {}).setdefault(period, {"counts": {}, "total": 0, "students": 0})
+        for mood, n in (row.get("counts") or {}).items():
+            p["counts"][mood] = p["counts"].get(mood, 0) + n
+        p["total"] += row.get("total", 0)
+        p["students"] = max(p["students"], row.get("students", 0))
+
+    cohorts, suppressed = [], 0
+    for value, periods in grid.items():
+        published = {k: p for k, p in periods.items() if p["students"] >= MIN_COHORT_SIZE}
+        if not published:
+            suppressed += 1
+            continue
+        counts, total = {}, 0
+        for p in published.values():
+            for mood, n in p["counts"].items():
+                counts[mood] = counts.get(mood, 0) + n
+            total += p["total"]
+        cohorts.append({
+            "value": value,
+            "minStudents": max(p["students"] for p in published.values()),
+            "distribution": counts,
+            "total": total,
+            "dominant": _dominant(counts),
+            "trend": [
+                {"period": k.isoformat(), "suppressed": True} if k not in published else {
+                    "period": k.isoformat(),
+                    "counts": p["counts"],
+                    "total": p["total"],
+                    "dominant": _dominant(p["counts"]),
+                }
+                for k, p in sorted(periods.items())
+            ],
+        })
+    cohorts.sort(key=lambda c: (-c["total"], str(c["value"])))
+    return cohorts, suppressed
@@ -0,0 +1,98 @@
+# backend/app/utils/connection_cache.py
+"""
+Per-worker LRU of connection adjacency sets, used to authorize DM sends
+without a Mongo round trip. Entries expire after a TTL and are dropped
+explicitly whenever this worker creates a connection; a negative answer is
+re-checked against Mongo once, so connections made on another worker are
+picked up before their TTL runs out.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from app.models import connections_col
+from app.utils.conversations import conversation_key
+
+
+class ConnectionCache:
+    def __init__(self, max_users=10000, ttl=300):
+        self.max_users = max_users
+        self.ttl = ttl
+        self._entries = OrderedDict()  # user_id -> (frozenset(partner ids), expires_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.rechecks = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _load(user_id):
+        """Every partner of `user_id`, from both connection schemas in use."""
+        docs = connections_col.find({"$or": [
+            {"user1": user_id}, {"user2": user_id},
+            {"from_id": user_id, "status": "accepted"},
+            {"to_id": user_id, "status": "accepted"},
+        ]}, {"user1": 1, "user2": 1, "from_id": 1, "to_id": 1})
+        partners = set()
+        for d in docs:
+            for a, b in (("user1", "user2"), ("from_id", "to_id")):
+                if d.get(a) and d.get(b):
+                    partners.add(d[b] if d[a] == user_id else d[a])
+        return frozenset(partners)
+
+    def partners(self, user_id):
+        """Cached adjacency set of `user_id`, loading it on a miss or expiry."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry and entry[1] > now:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        partners = self._load(user_id)
+        with self._lock:
+            self._entries[user_id] = (partners, now + self.ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+        return partners
+
+    def are_connected(self, user_a, user_b):
+        if user_b in self.partners(user_a):
+            return True
+        # Rare path (e.g. connection accepted on another worker): confirm in Mongo
+        with self._lock:
+            self.rechecks += 1
+        if connections_col.find_one({"conversation_id": conversation_key(user_a, user_b)}, {"_id": 1}):
+            self.invalidate(user_a, user_b)
+            return True
+        return False
+
+    def invalidate(self, *user_ids):
+        with self._lock:
+            for uid in user_ids:
+                if self._entries.pop(uid, None) is not None:
+                    self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "maxEntries": self.max_users,
+                "ttlSeconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "rechecks": self.rechecks,
+                "invalidations": self.invalidations,
+                "hitRate": round(self.hits / lookups, 4) if lookups else None,
+            }
+
+
+connection_cache = ConnectionCache(
+    max_users=int(os.getenv("CONNECTION_CACHE_SIZE", 10000)),
+    ttl=int(os.getenv("CONNECTION_CACHE_TTL", 300)),
+)
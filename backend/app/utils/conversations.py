@@ -0,0 +1,61 @@
+# backend/app/utils/conversations.py
+from pymongo import UpdateOne
+
+from app.models import conversations_col
+
+PREVIEW_LENGTH = 120
+
+
+def conversation_key(user_a, user_b):
+    """Canonical id for the DM conversation between two users (order-independent)."""
+    first, second = sorted([str(user_a), str(user_b)])
+    return f"{first}:{second}"
+
+
+def participant_slot(user_id, partner_id):
+    """
+    Key of `user_id` inside a conversation's `unread` map: "0" or "1", its position
+    in the sorted participant pair. Slots are used instead of raw user ids because
+    ids are user-chosen and may contain characters that are not valid in field paths.
+    """
+    return str(sorted([str(user_id), str(partner_id)]).index(str(user_id)))
+
+
+def _summary_update(msg):
+    sender, receiver = msg["sender_id"], msg["receiver_id"]
+    return UpdateOne(
+        {"_id": msg["conversation_id"]},
+        {
+            "$set": {
+                "last_message": {
+                    "id": str(msg["_id"]),
+                    "sender_id": sender,
+                    "text": (msg.get("text") or "")[:PREVIEW_LENGTH],
+                    "timestamp": msg["timestamp"],
+                },
+                "last_timestamp": msg["timestamp"],
+            },
+            "$setOnInsert": {"participants": sorted([sender, receiver])},
+            "$inc": {f"unread.{participant_slot(receiver, sender)}": 1},
+        },
+        upsert=True,
+    )
+
+
+def record_messages(msgs):
+    """
+    Fold newly stored messages into their conversation summaries in one
+    bulk write. Each summary update is a single atomic upsert; ordered so
+    the last message of a batch wins the preview.
+    """
+    if not msgs:
+        return
+    conversations_col.bulk_write([_summary_update(m) for m in msgs], ordered=True)
+
+
+def mark_read(user_id, partner_id):
+    """Reset `user_id`'s unread counter for the conversation with `partner_id`."""
+    return conversations_col.update_one(
+        {"_id": conversation_key(user_id, partner_id), "participants": str(user_id)},
+        {"$set": {f"unread.{participant_slot(user_id, partner_id)}": 0}},
+    )
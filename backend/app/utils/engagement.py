@@ -0,0 +1,106 @@
+# backend/app/utils/engagement.py
+"""
+Per-user engagement metrics behind /api/wellness/correlation.
+
+Raw counters are stored in `engagement_metrics` ({_id: user_id, counters,
+totalGroups, computedAt}). A background job recomputes docs older than
+REFRESH_AFTER; between runs the write paths (join/leave group, group message,
+post, answer) `$inc` the affected counter, so the endpoint is a single keyed
+read and the impact scores are plain arithmetic on it.
+"""
+from datetime import datetime, timedelta
+
+from app.models import (
+    engagement_col, users_col, groups_col, group_members_col, group_messages_col,
+    messages_col, community_col,
+)
+
+REFRESH_AFTER = timedelta(hours=1)
+
+COUNTERS = (
+    "joinedGroups",          # group memberships
+    "groupMessages",         # group chat messages sent
+    "badgesGiven",           # peer badges given (users.peerBadges)
+    "posts",                 # community questions asked
+    "answersReceived",       # answers to those questions
+    "privateMessages",       # direct messages sent
+    "privateToConnections",  # ... of which to connections
+)
+
+
+def compute_counters(user_id):
+    """Count every engagement signal of one user with indexed queries."""
+    peer_badges = list(users_col.aggregate([
+        {"$match": {"peerBadges.givenBy": user_id}},
+        {"$unwind": "$peerBadges"},
+        {"$match": {"peerBadges.givenBy": user_id}},
+        {"$count": "n"},
+    ]))
+    posts = list(community_col.aggregate([
+        {"$match": {"userId": user_id}},
+        {"$group": {"_id": None, "posts": {"$sum": 1}, "answers": {"$sum": {"$size": {"$ifNull": ["$answers", []]}}}}},
+    ]))
+    return {
+        "joinedGroups": group_members_col.count_documents({"userId": user_id}),
+        "groupMessages": group_messages_col.count_documents({"senderId": user_id}),
+        "badgesGiven": peer_badges[0]["n"] if peer_badges else 0,
+        "posts": posts[0]["posts"] if posts else 0,
+        "answersReceived": posts[0]["answers"] if posts else 0,
+        "privateMessages": messages_col.count_documents({"sender_id": user_id, "type": "private"}),
+        "privateToConnections": messages_col.count_documents(
+            {"sender_id": user_id, "type": "private", "isConnection": True}
+        ),
+    }
+
+
+def refresh_engagement(user_id):
+    """Recompute and store the metrics doc of one user."""
+    doc = {
+        "counters": compute_counters(user_id),
+        "totalGroups": groups_col.estimated_document_count(),
+        "computedAt": datetime.utcnow(),
+    }
+    engagement_col.update_one({"_id": user_id}, {"$set": doc}, upsert=True)
+    return {"_id": user_id, **doc}
+
+
+def get_engagement_doc(user_id):
+    """Stored metrics for `user_id`, computed on the spot on first use."""
+    return engagement_col.find_one({"_id": user_id}) or refresh_engagement(user_id)
+
+
+def bump_engagement(user_id, counter, amount=1):
+    """
+    Apply a write to a stored metrics doc. Users without a doc are skipped:
+    their first read computes everything from scratch anyway.
+    """
+    engagement_col.update_one({"_id": user_id}, {"$inc": {f"counters.{counter}": amount}})
+
+
+def correlation_impacts(doc):
+    """Impact scores (0-100) of the correlation chart from a metrics doc."""
+    c = {k: doc.get("counters", {}).get(k, 0) for k in COUNTERS}
+    study_group_activity = min(100, ((c["joinedGroups"] + c["groupMessages"]) / max(doc.get("totalGroups", 0), 1)) * 50)
+    peer_help_given = min(100, c["badgesGiven"] * 10)
+    answers_received = min(100, (c["answersReceived"] / c["posts"]) * 100) if c["posts"] else 0
+    anonymous_discussions = (
+        min(100, (c["privateToConnections"] / c["privateMessages"]) * 100)
+        if c["privateMessages"] else 0
+    )
+    return [
+        {"activity": "Study Group Activity", "impact": round(study_group_activity, 2)},
+        {"activity": "Peer Help Given", "impact": round(peer_help_given, 2)},
+        {"activity": "Answers Received", "impact": round(answers_received, 2)},
+        {"activity": "Anonymous Discussions", "impact": round(anonymous_discussions, 2)},
+    ]
+
+
+def refresh_stale_engagement(batch_size=200):
+    """Background job: recompute the oldest metrics docs past REFRESH_AFTER."""
+    cutoff = datetime.utcnow() - REFRESH_AFTER
+    stale = engagement_col.find({"computedAt": {"$lt": cutoff}}, {"_id": 1}).sort("computedAt", 1).limit(batch_size)
+    refreshed = 0
+    for doc in stale:
+        refresh_engagement(doc["_id"])
+        refreshed += 1
+    return refreshed
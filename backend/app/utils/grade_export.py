@@ -0,0 +1,106 @@
+# backend/app/utils/grade_export.py
+"""
+Streaming grade exports.
+
+Rows come straight off a Mongo cursor and are handed to the response as they
+are produced, so memory stays flat however many grades match:
+  - CSV is written `FLUSH_ROWS` rows at a time into a small buffer and yielded.
+  - XLSX goes through openpyxl's write-only workbook (rows are spooled to a
+    temp file, not kept as cell objects) and the saved file is streamed in blocks.
+
+The pivot layout has one row per student and one column per subject (or
+subject + testType when the export spans several tests). The cursor is
+sorted by regNumber, so each student's grades arrive together and only the
+current student's row is held.
+
+Both layouts sort on (regNumber, subject, date), which the `grade_export`
+index serves under the department filter, so MongoDB never sorts in memory.
+"""
+import csv
+import io
+import tempfile
+
+from openpyxl import Workbook
+
+FLUSH_ROWS = 1000
+FILE_BLOCK = 64 * 1024
+FLAT_COLUMNS = ["regNumber", "subject", "marks", "testType", "semester", "department", "date", "teacherName", "fileName"]
+
+
+def export_filter(args):
+    """Mongo filter from the export query params (department required)."""
+    query = {"department": args.get("department")}
+    for field in ("semester", "subject", "testType"):
+        if args.get(field):
+            query[field] = args.get(field)
+    return query
+
+
+def _pivot_label(grade, by_test):
+    return f"{grade.get('subject')} ({grade.get('testType')})" if by_test else grade.get("subject")
+
+
+def pivot_columns(collection, query):
+    """Subject columns of a pivot export, from distinct values (no grade rows loaded)."""
+    if "testType" in query:
+        return sorted(str(s) for s in collection.distinct("subject", query)), False
+    pairs = collection.aggregate([
+        {"$match": query},
+        {"$group": {"_id": {"subject": "$subject", "testType": "$testType"}}},
+    ])
+    return sorted(_pivot_label(p["_id"], True) for p in pairs), True
+
+
+def iter_rows(collection, query, pivot=False):
+    """Yield the header, then one list per exported row."""
+    if not pivot:
+        yield FLAT_COLUMNS
+        cursor = collection.find(query, {"_id": 0, **{c: 1 for c in FLAT_COLUMNS}}) \
+            .sort([("regNumber", 1), ("subject", 1), ("date", 1)]).batch_size(FLUSH_ROWS)
+        for g in cursor:
+            yield [g.get(c) for c in FLAT_COLUMNS]
+        return
+
+    columns, by_test = pivot_columns(collection, query)
+    position = {c: i for i, c in enumerate(columns)}
+    yield ["regNumber"] + columns
+
+    # Sorted by student, subject then date: a later grade for the same column wins
+    cursor = collection.find(query, {"_id": 0, "regNumber": 1, "subject": 1, "testType": 1, "marks": 1}) \
+        .sort([("regNumber", 1), ("subject", 1), ("date", 1)]).batch_size(FLUSH_ROWS)
+    current, marks = None, None
+    for g in cursor:
+        if g.get("regNumber") != current:
+            if current is not None:
+                yield [current] + marks
+            current, marks = g.get("regNumber"), [None] * len(columns)
+        i = position.get(_pivot_label(g, by_test))
+        if i is not None:
+            marks[i] = g.get("marks")
+    if current is not None:
+        yield [current] + marks
+
+
+def stream_csv(rows):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for n, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if n % FLUSH_ROWS == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    if buf.tell():
+        yield buf.getvalue()
+
+
+def stream_xlsx(rows, title="Grades"):
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title)
+    for row in rows:
+        ws.append(row)
+    with tempfile.TemporaryFile() as tmp:
+        wb.save(tmp)
+        tmp.seek(0)
+        for block in iter(lambda: tmp.read(FILE_BLOCK), b""):
+            yield block
@@ -0,0 +1,373 @@
+# backend/app/utils/grade_import.py
+"""
+Grade sheet ingestion: column detection, vectorized validation, one `$in`
+lookup for the roll numbers of each chunk and unordered bulk inserts.
+
+Sheets are streamed: CSVs are read `CHUNK_ROWS` rows at a time straight from
+the upload stream and XLSX files through openpyxl's read-only row iterator,
+so memory stays bounded by the chunk size rather than the file size. Each
+chunk is validated and written before the next one is read.
+
+Every dropped row is reported with its spreadsheet row number (header = row 1)
+and a reason, so teachers can fix the sheet and re-upload.
+"""
+import os
+import time
+from zipfile import BadZipFile
+
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from app.utils.grade_stats import invalidate_stats
+
+CHUNK_ROWS = int(os.getenv("GRADE_IMPORT_CHUNK_ROWS", 5000))  # sheet rows parsed per chunk
+BULK_CHUNK = 1000             # grade docs per bulk_write
+MAX_REPORTED_REJECTIONS = 1000  # rejections listed in the report (all are counted)
+IMPORT_MODES = ("upsert", "insert")
+
+# One grade per student, subject and assessment (unique index in models.ensure_indexes)
+GRADE_KEY = ("regNumber", "subject", "semester", "testType", "date")
+
+ROLL_TOKENS = ["roll", "reg", "regno", "reg_number", "registration"]
+SUBJECT_TOKENS = ["subject", "sub"]
+MARKS_TOKENS = ["mark", "score", "marks", "marks_obtained"]
+
+
+class GradeImportError(ValueError):
+    """The sheet as a whole cannot be imported (empty, missing columns, unreadable)."""
+
+
+def _find_column(df_cols, candidates):
+    """Return the first column name in df_cols that contains any candidate token."""
+    for c in df_cols:
+        for cand in candidates:
+            if cand in c:
+                return c
+    return None
+
+
+def _cell_text(value):
+    """Spreadsheet cell -> the string pandas would read (integral floats without '.0')."""
+    if value is None:
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value)
+
+
+def _iter_xlsx(stream, chunk_rows):
+    wb = load_workbook(stream, read_only=True, data_only=True)
+    try:
+        rows = wb.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [str(c) if c is not None else f"unnamed: {i}" for i, c in enumerate(header)]
+        buffer, first = [], 0
+        for row in rows:
+            buffer.append([_cell_text(v) for v in row[:len(columns)]])
+            if len(buffer) == chunk_rows:
+                yield pd.DataFrame(buffer, columns=columns, index=range(first, first + len(buffer)), dtype=object)
+                first += len(buffer)
+                buffer = []
+        if buffer:
+            yield pd.DataFrame(buffer, columns=columns, index=range(first, first + len(buffer)), dtype=object)
+    finally:
+        wb.close()
+
+
+def iter_sheet(stream, filename, chunk_rows=CHUNK_ROWS):
+    """
+    Yield an uploaded .csv/.xlsx as DataFrames of strings, `chunk_rows` rows
+    each. The index keeps counting across chunks (0 = first data row).
+    """
+    try:
+        if filename.lower().endswith(".csv"):
+            yield from pd.read_csv(stream, dtype=str, skip_blank_lines=False, chunksize=chunk_rows)
+        else:
+            yield from _iter_xlsx(stream, chunk_rows)
+    except pd.errors.EmptyDataError:
+        raise GradeImportError("Uploaded file is empty")
+    except BadZipFile:
+        raise GradeImportError("Uploaded .xlsx file is not a valid workbook")
+
+
+def detect_columns(columns):
+    """Map the sheet's (lower-cased) headers to roll/subject/marks columns."""
+    roll_col = _find_column(columns, ROLL_TOKENS)
+    subject_col = _find_column(columns, SUBJECT_TOKENS)
+    marks_col = _find_column(columns, MARKS_TOKENS)
+
+    missing = []
+    if not roll_col:
+        missing.append("rollno (or column containing 'roll'/'reg')")
+    if not subject_col:
+        missing.append("subject")
+    if not marks_col:
+        missing.append("marks")
+    if missing:
+        raise GradeImportError(f"Missing required columns: {', '.join(missing)}")
+    return roll_col, subject_col, marks_col
+
+
+def _clean(series):
+    """Strip whitespace; blanks become NA."""
+    s = series.astype("string").str.strip()
+    return s.mask(s == "")
+
+
+def normalize(df):
+    """
+    Validate a raw sheet with column operations. Returns (rows, rejected):
+    `rows` has regNumber/subject/marks/row for the valid rows, `rejected` has
+    row/regNumber/reason for the others.
+    """
+    df.columns = [str(c).strip().lower() for c in df.columns]
+    roll_col, subject_col, marks_col = detect_columns(df.columns)
+
+    roll = _clean(df[roll_col])
+    subject = _clean(df[subject_col])
+    marks_raw = _clean(df[marks_col])
+    marks = pd.to_numeric(marks_raw, errors="coerce")
+
+    row_no = df.index.to_numpy() + 2  # header is row 1
+    conditions = [
+        roll.isna() & subject.isna() & marks_raw.isna(),
+        roll.isna(),
+        subject.isna(),
+        marks_raw.isna(),
+        marks.isna(),
+        marks < 0,
+    ]
+    reason = np.select(
+        [c.fillna(False).to_numpy(dtype=bool) for c in conditions],
+        [
+            "blank row",
+            "missing roll number",
+            "missing subject",
+            "missing marks",
+            "marks not numeric",
+            "negative marks",
+        ],
+        default="",
+    )
+    ok = reason == ""
+
+    rows = pd.DataFrame({
+        "row": row_no[ok],
+        "regNumber": roll[ok].to_numpy(dtype=object),
+        "subject": subject[ok].to_numpy(dtype=object),
+        "marks": marks[ok].to_numpy(dtype=float),
+    })
+    rejected = pd.DataFrame({
+        "row": row_no[~ok],
+        "regNumber": roll[~ok].fillna("").to_numpy(dtype=object),
+        "reason": reason[~ok],
+    })
+    return rows, rejected
+
+
+def resolve_students(db, reg_numbers):
+    """regNumber -> student id for every known roll number, in one query."""
+    wanted = list({r for r in reg_numbers})
+    if not wanted:
+        return {}
+    return {
+        u["regNumber"]: u["id"]
+        for u in db.users.find(
+            {"regNumber": {"$in": wanted}, "role": "student"}, {"_id": 0, "regNumber": 1, "id": 1}
+        )
+    }
+
+
+def _marks_op(doc):
+    """Change the marks of an existing grade; matches only when they differ."""
+    key = {k: doc.get(k) for k in GRADE_KEY}
+    return UpdateOne({**key, "marks": {"$ne": doc["marks"]}}, {"$set": {"marks": doc["marks"]}})
+
+
+def _grade_op(doc, mode):
+    key = {k: doc.get(k) for k in GRADE_KEY}
+    fields = {k: v for k, v in doc.items() if k not in GRADE_KEY}
+    if mode == "insert":
+        return UpdateOne(key, {"$setOnInsert": fields}, upsert=True)
+    # Marks are written by _marks_op so that re-uploads which only change the
+    # file name or teacher don't count as updates; uploadedAt records when
+    # the grade first appeared
+    on_insert = {"marks": fields.pop("marks")}
+    if "uploadedAt" in fields:
+        on_insert["uploadedAt"] = fields.pop("uploadedAt")
+    return UpdateOne(key, {"$set": fields, "$setOnInsert": on_insert}, upsert=True)
+
+
+def _bulk(collection, ops):
+    """Unordered bulk write. Returns (bulk_api_result, indexes of failed ops)."""
+    try:
+        return collection.bulk_write(ops, ordered=False).bulk_api_result, []
+    except BulkWriteError as e:
+        return e.details, [err["index"] for err in e.details.get("writeErrors", [])]
+
+
+def write_grades(collection, docs, mode="upsert", chunk_size=BULK_CHUNK):
+    """
+    Upsert `docs` on GRADE_KEY with unordered bulk writes. In "upsert" mode
+    existing grades are overwritten, in "insert" mode they are left alone.
+    Only a change of marks counts as an update.
+    Returns ({inserted, updated, unchanged}, failed doc indexes).
+    """
+    counts = {"inserted": 0, "updated": 0, "unchanged": 0}
+    failed = []
+    for start in range(0, len(docs), chunk_size):
+        chunk = docs[start:start + chunk_size]
+        chunk_failed = set()
+        updated = 0
+        if mode != "insert":
+            # Before the upserts, so grades inserted by them are not matched
+            result, errors = _bulk(collection, [_marks_op(d) for d in chunk])
+            updated = result.get("nModified", 0)
+            chunk_failed.update(errors)
+        result, errors = _bulk(collection, [_grade_op(d, mode) for d in chunk])
+        chunk_failed.update(errors)
+        counts["inserted"] += result.get("nUpserted", 0)
+        counts["updated"] += updated
+        counts["unchanged"] += len(chunk) - len(chunk_failed) - result.get("nUpserted", 0) - updated
+        failed.extend(start + i for i in sorted(chunk_failed))
+    return counts, failed
+
+
+def moved_grades(db, rows, meta):
+    """
+    (department, subject) pairs of stored grades among `rows` filed under
+    another department than `meta`'s, whose stats an upsert would change.
+    """
+    if rows.empty:
+        return set()
+    return {
+        (g.get("department"), g["subject"])
+        for g in db.grades.find({
+            "regNumber": {"$in": list(set(rows["regNumber"]))},
+            "subject": {"$in": list(set(rows["subject"]))},
+            "semester": meta.get("semester"),
+            "testType": meta.get("testType"),
+            "date": meta.get("date"),
+            "department": {"$ne": meta.get("department")},
+        }, {"_id": 0, "department": 1, "subject": 1})
+    }
+
+
+def _import_chunk(db, df, meta, mode):
+    """Validate and store one chunk. Returns (write counts, rejected DataFrame)."""
+    rows, rejected = normalize(df)
+
+    # The same grade twice in one sheet: the last row wins
+    repeated = rows.duplicated(["regNumber", "subject"], keep="last")
+    if repeated.any():
+        rejected = pd.concat([rejected, pd.DataFrame({
+            "row": rows["row"][repeated],
+            "regNumber": rows["regNumber"][repeated],
+            "reason": "duplicate of a later row",
+        })], ignore_index=True)
+        rows = rows[~repeated]
+
+    students = resolve_students(db, rows["regNumber"])
+    student_ids = rows["regNumber"].map(students)
+    unknown = student_ids.isna()
+    if unknown.any():
+        rejected = pd.concat([rejected, pd.DataFrame({
+            "row": rows["row"][unknown],
+            "regNumber": rows["regNumber"][unknown],
+            "reason": "unknown roll number",
+        })], ignore_index=True)
+    rows = rows[~unknown].assign(studentId=student_ids[~unknown])
+
+    docs = [
+        {
+            "studentId": student_id,
+            "regNumber": reg,
+            "subject": subject,
+            "marks": float(marks),
+            **meta,
+        }
+        for student_id, reg, subject, marks in zip(
+            rows["studentId"], rows["regNumber"], rows["subject"], rows["marks"]
+        )
+    ]
+    moved = moved_grades(db, rows, meta) if mode == "upsert" else set()
+    counts, failed = write_grades(db.grades, docs, mode)
+    if counts["inserted"] or counts["updated"] or moved:
+        invalidate_stats(db, meta, rows["subject"])
+    for department, subject in moved:
+        invalidate_stats(db, {**meta, "department": department}, [subject])
+    if failed:
+        rejected = pd.concat([rejected, pd.DataFrame({
+            "row": rows["row"].to_numpy()[failed],
+            "regNumber": [docs[i]["regNumber"] for i in failed],
+            "reason": "write failed",
+        })], ignore_index=True)
+    return counts, rejected
+
+
+def import_grades(db, chunks, meta, mode="upsert", start_row=0, on_chunk=None):
+    """
+    Validate and store a sheet chunk by chunk (see iter_sheet). `meta` holds the
+    fields shared by every grade doc (teacherId, teacherName, uploadedAt,
+    fileName, date, semester, department, testType). Returns the import report,
+    including the largest chunk's DataFrame footprint in `metrics` (measured
+    per import, so concurrent imports don't disturb each other's numbers).
+
+    Rows before `start_row` are skipped (resuming an interrupted import).
+    `on_chunk(progress)` is called after each chunk is written with
+    {rowsProcessed, inserted, updated, unchanged, rejectedCount, rejected} for
+    that chunk; returning
+    False stops the import and the report is marked `cancelled`.
+    """
+    started = time.monotonic()
+
+    total = rejected_count = n_chunks = peak_chunk = 0
+    counts = {"inserted": 0, "updated": 0, "unchanged": 0}
+    rejected = []
+    cancelled = False
+    for df in chunks:
+        if start_row:
+            df = df[df.index >= start_row]
+            if df.empty:
+                continue
+        n_chunks += 1
+        total += len(df)
+        peak_chunk = max(peak_chunk, int(df.memory_usage(deep=True).sum()))
+        chunk_counts, chunk_rejected = _import_chunk(db, df, meta, mode)
+        for k, v in chunk_counts.items():
+            counts[k] += v
+        rejected_count += len(chunk_rejected)
+        room = MAX_REPORTED_REJECTIONS - len(rejected)
+        listed = [
+            {"row": int(r.row), "regNumber": r.regNumber, "reason": r.reason}
+            for r in chunk_rejected.sort_values("row", kind="stable").head(max(room, 0)).itertuples(index=False)
+        ]
+        rejected.extend(listed)
+        if on_chunk and on_chunk({
+            "rowsProcessed": int(df.index[-1]) + 1,
+            **chunk_counts,
+            "rejectedCount": len(chunk_rejected),
+            "rejected": listed,
+        }) is False:
+            cancelled = True
+            break
+
+    if total == 0 and not start_row:
+        raise GradeImportError("Uploaded file is empty")
+    return {
+        "totalRows": total,
+        **counts,
+        "rejectedCount": rejected_count,
+        "rejected": rejected,
+        "cancelled": cancelled,
+        "metrics": {
+            "chunks": n_chunks,
+            "peakChunkKB": round(peak_chunk / 1024, 1),
+            "seconds": round(time.monotonic() - started, 3),
+        },
+    }
@@ -0,0 +1,293 @@
+# backend/app/utils/grade_jobs.py
+"""
+Asynchronous grade imports.
+
+upload_grades saves the sheet under UPLOAD_DIR and inserts a job into
+`grade_import_jobs`; it never parses the file inside the request. A pool of
+`GRADE_IMPORT_CONCURRENCY` background tasks claims queued jobs one at a time
+with find_one_and_update, streams the file through grade_import in chunks
+and records progress on the job after every chunk.
+
+Job lifecycle: queued -> running -> done | failed | cancelled.
+
+Every upload also gets a permanent manifest in `grade_uploads` (same _id as
+the job): file name, assessment metadata, sha256 checksum, size and final row
+counts. The teacher's upload history is served from it.
+
+Because the state lives in Mongo, a job survives a restart: a running job
+whose heartbeat is older than STALE_AFTER is put back in the queue and
+resumes after the last fully written chunk (`progress.rowsProcessed`). Jobs
+that keep dying are failed after MAX_ATTEMPTS.
+"""
+import hashlib
+import os
+import socket
+from datetime import datetime, timedelta
+
+from pymongo import ReturnDocument
+
+from app.models import grade_jobs_col, grade_uploads_col
+from app.utils.grade_import import MAX_REPORTED_REJECTIONS, iter_sheet, import_grades
+from app.utils.grade_stats import invalidate_stats
+
+UPLOAD_DIR = os.getenv(
+    "GRADE_UPLOAD_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "uploads"),
+)
+POLL_INTERVAL = 1.0                 # seconds between queue polls when idle
+STALE_AFTER = timedelta(seconds=60)  # running job without heartbeat -> requeued
+MAX_ATTEMPTS = 3
+COPY_BLOCK = 1024 * 1024            # bytes per read when saving an upload
+MANIFEST_FIELDS = ("date", "semester", "department", "testType", "uploadedAt")
+
+FINISHED = ("done", "failed", "cancelled")
+
+
+def upload_path(job_id, filename):
+    ext = os.path.splitext(filename)[1].lower()
+    return os.path.join(UPLOAD_DIR, f"{job_id}{ext}")
+
+
+def save_upload(file_storage, path):
+    """Copy an upload to `path` block by block. Returns (sha256 hex digest, size in bytes)."""
+    digest, size = hashlib.sha256(), 0
+    with open(path, "wb") as out:
+        for block in iter(lambda: file_storage.stream.read(COPY_BLOCK), b""):
+            digest.update(block)
+            out.write(block)
+            size += len(block)
+    return digest.hexdigest(), size
+
+
+def create_job(job_id, teacher_id, filename, path, meta, mode="upsert", checksum=None, size=None):
+    """
+    Queue an import of the sheet saved at `path` and record its upload
+    manifest. `meta` is stamped on every grade doc; `mode` is passed to
+    import_grades.
+    """
+    grade_uploads_col.insert_one({
+        "_id": job_id,
+        "teacherId": teacher_id,
+        "fileName": filename,
+        **{k: meta.get(k) for k in MANIFEST_FIELDS},
+        "checksum": checksum,
+        "sizeBytes": size,
+        "mode": mode,
+        "status": "queued",
+        "rows": None,
+    })
+    job = {
+        "_id": job_id,
+        "teacherId": teacher_id,
+        "fileName": filename,
+        "path": path,
+        "meta": meta,
+        "mode": mode,
+        "status": "queued",
+        "progress": {"rowsProcessed": 0, "inserted": 0, "updated": 0, "unchanged": 0, "rejected": 0},
+        "rejections": [],
+        "attempts": 0,
+        "cancelRequested": False,
+        "createdAt": datetime.utcnow(),
+    }
+    grade_jobs_col.insert_one(job)
+    return job
+
+
+def serialize_job(job):
+    def iso(value):
+        return value.isoformat() + "Z" if value else None
+
+    return {
+        "jobId": str(job["_id"]),
+        "status": job["status"],
+        "fileName": job.get("fileName"),
+        "mode": job.get("mode", "upsert"),
+        "progress": job.get("progress", {}),
+        "rejected": job.get("rejections", []),
+        "metrics": job.get("metrics"),
+        "error": job.get("error"),
+        "cancelRequested": job.get("cancelRequested", False),
+        "createdAt": iso(job.get("createdAt")),
+        "startedAt": iso(job.get("startedAt")),
+        "finishedAt": iso(job.get("finishedAt")),
+    }
+
+
+def cancel_job(job_id, teacher_id):
+    """
+    Cancel a job of `teacher_id`. Queued jobs stop at once; running jobs stop
+    after their current chunk. Returns the updated job, or None if not found.
+    """
+    job = grade_jobs_col.find_one_and_update(
+        {"_id": job_id, "teacherId": teacher_id, "status": "queued"},
+        {"$set": {"status": "cancelled", "cancelRequested": True, "finishedAt": datetime.utcnow()}},
+        return_document=ReturnDocument.AFTER,
+    )
+    if job:
+        _finish_manifest(job)
+        _remove_upload(job)
+        return job
+    return grade_jobs_col.find_one_and_update(
+        {"_id": job_id, "teacherId": teacher_id},
+        {"$set": {"cancelRequested": True}},
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+def _finish_manifest(job):
+    """Copy a finished job's outcome and row counts onto its upload manifest."""
+    progress = job.get("progress", {})
+    grade_uploads_col.update_one({"_id": job["_id"]}, {"$set": {
+        "status": job["status"],
+        "rows": {
+            "total": progress.get("rowsProcessed", 0),
+            "inserted": progress.get("inserted", 0),
+            "updated": progress.get("updated", 0),
+            "unchanged": progress.get("unchanged", 0),
+            "rejected": progress.get("rejected", 0),
+        },
+        "finishedAt": job.get("finishedAt"),
+    }})
+
+
+def _remove_upload(job):
+    try:
+        os.remove(job["path"])
+    except OSError:
+        pass
+
+
+def requeue_stale_jobs():
+    """
+    Put running jobs whose worker stopped heartbeating back in the queue
+    (or close them if they were cancelled or ran out of attempts).
+    """
+    stale = {"status": "running", "heartbeatAt": {"$lt": datetime.utcnow() - STALE_AFTER}}
+    failed = 0
+    for job in grade_jobs_col.find(
+        {**stale, "$or": [{"cancelRequested": True}, {"attempts": {"$gte": MAX_ATTEMPTS}}]},
+        {"cancelRequested": 1},
+    ):
+        if job.get("cancelRequested"):
+            outcome = {"status": "cancelled"}
+        else:
+            outcome = {"status": "failed", "error": "Import kept stopping before it finished"}
+            failed += 1
+        closed = grade_jobs_col.find_one_and_update(
+            {**stale, "_id": job["_id"]},
+            {"$set": {**outcome, "finishedAt": datetime.utcnow()}},
+            return_document=ReturnDocument.AFTER,
+        )
+        if closed:
+            _finish_manifest(closed)
+            _remove_upload(closed)
+    requeued = grade_jobs_col.update_many(stale, {"$set": {"status": "queued"}, "$unset": {"workerId": ""}}).modified_count
+    return requeued, failed
+
+
+class GradeImportWorkers:
+    def __init__(self, concurrency=2):
+        self.concurrency = concurrency
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.started = False
+
+    def start(self, app):
+        from app import socketio
+
+        if self.started:
+            return
+        self.started = True
+        os.makedirs(UPLOAD_DIR, exist_ok=True)
+        with app.app_context():
+            requeued, failed = requeue_stale_jobs()
+        if requeued or failed:
+            print(f"📥 Grade imports: {requeued} interrupted job(s) requeued, {failed} failed")
+        for n in range(self.concurrency):
+            socketio.start_background_task(self._loop, app, n)
+        print(f"📥 Grade import workers started (concurrency={self.concurrency})")
+
+    def _loop(self, app, n):
+        from app import socketio
+
+        last_sweep = datetime.utcnow()
+        while True:
+            job = None
+            try:
+                with app.app_context():
+                    if n == 0 and datetime.utcnow() - last_sweep >= STALE_AFTER:
+                        requeue_stale_jobs()
+                        last_sweep = datetime.utcnow()
+                    job = self.claim()
+                    if job:
+                        self.run(job)
+            except Exception as e:
+                app.logger.error(f"Grade import worker {n} failed: {e}")
+            if not job:
+                socketio.sleep(POLL_INTERVAL)
+
+    def claim(self):
+        now = datetime.utcnow()
+        return grade_jobs_col.find_one_and_update(
+            {"status": "queued"},
+            {"$set": {"status": "running", "workerId": self.worker_id, "startedAt": now, "heartbeatAt": now},
+             "$inc": {"attempts": 1}},
+            sort=[("createdAt", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def run(self, job):
+        from flask import current_app
+        from app import socketio
+
+        job_id = job["_id"]
+        owned = {"_id": job_id, "workerId": self.worker_id, "status": "running"}
+
+        def on_chunk(progress):
+            update = {
+                "$set": {"progress.rowsProcessed": progress["rowsProcessed"], "heartbeatAt": datetime.utcnow()},
+                "$inc": {
+                    "progress.inserted": progress["inserted"],
+                    "progress.updated": progress["updated"],
+                    "progress.unchanged": progress["unchanged"],
+                    "progress.rejected": progress["rejectedCount"],
+                },
+            }
+            if progress["rejected"]:
+                update["$push"] = {"rejections": {"$each": progress["rejected"], "$slice": MAX_REPORTED_REJECTIONS}}
+            current = grade_jobs_col.find_one_and_update(
+                owned, update, projection={"cancelRequested": 1}, return_document=ReturnDocument.AFTER
+            )
+            socketio.sleep(0)  # let requests run between chunks
+            # Lost ownership (requeued elsewhere) or cancelled: stop here
+            return bool(current) and not current.get("cancelRequested")
+
+        try:
+            with open(job["path"], "rb") as stream:
+                chunks = iter_sheet(stream, job["fileName"])
+                try:
+                    report = import_grades(
+                        current_app.db,
+                        chunks,
+                        {**job["meta"], "teacherId": job["teacherId"], "fileName": job["fileName"]},
+                        mode=job.get("mode", "upsert"),
+                        start_row=job["progress"]["rowsProcessed"],
+                        on_chunk=on_chunk,
+                    )
+                finally:
+                    chunks.close()  # before the file closes
+            status, error, metrics = ("cancelled" if report["cancelled"] else "done"), None, report["metrics"]
+        except Exception as e:
+            status, error, metrics = "failed", str(e), None
+
+        finished = grade_jobs_col.find_one_and_update(owned, {"$set": {
+            "status": status, "error": error, "metrics": metrics, "finishedAt": datetime.utcnow()
+        }}, return_document=ReturnDocument.AFTER)
+        if finished:
+            # Stats computed while chunks were still landing may have been cached
+            invalidate_stats(current_app.db, job["meta"])
+            _finish_manifest(finished)
+            _remove_upload(job)
+
+
+grade_import_workers = GradeImportWorkers(int(os.getenv("GRADE_IMPORT_CONCURRENCY", 2)))
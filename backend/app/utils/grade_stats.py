@@ -0,0 +1,79 @@
+# backend/app/utils/grade_stats.py
+"""
+Class-level grade statistics per (department, semester, subject, testType).
+
+Marks are pulled with a narrow projection into one NumPy array and every
+statistic is computed vectorized. Results are cached in `grade_stats`
+(one doc per key) and the affected keys are deleted whenever an import
+writes grades for them, so a cached read is a single _id lookup.
+"""
+from datetime import datetime
+
+import numpy as np
+
+PASS_MARK = 40
+HIST_BIN_WIDTH = 10
+PERCENTILES = (10, 25, 50, 75, 90)
+
+
+def stats_key(department, semester, subject, test_type):
+    """Cache _id for one cohort (field order matters for _id equality)."""
+    return {"department": department, "semester": semester, "subject": subject, "testType": test_type}
+
+
+def compute_stats(db, key):
+    """Statistics of every numeric mark stored under `key`."""
+    cursor = db.grades.find({**key, "marks": {"$type": "number"}}, {"_id": 0, "marks": 1}).batch_size(10000)
+    marks = np.fromiter((g["marks"] for g in cursor), dtype=float)
+
+    if marks.size == 0:
+        return {"count": 0, "mean": None, "median": None, "std": None, "min": None, "max": None,
+                "percentiles": {}, "histogram": [], "passMark": PASS_MARK, "passRate": None}
+
+    pcts = np.percentile(marks, PERCENTILES)
+    top = max(100.0, float(np.ceil(marks.max() / HIST_BIN_WIDTH) * HIST_BIN_WIDTH))
+    edges = np.arange(0.0, top + HIST_BIN_WIDTH, HIST_BIN_WIDTH)
+    counts, _ = np.histogram(np.clip(marks, 0, top), bins=edges)
+
+    return {
+        "count": int(marks.size),
+        "mean": round(float(marks.mean()), 2),
+        "median": round(float(pcts[PERCENTILES.index(50)]), 2),
+        "std": round(float(marks.std()), 2),
+        "min": float(marks.min()),
+        "max": float(marks.max()),
+        "percentiles": {f"p{p}": round(float(v), 2) for p, v in zip(PERCENTILES, pcts)},
+        "histogram": [
+            {"from": float(lo), "to": float(hi), "count": int(n)}
+            for lo, hi, n in zip(edges[:-1], edges[1:], counts)
+        ],
+        "passMark": PASS_MARK,
+        "passRate": round(float((marks >= PASS_MARK).mean()), 4),
+    }
+
+
+def get_stats(db, key):
+    """Cached statistics for `key`, computed and stored on a miss. Returns (stats, cached)."""
+    doc = db.grade_stats.find_one({"_id": key})
+    if doc:
+        return doc["stats"], True
+    stats = compute_stats(db, key)
+    db.grade_stats.replace_one({"_id": key}, {"stats": stats, "computedAt": datetime.utcnow()}, upsert=True)
+    return stats, False
+
+
+def invalidate_stats(db, meta, subjects=None):
+    """
+    Drop cached stats an import touched: the given subjects under `meta`'s
+    department/semester/testType, or every subject there when `subjects` is None.
+    """
+    if subjects is None:
+        db.grade_stats.delete_many({
+            "_id.department": meta.get("department"),
+            "_id.semester": meta.get("semester"),
+            "_id.testType": meta.get("testType"),
+        })
+        return
+    keys = [stats_key(meta.get("department"), meta.get("semester"), s, meta.get("testType")) for s in set(subjects)]
+    if keys:
+        db.grade_stats.delete_many({"_id": {"$in": keys}})
@@ -0,0 +1,110 @@
+# backend/app/utils/group_discovery.py
+"""
+Ranked group discovery.
+
+Each group keeps an `activityScore` maintained with forward decay: every
+message adds exp(ln2 * (t - EPOCH) / HALF_LIFE) to it, so the stored sum
+never has to be rewritten as time passes. Dividing by the same factor for
+"now" gives the decayed message rate (recent messages weigh 1, a message one
+half-life old weighs 0.5, ...). Because all groups share the factor, the
+stored value can be sorted on directly through the (isPrivate, activityScore)
+index. With a 7 day half-life the factor stays inside a double for ~19 years
+after EPOCH.
+
+Candidates come from a bounded pool (most active public groups, private
+groups created by the user's connections, groups the connections belong to)
+and are ranked by members, activity and connection overlap.
+"""
+import math
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+from app.models import groups_col, group_members_col, connections_col
+
+ACTIVITY_EPOCH = datetime(2025, 1, 1)
+ACTIVITY_HALF_LIFE = timedelta(days=7)
+
+CANDIDATE_POOL = 300          # most active public groups considered
+MAX_PRIVATE = 100             # private groups of connections considered
+MAX_FRIENDS = 500             # connections used for overlap
+MAX_FRIEND_MEMBERSHIPS = 5000 # memberships of those connections scanned
+
+WEIGHT_MEMBERS = 1.0          # per log(1 + memberCount)
+WEIGHT_ACTIVITY = 2.0         # per log(1 + decayed messages)
+WEIGHT_FRIENDS = 3.0          # per connection already in the group
+
+
+def _decay_factor(ts):
+    return math.exp(math.log(2) * (ts - ACTIVITY_EPOCH).total_seconds() / ACTIVITY_HALF_LIFE.total_seconds())
+
+
+def activity_increment(ts):
+    """Amount to $inc into a group's activityScore for a message sent at `ts`."""
+    return _decay_factor(ts)
+
+
+def current_activity(score, now=None):
+    """Decayed message count of a stored activityScore as of `now`."""
+    return (score or 0) / _decay_factor(now or datetime.utcnow())
+
+
+def _connections(user_id):
+    docs = connections_col.find(
+        {"$or": [{"user1": user_id}, {"user2": user_id}]}, {"user1": 1, "user2": 1}
+    ).limit(MAX_FRIENDS)
+    return [d["user1"] if d["user2"] == user_id else d["user2"] for d in docs]
+
+
+def rank_groups(user_id, joined_ids):
+    """
+    Ranked groups `user_id` can join, best first. Each entry is the group doc
+    (without members) plus `score` and `connectionsInGroup`.
+    """
+    joined = {str(g) for g in joined_ids}
+    joined_oids = [ObjectId(g) for g in joined]
+    friends = _connections(user_id)
+    projection = {"members": 0}
+
+    pool = {}
+    for g in groups_col.find(
+        {"isPrivate": False, "_id": {"$nin": joined_oids}}, projection
+    ).sort("activityScore", -1).limit(CANDIDATE_POOL):
+        pool[str(g["_id"])] = g
+
+    if friends:
+        for g in groups_col.find(
+            {"isPrivate": True, "createdBy": {"$in": friends}, "_id": {"$nin": joined_oids}}, projection
+        ).limit(MAX_PRIVATE):
+            pool[str(g["_id"])] = g
+
+    # Connection overlap, counted from the friends' memberships
+    overlap = {}
+    if friends:
+        for m in group_members_col.find(
+            {"userId": {"$in": friends}}, {"groupId": 1}
+        ).limit(MAX_FRIEND_MEMBERSHIPS):
+            if m["groupId"] not in joined:
+                overlap[m["groupId"]] = overlap.get(m["groupId"], 0) + 1
+
+        # Public groups friends are in but that fell outside the activity pool
+        missing = [ObjectId(gid) for gid in overlap if gid not in pool and ObjectId.is_valid(gid)]
+        if missing:
+            for g in groups_col.find({"_id": {"$in": missing}, "isPrivate": False}, projection):
+                pool[str(g["_id"])] = g
+
+    now = datetime.utcnow()
+    ranked = []
+    for gid, g in pool.items():
+        friends_in = overlap.get(gid, 0)
+        score = (
+            WEIGHT_MEMBERS * math.log1p(g.get("memberCount", 0))
+            + WEIGHT_ACTIVITY * math.log1p(current_activity(g.get("activityScore"), now))
+            + WEIGHT_FRIENDS * friends_in
+        )
+        g["score"] = round(score, 3)
+        g["connectionsInGroup"] = friends_in
+        ranked.append(g)
+
+    ranked.sort(key=lambda g: (-g["score"], str(g["_id"])))
+    return ranked
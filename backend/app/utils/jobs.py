@@ -0,0 +1,40 @@
+# backend/app/utils/jobs.py
+"""
+Periodic background jobs. They run as Socket.IO background tasks (green
+threads under eventlet) and are started from the `__main__` block of run.py,
+not from create_app or at import time, so CLI commands (`flask --app run`)
+and tests don't spawn workers.
+"""
+import os
+
+
+def _run_periodic(app, name, interval, fn):
+    from app import socketio
+
+    while True:
+        socketio.sleep(interval)
+        try:
+            with app.app_context():
+                fn()
+        except Exception as e:
+            app.logger.error(f"Background job '{name}' failed: {e}")
+
+
+def start_background_jobs(app):
+    """Start every periodic job and the grade import workers. Intervals (seconds) are overridable via env."""
+    from app import socketio
+    from app.utils.suggestions import refresh_stale_suggestions
+    from app.utils.engagement import refresh_stale_engagement
+    from app.utils.cohorts import refresh_stale_cohort_rollups
+    from app.utils.grade_jobs import grade_import_workers
+
+    jobs = [
+        ("suggestions", int(os.getenv("SUGGESTIONS_REFRESH_INTERVAL", 300)), refresh_stale_suggestions),
+        ("engagement", int(os.getenv("ENGAGEMENT_REFRESH_INTERVAL", 300)), refresh_stale_engagement),
+        ("cohort-rollups", int(os.getenv("COHORT_REFRESH_INTERVAL", 300)), refresh_stale_cohort_rollups),
+    ]
+    for name, interval, fn in jobs:
+        socketio.start_background_task(_run_periodic, app, name, interval, fn)
+        print(f"⏱️  Background job '{name}' scheduled every {interval}s")
+
+    grade_import_workers.start(app)
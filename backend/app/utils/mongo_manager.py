@@ -0,0 +1,165 @@
+# backend/app/utils/mongo_manager.py
+"""
+Socket.IO client manager that relays cross-worker traffic (emits to rooms
+held by other processes, room joins, disconnects, callbacks) through a
+MongoDB capped collection read with a tailable cursor. This gives several
+workers behind a load balancer a shared message bus using only the Mongo
+deployment the app already runs.
+
+Outgoing messages are buffered for `batch_interval` seconds (or until
+`max_batch` are waiting) and written as one document; identical emits inside
+a batch are coalesced into one.
+"""
+import pickle
+import threading
+import time
+from collections import deque
+from datetime import timedelta
+
+from bson import Binary, ObjectId
+from pymongo import MongoClient, CursorType
+from pymongo.errors import CollectionInvalid, PyMongoError
+from socketio import PubSubManager
+
+REWIND_SECONDS = 2
+
+
+class MongoManager(PubSubManager):
+    name = "mongo"
+
+    def __init__(self, url="mongodb://localhost:27017/", db_name="acadwell", channel="socketio",
+                 write_only=False, logger=None, capped_size=64 * 1024 * 1024,
+                 batch_interval=0.005, max_batch=256):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.client = MongoClient(url)
+        self.db = self.client[db_name]
+        self.collection_name = f"{channel}_bus"
+        self.collection = self.db[self.collection_name]
+        self.capped_size = capped_size
+        self.batch_interval = batch_interval
+        self.max_batch = max_batch
+
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._flusher_running = False
+        self._seen = deque(maxlen=1024)  # recently delivered bus _ids, for overlap on cursor restarts
+        self._seen_set = set()
+        self.published_docs = 0
+        self.coalesced = 0
+        self._ensure_collection()
+
+    def _ensure_collection(self):
+        if self.collection_name in self.db.list_collection_names():
+            return
+        try:
+            self.db.create_collection(self.collection_name, capped=True, size=self.capped_size)
+            # A tailable cursor on an empty capped collection dies immediately
+            self.collection.insert_one({"origin": None, "messages": None, "ts": time.time()})
+        except CollectionInvalid:
+            pass  # created concurrently by another worker
+
+    def initialize(self):
+        super().initialize()
+        self._flusher_running = True
+        self.server.start_background_task(self._flush_loop)
+
+    # ---------------- publishing ----------------
+    def _publish(self, data):
+        with self._lock:
+            self._buffer.append(data)
+            full = len(self._buffer) >= self.max_batch
+        # Before initialize() (no flusher yet) or on a full batch, write now
+        if full or not self._flusher_running:
+            self._flush()
+
+    def _flush_loop(self):
+        while True:
+            self.server.sleep(self.batch_interval)
+            try:
+                self._flush()
+            except Exception:
+                self._get_logger().exception("Mongo bus flush failed")
+
+    @staticmethod
+    def _coalesce_key(message):
+        if message.get("method") != "emit" or message.get("callback") is not None:
+            return None
+        try:
+            return pickle.dumps((message["event"], message["namespace"], message["room"],
+                                 message["skip_sid"], message["data"]))
+        except Exception:
+            return None
+
+    def _flush(self):
+        with self._lock:
+            batch, self._buffer = self._buffer, []
+        if not batch:
+            return
+
+        messages, seen = [], set()
+        for message in batch:
+            key = self._coalesce_key(message)
+            if key is not None:
+                if key in seen:
+                    self.coalesced += 1
+                    continue
+                seen.add(key)
+            messages.append(message)
+
+        try:
+            self.collection.insert_one({
+                "origin": self.host_id,
+                "ts": time.time(),
+                "messages": Binary(pickle.dumps(messages)),
+            })
+            self.published_docs += 1
+        except PyMongoError:
+            self._get_logger().exception(f"Could not publish {len(messages)} message(s) to the Mongo bus")
+
+    # ---------------- listening ----------------
+    def _remember(self, oid):
+        if len(self._seen) == self._seen.maxlen:
+            self._seen_set.discard(self._seen[0])
+        self._seen.append(oid)
+        self._seen_set.add(oid)
+
+    def _listen(self):
+        last = self.collection.find_one({}, {"_id": 1}, sort=[("$natural", -1)])
+        # Start after whatever is already on the bus; never replay history
+        query = {"_id": {"$gt": last["_id"]}} if last else {}
+        last_id = None
+        retry_sleep = 0.1
+
+        while True:
+            if last_id is not None:
+                # ObjectIds from different hosts are only roughly ordered, so on a
+                # cursor restart rewind a little and skip already-delivered docs
+                rewind = ObjectId.from_datetime(last_id.generation_time - timedelta(seconds=REWIND_SECONDS))
+                query = {"_id": {"$gte": rewind}}
+            try:
+                cursor = self.collection.find(query, cursor_type=CursorType.TAILABLE_AWAIT,
+                                              max_await_time_ms=1000)
+                while cursor.alive:
+                    for doc in cursor:
+                        retry_sleep = 0.1
+                        last_id = doc["_id"]
+                        if doc["_id"] in self._seen_set:
+                            continue
+                        self._remember(doc["_id"])
+                        # Own publications were already handled locally by emit()
+                        if doc.get("origin") in (None, self.host_id) or not doc.get("messages"):
+                            continue
+                        for message in pickle.loads(doc["messages"]):
+                            yield message
+            except PyMongoError:
+                self._get_logger().exception("Mongo bus cursor failed, reconnecting")
+            self.server.sleep(retry_sleep)
+            retry_sleep = min(retry_sleep * 2, 5)
+
+    def stats(self):
+        return {
+            "hostId": self.host_id,
+            "publishedDocs": self.published_docs,
+            "coalesced": self.coalesced,
+            "buffered": len(self._buffer),
+        }
@@ -0,0 +1,111 @@
+# backend/app/utils/mood_risk.py
+"""
+Streaming at-risk detection over mood logs.
+
+Each logged mood is mapped to a score (the scale of the student wellness
+chart) and folded into a per-user state doc in `mood_risk_state`:
+
+    {_id: userId, n, mean, var, lastScore, lastAt, lastAlertAt: {kind: at}}
+
+`mean`/`var` are an exponentially weighted mean and variance, so each update
+is O(1) and needs no history. Alerts go to the `risk_alerts` queue:
+
+    sharp_drop      score at least max(DROP_Z std, MIN_DROP) below the running mean
+    sustained_low   running mean crossed below LOW_MEAN
+
+Both need WARMUP_ENTRIES moods first and repeat at most once per
+ALERT_COOLDOWN per kind. `flask replay-mood-risk` rebuilds every state doc
+from the mood buckets in one pass.
+"""
+import math
+from datetime import datetime, timedelta
+
+from pymongo.errors import DuplicateKeyError
+
+from app.models import mood_risk_col, risk_alerts_col
+
+MOOD_SCORES = {"happy": 9, "neutral": 5, "sad": 2}
+ALPHA = 0.3                 # weight of the newest score
+WARMUP_ENTRIES = 5
+DROP_Z = 2.0
+MIN_DROP = 5.0              # e.g. happy -> sad, but not happy -> neutral
+LOW_MEAN = 4.0
+ALERT_COOLDOWN = timedelta(days=1)
+MAX_RETRIES = 3
+
+
+def update_state(state, score, at):
+    """Fold one score into `state` (not modified). Returns (new_state, alerts)."""
+    n = state.get("n", 0)
+    alerts = []
+    if n == 0:
+        mean, var = float(score), 0.0
+    else:
+        prev_mean, prev_var = state["mean"], state["var"]
+        diff = score - prev_mean
+        if n >= WARMUP_ENTRIES and -diff >= max(DROP_Z * math.sqrt(prev_var), MIN_DROP):
+            alerts.append({"kind": "sharp_drop", "baseline": round(prev_mean, 2)})
+        incr = ALPHA * diff
+        mean = prev_mean + incr
+        var = (1 - ALPHA) * (prev_var + diff * incr)
+        if n >= WARMUP_ENTRIES and prev_mean >= LOW_MEAN > mean:
+            alerts.append({"kind": "sustained_low", "baseline": round(prev_mean, 2)})
+
+    last_alert = dict(state.get("lastAlertAt") or {})
+    alerts = [a for a in alerts if a["kind"] not in last_alert or at - last_alert[a["kind"]] >= ALERT_COOLDOWN]
+    for a in alerts:
+        last_alert[a["kind"]] = at
+        a["ewma"] = round(mean, 2)
+
+    return {"n": n + 1, "mean": mean, "var": var, "lastScore": score, "lastAt": at, "lastAlertAt": last_alert}, alerts
+
+
+def alert_doc(user_id, mood, score, at, alert):
+    return {"userId": user_id, "mood": mood, "score": score, "at": at, **alert,
+            "status": "open", "createdAt": datetime.utcnow()}
+
+
+def track_mood(user_id, mood, at=None):
+    """
+    Update `user_id`'s risk state with a newly logged mood and queue any alerts.
+    Moods without a score are ignored. Returns the alerts raised.
+    """
+    score = MOOD_SCORES.get(mood)
+    if score is None:
+        return []
+    at = at or datetime.utcnow()
+
+    # Optimistic concurrency on `n`: a concurrent save for the same user retries
+    for _ in range(MAX_RETRIES):
+        state = mood_risk_col.find_one({"_id": user_id}) or {}
+        new_state, alerts = update_state(state, score, at)
+        try:
+            result = mood_risk_col.update_one(
+                {"_id": user_id, "n": state.get("n", 0)}, {"$set": new_state}, upsert=True
+            )
+        except DuplicateKeyError:
+            continue  # another request created the doc first
+        if result.matched_count or result.upserted_id is not None:
+            break
+    else:
+        return []
+
+    if alerts:
+        risk_alerts_col.insert_many([alert_doc(user_id, mood, score, at, a) for a in alerts])
+    return alerts
+
+
+def serialize_alert(doc, names=None):
+    return {
+        "_id": str(doc["_id"]),
+        "userId": doc.get("userId"),
+        "name": (names or {}).get(doc.get("userId")),
+        "kind": doc.get("kind"),
+        "mood": doc.get("mood"),
+        "score": doc.get("score"),
+        "baseline": doc.get("baseline"),
+        "ewma": doc.get("ewma"),
+        "at": doc["at"].isoformat() if doc.get("at") else None,
+        "status": doc.get("status"),
+        "createdAt": doc["createdAt"].isoformat() if doc.get("createdAt") else None,
+    }
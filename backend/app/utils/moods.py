@@ -0,0 +1,91 @@
+# backend/app/utils/moods.py
+"""
+Mood storage in a bucket-pattern layout: one `wellness_mood_days` doc per
+(userId, day) holding that day's entries plus per-mood counts and a total.
+
+    {userId, day: "YYYY-MM-DD", entries: [{id, mood, at}], counts: {happy: 2, ...}, total}
+
+A year of moods is at most 365 small docs per user, so charts downsample on
+the server by folding the day counts into week/month buckets.
+"""
+from datetime import date, datetime, timedelta
+
+from bson import ObjectId
+
+from app.models import mood_days_col
+
+MAX_ENTRIES_PER_DAY = 200        # raw entries kept per day (counts keep counting)
+GRANULARITIES = ("day", "week", "month")
+DEFAULT_RANGE = {"day": timedelta(days=30), "week": timedelta(weeks=26), "month": timedelta(days=365)}
+MAX_RANGE = timedelta(days=3660)
+
+
+def valid_mood(mood):
+    """Moods become field names in `counts`, so they must be safe path segments."""
+    return isinstance(mood, str) and 0 < len(mood) <= 32 and "." not in mood and not mood.startswith("$")
+
+
+def record_mood(user_id, mood, at=None):
+    """Append a mood to the user's bucket for the day of `at`. Returns the entry."""
+    at = at or datetime.utcnow()
+    entry = {"id": ObjectId(), "mood": mood, "at": at}
+    mood_days_col.update_one(
+        {"userId": user_id, "day": at.strftime("%Y-%m-%d")},
+        {
+            "$push": {"entries": {"$each": [entry], "$slice": -MAX_ENTRIES_PER_DAY}},
+            "$inc": {f"counts.{mood}": 1, "total": 1},
+        },
+        upsert=True,
+    )
+    return entry
+
+
+def recent_moods(user_id, limit=30):
+    """The latest `limit` entries, newest first, read from as few day buckets as needed."""
+    result = []
+    buckets = mood_days_col.find({"userId": user_id}, {"_id": 0, "entries": 1}).sort("day", -1)
+    for bucket in buckets:
+        for entry in reversed(bucket.get("entries", [])):
+            result.append(entry)
+            if len(result) == limit:
+                return result
+    return result
+
+
+def period_start(day, granularity):
+    """First day of the day/week (Monday)/month bucket containing `day`."""
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    if granularity == "month":
+        return day.replace(day=1)
+    return day
+
+
+def mood_series(user_id, start, end, granularity="day"):
+    """
+    Mood counts between `start` and `end` (dates, inclusive) folded into
+    day/week/month buckets, oldest first. Only periods with moods are listed.
+    """
+    buckets = mood_days_col.find(
+        {"userId": user_id, "day": {"$gte": start.isoformat(), "$lte": end.isoformat()}},
+        {"_id": 0, "day": 1, "counts": 1, "total": 1},
+    ).sort("day", 1)
+
+    periods = {}
+    for b in buckets:
+        key = period_start(date.fromisoformat(b["day"]), granularity)
+        p = periods.setdefault(key, {"counts": {}, "total": 0})
+        for mood, n in (b.get("counts") or {}).items():
+            p["counts"][mood] = p["counts"].get(mood, 0) + n
+        p["total"] += b.get("total", 0)
+
+    return [
+        {
+            "period": key.isoformat(),
+            "counts": p["counts"],
+            "total": p["total"],
+            # Most frequent mood; ties go to the alphabetically first for stable output
+            "dominant": min(p["counts"], key=lambda m: (-p["counts"][m], m)) if p["counts"] else None,
+        }
+        for key, p in sorted(periods.items())
+    ]
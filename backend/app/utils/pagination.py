@@ -0,0 +1,49 @@
+# backend/app/utils/pagination.py
+import base64
+from datetime import datetime
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+
+def encode_cursor(timestamp, oid):
+    """Encode a (timestamp, _id) keyset position as an opaque URL-safe token."""
+    raw = f"{timestamp.isoformat()}|{oid}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token, id_type=ObjectId):
+    """
+    Decode a token produced by encode_cursor. `id_type` rebuilds the _id
+    (ObjectId by default, `str` for collections keyed by strings).
+    Raises ValueError if malformed.
+    """
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        ts, oid = raw.split("|", 1)
+        return datetime.fromisoformat(ts), id_type(oid)
+    except (ValueError, TypeError, InvalidId, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {token}") from e
+
+
+def parse_limit(args, default=50, maximum=200):
+    """Read ?limit= from request args, clamped to [1, maximum]."""
+    try:
+        limit = int(args.get("limit", default))
+    except (TypeError, ValueError):
+        limit = default
+    return max(1, min(limit, maximum))
+
+
+def keyset_filter(cursor, direction, field="timestamp"):
+    """
+    Mongo filter selecting documents strictly before (direction=-1) or after
+    (direction=1) a decoded (timestamp, _id) cursor.
+    """
+    ts, oid = cursor
+    op = "$lt" if direction < 0 else "$gt"
+    return {"$or": [
+        {field: {op: ts}},
+        {field: ts, "_id": {op: oid}},
+    ]}
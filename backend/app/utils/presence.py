@@ -0,0 +1,243 @@
+# backend/app/utils/presence.py
+"""
+Presence tracking for the Socket.IO layer.
+
+A user is online while at least one of their sockets is (per-sid reference
+counting). Online/offline transitions are not broadcast one by one: they are
+collected and, every `flush_interval` seconds, folded into at most one
+"presence" emit per recipient ({online: [...], offline: [...]}) sent only to
+the changed users' connections. A user who drops and reconnects within one
+interval produces no emit at all.
+
+Sockets refresh their `last_seen` on every event (and the explicit
+"heartbeat" event); sessions silent for `session_timeout` seconds are expired.
+
+Socket bookkeeping is per worker, but who is online is shared through the
+`presence` collection: each worker keeps one doc per (worker, user) it holds,
+written on flush and re-stamped every sweep. Transitions are decided
+atomically on a per-user counter in `presence_counts` (the number of workers
+holding the user): a worker that takes it from 0 to 1 announces the user
+online, one that takes it from 1 to 0 announces them offline, so concurrent
+flushes on two workers can neither both stay silent nor both announce.
+Diffs are emitted to user rooms, so the Socket.IO bus delivers them whichever
+worker the recipient is on. Docs of a crashed worker stop counting after
+`session_timeout`; the next sweep of a live worker deletes them, decrements
+the counters and announces the users that went offline.
+"""
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from pymongo import ReturnDocument
+
+
+class PresenceTracker:
+    def __init__(self, socketio, partners_fn, store, counts, flush_interval=0.5, session_timeout=90,
+                 sweep_interval=15):
+        self.socketio = socketio
+        self.partners_fn = partners_fn      # user_id -> iterable of connected user ids
+        self.store = store                  # shared `presence` collection
+        self.counts = counts                # shared `presence_counts` collection
+        self.worker_id = uuid.uuid4().hex
+        self.flush_interval = flush_interval
+        self.session_timeout = session_timeout
+        self.sweep_interval = sweep_interval
+
+        self._sids = {}         # sid -> [user_id, last_seen]
+        self._counts = {}       # user_id -> number of live sockets
+        self._announced = {}    # user_id -> last online state broadcast to partners
+        self._dirty = set()     # users whose state may differ from _announced
+        self._lock = threading.Lock()
+        self._started = False
+        self.emits = 0
+
+    def _ensure_started(self):
+        if not self._started:
+            self._started = True
+            self.socketio.start_background_task(self._run)
+
+    # ---------------- session bookkeeping ----------------
+    def connect(self, sid, user_id):
+        with self._lock:
+            self._ensure_started()
+            previous = self._sids.get(sid)
+            if previous and previous[0] == user_id:
+                previous[1] = time.monotonic()
+                return
+            if previous:
+                self._release(sid)
+            self._sids[sid] = [user_id, time.monotonic()]
+            self._counts[user_id] = self._counts.get(user_id, 0) + 1
+            if self._counts[user_id] == 1:
+                self._dirty.add(user_id)
+
+    def _release(self, sid):
+        user_id, _ = self._sids.pop(sid)
+        self._counts[user_id] -= 1
+        if self._counts[user_id] <= 0:
+            del self._counts[user_id]
+            self._dirty.add(user_id)
+        return user_id
+
+    def disconnect(self, sid):
+        with self._lock:
+            if sid in self._sids:
+                self._release(sid)
+
+    def heartbeat(self, sid):
+        with self._lock:
+            entry = self._sids.get(sid)
+            if entry:
+                entry[1] = time.monotonic()
+
+    # ---------------- shared state ----------------
+    def _doc_id(self, user_id):
+        return f"{self.worker_id}:{user_id}"
+
+    def _fresh(self):
+        return {"$gte": datetime.utcnow() - timedelta(seconds=self.session_timeout)}
+
+    def _online(self, user_ids):
+        """Users among `user_ids` with a fresh presence doc on any worker."""
+        user_ids = list(set(user_ids))
+        if not user_ids:
+            return set()
+        return set(self.store.distinct("userId", {"userId": {"$in": user_ids}, "seenAt": self._fresh()}))
+
+    def _add_holder(self, user_id, delta):
+        """Atomically move `user_id`'s worker count by `delta`; returns the new count."""
+        doc = self.counts.find_one_and_update(
+            {"_id": user_id}, {"$inc": {"workers": delta}}, upsert=True, return_document=ReturnDocument.AFTER
+        )
+        if doc["workers"] <= 0:
+            # Only removed while still at zero, so a concurrent 0 -> 1 is never lost
+            self.counts.delete_one({"_id": user_id, "workers": {"$lte": 0}})
+        return doc["workers"]
+
+    def online_among(self, user_ids):
+        user_ids = list(user_ids)
+        online = self._online(user_ids)
+        return [u for u in user_ids if u in online]
+
+    def close(self):
+        """Release this worker's users (called on shutdown)."""
+        with self._lock:
+            for user_id in self._counts:
+                self._dirty.add(user_id)
+            self._counts.clear()
+            self._sids.clear()
+        self.flush()
+
+    # ---------------- background work ----------------
+    def _run(self):
+        last_sweep = time.monotonic()
+        while True:
+            self.socketio.sleep(self.flush_interval)
+            try:
+                if time.monotonic() - last_sweep >= self.sweep_interval:
+                    self.sweep()
+                    last_sweep = time.monotonic()
+                self.flush()
+            except Exception as e:
+                print(f"[Presence] background pass failed: {e}")
+
+    def sweep(self):
+        """Expire sessions that have not been heard from within session_timeout."""
+        cutoff = time.monotonic() - self.session_timeout
+        with self._lock:
+            stale = [sid for sid, (_, seen) in self._sids.items() if seen < cutoff]
+            for sid in stale:
+                self._release(sid)
+        # Keep this worker's docs fresh (users going offline are removed by flush)
+        refreshed = self.store.update_many({"worker": self.worker_id}, {"$set": {"seenAt": datetime.utcnow()}})
+        with self._lock:
+            if refreshed.matched_count < len(self._announced):
+                # Another worker released docs of ours that went stale (e.g. a long
+                # stall): publish those users again on the next flush
+                held = set(self.store.distinct("userId", {"worker": self.worker_id}))
+                for user_id in [u for u in self._announced if u not in held]:
+                    del self._announced[user_id]
+                    self._dirty.add(user_id)
+        self._release_crashed()
+        for sid in stale:
+            try:
+                self.socketio.server.disconnect(sid)
+            except Exception:
+                pass
+        return len(stale)
+
+    def _release_crashed(self):
+        """Delete other workers' stale docs and announce users no worker holds any more."""
+        stale = {"seenAt": {"$lt": datetime.utcnow() - timedelta(seconds=self.session_timeout)}}
+        offline = set()
+        for doc in self.store.find({**stale, "worker": {"$ne": self.worker_id}}, {"userId": 1}):
+            # The delete is the claim: only one sweeping worker decrements per doc
+            if self.store.delete_one({"_id": doc["_id"], **stale}).deleted_count:
+                if self._add_holder(doc["userId"], -1) == 0:
+                    offline.add(doc["userId"])
+        return self._announce({user_id: False for user_id in offline})
+
+    def flush(self):
+        """
+        Publish this worker's transitions since the last flush and send the
+        coalesced online/offline diffs for users whose overall state changed.
+        """
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            local = {}
+            for user_id in dirty:
+                online = user_id in self._counts
+                if self._announced.get(user_id, False) != online:
+                    local[user_id] = online
+                    if online:
+                        self._announced[user_id] = True
+                    else:
+                        self._announced.pop(user_id, None)
+        if not local:
+            return 0
+
+        now = datetime.utcnow()
+        changes = {}
+        for user_id, online in local.items():
+            doc_id = self._doc_id(user_id)
+            if online:
+                held = self.store.update_one(
+                    {"_id": doc_id}, {"$set": {"userId": user_id, "worker": self.worker_id, "seenAt": now}}, upsert=True
+                ).upserted_id is not None
+            else:
+                # Gone already if a sweep released it as stale (and decremented for us)
+                held = self.store.delete_one({"_id": doc_id}).deleted_count > 0
+            if held and self._add_holder(user_id, 1 if online else -1) == (1 if online else 0):
+                changes[user_id] = online
+        return self._announce(changes)
+
+    def _announce(self, changes):
+        """Send {user_id: online} changes to the users' online partners, one emit per recipient."""
+        if not changes:
+            return 0
+
+        partners = {user_id: list(self.partners_fn(user_id)) for user_id in changes}
+        online_partners = self._online(p for ps in partners.values() for p in ps)
+
+        diffs = {}  # recipient -> {"online": [...], "offline": [...]}
+        for user_id, online in changes.items():
+            for partner in partners[user_id]:
+                if partner in online_partners:
+                    diff = diffs.setdefault(partner, {"online": [], "offline": []})
+                    diff["online" if online else "offline"].append(user_id)
+
+        for recipient, diff in diffs.items():
+            self.socketio.emit("presence", diff, to=recipient)
+        self.emits += len(diffs)
+        return len(diffs)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "worker": self.worker_id,
+                "sockets": len(self._sids),
+                "onlineUsers": len(self._counts),
+                "pendingChanges": len(self._dirty),
+                "emits": self.emits,
+            }
@@ -0,0 +1,124 @@
+# backend/app/utils/suggestions.py
+"""
+"People you may know" engine. Scores are precomputed per user into
+`user_suggestions` ({_id: user_id, candidates: [...], computedAt}) by a
+background job and served from that single document.
+"""
+from datetime import datetime, timedelta
+
+from app.models import users_col, connections_col, requests_col, group_members_col, suggestions_col
+
+MAX_CANDIDATES = 200          # ranked candidates kept per user
+MAX_FRIENDS = 500             # connections expanded for friends-of-friends
+MAX_FOF_EDGES = 5000          # second-degree edges scanned
+MAX_PROFILE_MATCHES = 500     # same university/field/year users scanned
+MAX_GROUPS = 50               # groups scanned for shared membership
+MAX_GROUP_MEMBERS = 5000      # co-members read across those groups
+MAX_EXCLUDED_IN_QUERY = 200   # $nin cap; the rest is filtered in Python
+REFRESH_AFTER = timedelta(hours=6)
+
+SCORE_MUTUAL = 3
+SCORE_SHARED_GROUP = 2
+SCORE_SAME_UNIVERSITY = 1
+SCORE_SAME_FIELD = 1
+SCORE_SAME_YEAR = 1
+
+
+def _partners(user_id, limit):
+    docs = connections_col.find(
+        {"$or": [{"user1": user_id}, {"user2": user_id}]}, {"user1": 1, "user2": 1}
+    ).limit(limit)
+    return [d["user1"] if d["user2"] == user_id else d["user2"] for d in docs]
+
+
+def _pending(user_id):
+    docs = requests_col.find({"$or": [{"from": user_id}, {"to": user_id}]}, {"from": 1, "to": 1})
+    return {d["from"] if d["to"] == user_id else d["to"] for d in docs}
+
+
+def compute_suggestions(user_id):
+    """Score candidates for `user_id` from friends-of-friends, profile and group overlap."""
+    friends = _partners(user_id, MAX_FRIENDS)
+    excluded = set(friends) | _pending(user_id) | {user_id}
+    capped_excluded = list(excluded)[:MAX_EXCLUDED_IN_QUERY]
+
+    scores, reasons = {}, {}
+
+    def add(candidate, points, reason):
+        if candidate in excluded:
+            return
+        scores[candidate] = scores.get(candidate, 0) + points
+        reasons.setdefault(candidate, set()).add(reason)
+
+    # Friends of friends: each mutual connection counts
+    if friends:
+        edges = connections_col.find(
+            {"$or": [{"user1": {"$in": friends}}, {"user2": {"$in": friends}}]},
+            {"user1": 1, "user2": 1},
+        ).limit(MAX_FOF_EDGES)
+        friend_set = set(friends)
+        for e in edges:
+            for a, b in ((e["user1"], e["user2"]), (e["user2"], e["user1"])):
+                if a in friend_set and b not in friend_set:
+                    add(b, SCORE_MUTUAL, "mutual_connections")
+
+    # Same university, plus field / year
+    me = users_col.find_one({"id": user_id}, {"university": 1, "field": 1, "year": 1})
+    if me and me.get("university"):
+        or_terms = [{k: me[k]} for k in ("field", "year") if me.get(k)]
+        query = {"university": me["university"], "id": {"$nin": capped_excluded}}
+        if or_terms:
+            query["$or"] = or_terms
+        for u in users_col.find(query, {"id": 1, "field": 1, "year": 1}).limit(MAX_PROFILE_MATCHES):
+            add(u["id"], SCORE_SAME_UNIVERSITY, "same_university")
+            if me.get("field") and u.get("field") == me["field"]:
+                add(u["id"], SCORE_SAME_FIELD, "same_field")
+            if me.get("year") and u.get("year") == me["year"]:
+                add(u["id"], SCORE_SAME_YEAR, "same_year")
+
+    # Shared group membership
+    group_ids = [
+        m["groupId"] for m in
+        group_members_col.find({"userId": user_id}, {"groupId": 1}).sort("joinedAt", -1).limit(MAX_GROUPS)
+    ]
+    if group_ids:
+        co_members = group_members_col.find(
+            {"groupId": {"$in": group_ids}}, {"userId": 1}
+        ).limit(MAX_GROUP_MEMBERS)
+        for m in co_members:
+            add(m["userId"], SCORE_SHARED_GROUP, "shared_group")
+
+    ranked = sorted(scores.items(), key=lambda kv: (-kv[1], kv[0]))[:MAX_CANDIDATES]
+    return [{"id": cid, "score": score, "reasons": sorted(reasons[cid])} for cid, score in ranked]
+
+
+def refresh_suggestions(user_id):
+    """Recompute and store the ranked candidate list of one user."""
+    candidates = compute_suggestions(user_id)
+    doc = {"candidates": candidates, "computedAt": datetime.utcnow()}
+    suggestions_col.update_one({"_id": user_id}, {"$set": doc}, upsert=True)
+    return {"_id": user_id, **doc}
+
+
+def get_suggestions_doc(user_id):
+    """Stored suggestions for `user_id`, computed on the spot on first use."""
+    doc = suggestions_col.find_one({"_id": user_id})
+    return doc or refresh_suggestions(user_id)
+
+
+def mark_stale(*user_ids):
+    """Queue users for the next background refresh (e.g. after a new connection)."""
+    suggestions_col.update_many(
+        {"_id": {"$in": list(user_ids)}}, {"$set": {"computedAt": datetime.min}}
+    )
+
+
+def refresh_stale_suggestions(batch_size=200):
+    """Background job: recompute the oldest suggestion docs past REFRESH_AFTER."""
+    cutoff = datetime.utcnow() - REFRESH_AFTER
+    stale = suggestions_col.find({"computedAt": {"$lt": cutoff}}, {"_id": 1}).sort("computedAt", 1).limit(batch_size)
+    refreshed = 0
+    for doc in stale:
+        refresh_suggestions(doc["_id"])
+        refreshed += 1
+    return refreshed
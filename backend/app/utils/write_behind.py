@@ -0,0 +1,132 @@
+# backend/app/utils/write_behind.py
+"""
+Bounded write-behind buffer: documents are accepted immediately, then
+persisted in batches with insert_many once `max_batch` are pending or every
+`flush_interval` seconds, whichever comes first. `on_flush` receives the
+(doc, meta) pairs of each persisted batch so callers can ack after the write.
+"""
+import threading
+from collections import deque
+
+from pymongo.errors import BulkWriteError, PyMongoError
+
+DUPLICATE_KEY = 11000
+
+
+class WriteBehindQueue:
+    def __init__(self, socketio, collection, on_flush=None, max_batch=500,
+                 flush_interval=0.05, max_pending=10000, logger=None):
+        self.socketio = socketio
+        self.collection = collection
+        self.on_flush = on_flush
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.logger = logger
+
+        self._pending = deque()            # (doc, meta)
+        self._lock = threading.Lock()      # guards _pending / state flags
+        self._flush_lock = threading.Lock()  # one insert_many in flight at a time
+        self._started = False
+        self._closed = False
+        self.flushed = 0
+        self.rejected = 0
+
+    def _log(self, msg):
+        if self.logger:
+            self.logger.error(msg)
+        else:
+            print(f"[WriteBehind] {msg}")
+
+    def _ensure_started(self):
+        # Started lazily so CLI commands that build the app never spawn a flusher
+        if not self._started:
+            self._started = True
+            self.socketio.start_background_task(self._run)
+
+    def submit(self, doc, meta=None):
+        """
+        Queue `doc` for persistence. Returns False when the buffer is full or
+        draining, so the caller can push back on the client instead of growing
+        memory without bound.
+        """
+        with self._lock:
+            if self._closed or len(self._pending) >= self.max_pending:
+                self.rejected += 1
+                return False
+            self._ensure_started()
+            self._pending.append((doc, meta))
+            size_reached = len(self._pending) >= self.max_batch
+        if size_reached:
+            self.socketio.start_background_task(self.flush)
+        return True
+
+    def pending(self):
+        return len(self._pending)
+
+    def _run(self):
+        while True:
+            self.socketio.sleep(self.flush_interval)
+            self.flush()
+            if self._closed and not self._pending:
+                return
+
+    def flush(self):
+        """Persist everything currently pending, max_batch documents per insert_many."""
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    batch = [self._pending.popleft() for _ in range(min(self.max_batch, len(self._pending)))]
+                if not batch:
+                    return
+                if not self._write(batch):
+                    return
+
+    def _write(self, batch):
+        docs = [doc for doc, _ in batch]
+        failed = set()
+        try:
+            self.collection.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            # A duplicate _id means an earlier attempt already landed: count it as saved
+            for err in e.details.get("writeErrors", []):
+                if err.get("code") != DUPLICATE_KEY:
+                    failed.add(err["index"])
+                    self._log(f"Dropped message {docs[err['index']].get('_id')}: {err.get('errmsg')}")
+        except PyMongoError as e:
+            # Transient failure: put the batch back in front and retry next tick
+            self._log(f"Flush of {len(batch)} docs failed, will retry: {e}")
+            with self._lock:
+                self._pending.extendleft(reversed(batch))
+            return False
+
+        saved = [item for i, item in enumerate(batch) if i not in failed]
+        self.flushed += len(saved)
+        if self.on_flush:
+            try:
+                self.on_flush(saved, [item for i, item in enumerate(batch) if i in failed])
+            except Exception as e:
+                self._log(f"on_flush callback failed: {e}")
+        return True
+
+    def drain(self, timeout=10):
+        """Stop accepting writes and flush what is buffered (graceful shutdown)."""
+        with self._lock:
+            self._closed = True
+        waited = 0.0
+        while self._pending and waited < timeout:
+            self.flush()
+            if self._pending:
+                self.socketio.sleep(0.1)
+                waited += 0.1
+        if self._pending:
+            self._log(f"Shutdown with {len(self._pending)} unsaved messages")
+
+    def stats(self):
+        return {
+            "pending": len(self._pending),
+            "flushed": self.flushed,
+            "rejected": self.rejected,
+            "maxPending": self.max_pending,
+            "maxBatch": self.max_batch,
+        }
@@ -1,9 +1,12 @@
 # run.py
 import os
+import signal
+import sys
 import eventlet
 eventlet.monkey_patch()
 
 from app import create_app, socketio
+from app.utils.jobs import start_background_jobs
 from dotenv import load_dotenv
 
 # Load .env file
@@ -12,10 +15,20 @@ load_dotenv()
 # Create Flask app
 app = create_app()
 
+# Turn SIGTERM into a normal exit so atexit hooks (e.g. draining buffered
+# chat messages) run when the process is stopped
+signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
 # Entry point
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 5000))
     debug = os.getenv("FLASK_ENV") != "production"
+
+    # Periodic maintenance jobs, server process only: `flask --app run <cmd>`
+    # imports this module too and must not claim queued imports
+    # (set BACKGROUND_JOBS=0 to disable on extra workers)
+    if os.getenv("BACKGROUND_JOBS", "1") != "0":
+        start_background_jobs(app)
     
     print(f"🚀 Starting Acadwell backend on port {port} (Debug={debug})")
     socketio.run(
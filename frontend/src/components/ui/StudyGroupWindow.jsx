@@ -1,5 +1,6 @@
 import React, { useEffect, useState, useRef } from "react";
 import axios from "axios";
+import { io } from "socket.io-client";
 import { ArrowLeft } from "lucide-react";
 import "../css/StudyGroupWindow.css";
 
@@ -16,13 +17,26 @@ const StudyGroupWindow = ({
   const [showGroupInfo, setShowGroupInfo] = useState(false);
   const [groupInfo, setGroupInfo] = useState(null);
   const messageEndRef = useRef(null);
+  const cursorRef = useRef(null);
+  const [olderCursor, setOlderCursor] = useState(null);
+  const [loadingOlder, setLoadingOlder] = useState(false);
 
   const API_BASE = "http://localhost:5000/api/groups";
+  const SOCKET_URL = "http://localhost:5000";
 
   const scrollToBottom = () => {
     messageEndRef.current?.scrollIntoView({ behavior: "smooth" });
   };
 
+  // Append without duplicates (a message can arrive both live and via catch-up)
+  const appendMessages = (incoming) => {
+    setMessages((prev) => {
+      const seen = new Set(prev.map((m) => m._id));
+      return [...prev, ...incoming.filter((m) => !seen.has(m._id))];
+    });
+    scrollToBottom();
+  };
+
   const fetchMessages = async () => {
     try {
       const token = sessionStorage.getItem("token");
@@ -30,6 +44,8 @@ const StudyGroupWindow = ({
         headers: { Authorization: `Bearer ${token}` },
       });
       setMessages(res.data.messages || []);
+      cursorRef.current = res.data.cursor;
+      setOlderCursor(res.data.next_cursor || null);
       setLoading(false);
       scrollToBottom();
     } catch (err) {
@@ -37,6 +53,48 @@ const StudyGroupWindow = ({
     }
   };
 
+  // Scroll back: prepend the page before the oldest loaded message
+  const loadOlder = async () => {
+    if (!olderCursor || loadingOlder) return;
+    setLoadingOlder(true);
+    try {
+      const token = sessionStorage.getItem("token");
+      const res = await axios.get(`${API_BASE}/${groupId}/messages`, {
+        headers: { Authorization: `Bearer ${token}` },
+        params: { before: olderCursor },
+      });
+      setMessages((prev) => {
+        const seen = new Set(prev.map((m) => m._id));
+        return [...(res.data.messages || []).filter((m) => !seen.has(m._id)), ...prev];
+      });
+      setOlderCursor(res.data.next_cursor || null);
+    } catch (err) {
+      console.error("Load older messages error:", err);
+    } finally {
+      setLoadingOlder(false);
+    }
+  };
+
+  // Fetch only what was missed while the socket was disconnected
+  const catchUp = async () => {
+    if (!cursorRef.current) return fetchMessages();
+    try {
+      const token = sessionStorage.getItem("token");
+      let hasMore = true;
+      while (hasMore) {
+        const res = await axios.get(`${API_BASE}/${groupId}/messages`, {
+          headers: { Authorization: `Bearer ${token}` },
+          params: { since: cursorRef.current },
+        });
+        appendMessages(res.data.messages || []);
+        cursorRef.current = res.data.cursor;
+        hasMore = res.data.has_more;
+      }
+    } catch (err) {
+      console.error("Catch-up error:", err);
+    }
+  };
+
   const fetchGroupInfo = async () => {
     try {
       const token = sessionStorage.getItem("token");
@@ -52,8 +110,32 @@ const StudyGroupWindow = ({
   useEffect(() => {
     fetchMessages();
     fetchGroupInfo();
-    const interval = setInterval(fetchMessages, 3000);
-    return () => clearInterval(interval);
+
+    // Live updates replace polling: the server pushes each new message once
+    const token = sessionStorage.getItem("token");
+    const socket = io(SOCKET_URL, { transports: ["websocket"] });
+    let connectedBefore = false;
+    socket.on("connect", () => {
+      socket.emit("join", { token });
+      socket.emit("join_group", { group_id: groupId });
+      if (connectedBefore) catchUp();
+      connectedBefore = true;
+    });
+    // The session is registered for presence: keep it alive like ChatRoom does
+    const heartbeat = setInterval(() => socket.emit("heartbeat"), 30000);
+    // Server-initiated disconnects (e.g. an expired session) are not retried by the client
+    socket.on("disconnect", (reason) => {
+      if (reason === "io server disconnect") socket.connect();
+    });
+    socket.on("group_message", (msg) => {
+      appendMessages([msg]);
+    });
+
+    return () => {
+      clearInterval(heartbeat);
+      socket.emit("leave_group", { group_id: groupId });
+      socket.disconnect();
+    };
   }, [groupId]);
 
   const sendMessage = async () => {
@@ -66,7 +148,6 @@ const StudyGroupWindow = ({
         { headers: { Authorization: `Bearer ${token}` } }
       );
       setNewMessage("");
-      fetchMessages();
     } catch (err) {
       console.error("Send message error:", err);
     }
@@ -122,6 +203,11 @@ const StudyGroupWindow = ({
       {/* Chat Container */}
       <div className="chat-container">
         <div className="chat-messages custom-scroll">
+          {!loading && olderCursor && (
+            <button onClick={loadOlder} disabled={loadingOlder} className="info-text">
+              {loadingOlder ? "Loading..." : "Load older messages"}
+            </button>
+          )}
           {loading ? (
             <p className="info-text">Loading messages...</p>
           ) : messages.length === 0 ? (
@@ -4,6 +4,8 @@ import { chatAPI } from "../../../services/api";
 import { SendHorizonal, Users } from "lucide-react";
 
 const SOCKET_URL = "http://localhost:5000";
+const MAX_SEND_ATTEMPTS = 3;
+const RETRY_DELAY_MS = 1000;
 
 const ChatRoom = ({ userType = "Teacher" }) => {
   const [connections, setConnections] = useState([]);
@@ -11,14 +13,41 @@ const ChatRoom = ({ userType = "Teacher" }) => {
   const [messages, setMessages] = useState([]);
   const [newMsg, setNewMsg] = useState("");
   const [onlineUsers, setOnlineUsers] = useState([]);
+  const [olderCursor, setOlderCursor] = useState(null);
+  const [loadingOlder, setLoadingOlder] = useState(false);
+  // scrollHeight before older messages were prepended (keeps the view in place)
+  const prependHeightRef = useRef(null);
 
   const socketRef = useRef(null);
   const scrollRef = useRef(null);
+  const selectedRef = useRef(null);
+  // client_id -> { msg, attempts, inFlight } of messages not yet acknowledged by the server
+  const pendingRef = useRef(new Map());
+  const joinedRef = useRef(false);
 
   const user = JSON.parse(localStorage.getItem("user") || "{}");
   const userId = String(user?.anon_id || "");
   const token = localStorage.getItem("token") || "";
 
+  useEffect(() => {
+    selectedRef.current = selectedUser;
+  }, [selectedUser]);
+
+  const setStatus = (clientId, status, extra = {}) => {
+    setMessages((prev) =>
+      prev.map((m) => (m.client_id === clientId ? { ...m, ...extra, status } : m))
+    );
+  };
+
+  // Emit a pending message; it is only sent once the socket has joined
+  const emitPending = (clientId) => {
+    const entry = pendingRef.current.get(clientId);
+    if (!entry || !joinedRef.current || !socketRef.current?.connected) return;
+    entry.attempts += 1;
+    entry.inFlight = true;
+    socketRef.current.emit("send_message", entry.msg);
+  };
+
   // ✅ Connect socket once
   useEffect(() => {
     if (!token) return;
@@ -26,25 +55,81 @@ const ChatRoom = ({ userType = "Teacher" }) => {
     const socket = io(SOCKET_URL, { transports: ["websocket"] });
     socketRef.current = socket;
 
-    socket.emit("join", { token });
+    // Sessions are per socket id: join again after every (re)connect
+    socket.on("connect", () => {
+      joinedRef.current = false;
+      socket.emit("join", { token });
+    });
+
+    socket.on("disconnect", (reason) => {
+      joinedRef.current = false;
+      // Acks for in-flight messages are lost with the socket: let the user resend
+      pendingRef.current.forEach((entry, clientId) => {
+        if (entry.inFlight) {
+          pendingRef.current.delete(clientId);
+          setStatus(clientId, "failed");
+        }
+      });
+      if (reason === "io server disconnect") socket.connect();
+    });
 
     socket.on("online_users", (list) => {
       setOnlineUsers(list);
+      // The join succeeded: send whatever was queued while offline
+      joinedRef.current = true;
+      pendingRef.current.forEach((entry, clientId) => {
+        if (!entry.inFlight) emitPending(clientId);
+      });
     });
 
+    // Batched presence diffs: { online: [...], offline: [...] }
+    socket.on("presence", ({ online = [], offline = [] }) => {
+      setOnlineUsers((prev) => [
+        ...prev.filter((id) => !offline.includes(id) && !online.includes(id)),
+        ...online,
+      ]);
+    });
+
+    socket.on("message_ack", ({ client_id, id, status }) => {
+      const entry = pendingRef.current.get(client_id);
+      if (!entry) return;
+      if (status === "retry" && entry.attempts < MAX_SEND_ATTEMPTS) {
+        entry.inFlight = false;
+        setTimeout(() => emitPending(client_id), RETRY_DELAY_MS * entry.attempts);
+        return;
+      }
+      pendingRef.current.delete(client_id);
+      if (status === "saved") setStatus(client_id, "sent", { _id: id });
+      else setStatus(client_id, "failed");
+    });
+
+    socket.on("error", ({ msg, client_id } = {}) => {
+      console.error("Socket error:", msg);
+      if (client_id && pendingRef.current.has(client_id)) {
+        pendingRef.current.delete(client_id);
+        setStatus(client_id, "failed");
+      }
+    });
+
+    const heartbeat = setInterval(() => socket.emit("heartbeat"), 30000);
+
     socket.on("receive_message", (msg) => {
-      if (
-        msg.sender_id === userId ||
-        msg.receiver_id === userId ||
-        msg.sender_id === selectedUser?.anon_id ||
-        msg.receiver_id === selectedUser?.anon_id
-      ) {
-        setMessages((prev) => [...prev, msg]);
+      const partner = selectedRef.current?.anon_id;
+      if (msg.sender_id === partner || msg.receiver_id === partner) {
+        // Our own message echoed from another tab/socket may already be listed
+        setMessages((prev) =>
+          prev.some((m) => m._id === msg._id || (msg.client_id && m.client_id === msg.client_id))
+            ? prev
+            : [...prev, msg]
+        );
       }
     });
 
-    return () => socket.disconnect();
-  }, [token, userId, selectedUser?.anon_id]);
+    return () => {
+      clearInterval(heartbeat);
+      socket.disconnect();
+    };
+  }, [token, userId]);
 
   // ✅ Fetch connections
   useEffect(() => {
@@ -61,52 +146,84 @@ const ChatRoom = ({ userType = "Teacher" }) => {
     fetchConnections();
   }, []);
 
-  // ✅ Load messages
+  const normalize = (list) =>
+    list.map((m) => ({
+      ...m,
+      sender_id: String(m.sender_id),
+      receiver_id: String(m.receiver_id),
+    }));
+
+  // ✅ Load messages (latest page; older pages via next_cursor)
   const loadMessages = async (partnerId) => {
     try {
       const res = await chatAPI.getMessages(partnerId);
       if (res.data.success) {
-        const normalized = res.data.messages.map((m) => ({
-          ...m,
-          sender_id: String(m.sender_id),
-          receiver_id: String(m.receiver_id),
-        }));
-        setMessages(normalized);
+        setMessages(normalize(res.data.messages));
+        setOlderCursor(res.data.next_cursor || null);
       }
     } catch (err) {
       console.error("Error loading messages:", err);
     }
   };
 
-  // ✅ Send message
-  const sendMessage = async () => {
-    const text = newMsg.trim();
-    if (!text || !selectedUser) return;
-
-    const payload = { receiver_id: selectedUser.anon_id, text };
-
+  const loadOlder = async () => {
+    if (!selectedUser || !olderCursor || loadingOlder) return;
+    const partnerId = selectedUser.anon_id;
+    setLoadingOlder(true);
     try {
-      const res = await chatAPI.sendMessage(payload);
-      if (res.data.success) {
-        const msgObj = {
-          sender_id: userId,
-          receiver_id: selectedUser.anon_id,
-          text,
-          timestamp: new Date().toISOString(),
-        };
-
-        socketRef.current?.emit("send_message", msgObj);
-        setMessages((prev) => [...prev, msgObj]);
-        setNewMsg("");
+      const res = await chatAPI.getMessages(partnerId, { before: olderCursor });
+      if (res.data.success && selectedRef.current?.anon_id === partnerId) {
+        const older = normalize(res.data.messages);
+        prependHeightRef.current = scrollRef.current?.scrollHeight ?? null;
+        setMessages((prev) => {
+          const seen = new Set(prev.map((m) => m._id));
+          return [...older.filter((m) => !seen.has(m._id)), ...prev];
+        });
+        setOlderCursor(res.data.next_cursor || null);
       }
     } catch (err) {
-      console.error("Error sending message:", err);
+      console.error("Error loading older messages:", err);
+    } finally {
+      setLoadingOlder(false);
     }
   };
 
+  // ✅ Send message (persisted server-side; "message_ack" confirms the write)
+  const queueMessage = (msgObj) => {
+    pendingRef.current.set(msgObj.client_id, { msg: msgObj, attempts: 0, inFlight: false });
+    emitPending(msgObj.client_id);
+  };
+
+  const sendMessage = () => {
+    const text = newMsg.trim();
+    if (!text || !selectedUser) return;
+
+    const msgObj = {
+      receiver_id: selectedUser.anon_id,
+      text,
+      client_id: `${Date.now()}-${Math.random().toString(36).slice(2)}`,
+    };
+
+    setMessages((prev) => [
+      ...prev,
+      { ...msgObj, sender_id: userId, timestamp: new Date().toISOString(), status: "sending" },
+    ]);
+    queueMessage(msgObj);
+    setNewMsg("");
+  };
+
+  const resendMessage = (m) => {
+    setStatus(m.client_id, "sending");
+    queueMessage({ receiver_id: m.receiver_id, text: m.text, client_id: m.client_id });
+  };
+
   // ✅ Auto-scroll
   useEffect(() => {
-    if (scrollRef.current) {
+    if (!scrollRef.current) return;
+    if (prependHeightRef.current !== null) {
+      scrollRef.current.scrollTop = scrollRef.current.scrollHeight - prependHeightRef.current;
+      prependHeightRef.current = null;
+    } else {
       scrollRef.current.scrollTop = scrollRef.current.scrollHeight;
     }
   }, [messages]);
@@ -182,11 +299,22 @@ const ChatRoom = ({ userType = "Teacher" }) => {
               ref={scrollRef}
               className="flex-1 p-4 overflow-y-auto space-y-3"
             >
+              {olderCursor && (
+                <div className="text-center">
+                  <button
+                    onClick={loadOlder}
+                    disabled={loadingOlder}
+                    className="text-xs text-gray-300 hover:text-white underline"
+                  >
+                    {loadingOlder ? "Loading..." : "Load older messages"}
+                  </button>
+                </div>
+              )}
               {messages.map((m, i) => {
                 const isMe = m.sender_id === userId;
                 return (
                   <div
-                    key={i}
+                    key={m._id || m.client_id || i}
                     className={`flex ${isMe ? "justify-end" : "justify-start"} animate-fadeIn`}
                   >
                     <div
@@ -204,6 +332,15 @@ const ChatRoom = ({ userType = "Teacher" }) => {
                               minute: "2-digit",
                             })
                           : ""}
+                        {isMe && m.status === "sending" && " · sending"}
+                        {isMe && m.status === "failed" && (
+                          <button
+                            onClick={() => resendMessage(m)}
+                            className="ml-1 text-red-300 underline"
+                          >
+                            not sent, retry
+                          </button>
+                        )}
                       </div>
                     </div>
                   </div>
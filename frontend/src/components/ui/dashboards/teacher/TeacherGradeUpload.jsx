@@ -5,6 +5,7 @@ import "../../../css/dashboards/teacher/TeacherDashboard.css";
  * TeacherGradeUpload.jsx
  * - Uses flexible token lookup (sessionStorage/localStorage)
  * - Posts form-data with file + metadata to /api/teacher/upload_grades
+ * - Polls /api/teacher/upload_jobs/<jobId> until the queued import finishes
  * - Fetches teacher's own history from /api/teacher/my_uploads
  */
 
@@ -49,6 +50,27 @@ const TeacherGradeUpload = () => {
     fetchHistory();
   }, []);
 
+  const pollJob = async (jobId, token) => {
+    while (true) {
+      await new Promise((r) => setTimeout(r, 1000));
+      const res = await fetch(`http://localhost:5000/api/teacher/upload_jobs/${jobId}`, {
+        headers: { Authorization: `Bearer ${token}` },
+      });
+      const data = await res.json();
+      if (!res.ok || !data.success) throw new Error(data.message || "Could not read import status");
+      const { status, progress = {}, error } = data.job;
+      if (status === "queued" || status === "running") {
+        setUploadStatus(`⏳ Importing... ${progress.rowsProcessed || 0} rows processed`);
+        continue;
+      }
+      if (status === "done") {
+        return `✅ Uploaded successfully! ${progress.inserted} new, ${progress.updated} updated, ${progress.unchanged} unchanged` +
+          (progress.rejected ? `, ${progress.rejected} rows rejected` : "");
+      }
+      return status === "cancelled" ? "⚠️ Import cancelled" : `❌ Import failed: ${error || "unknown error"}`;
+    }
+  };
+
   const handleFileChange = (e) => {
     setSelectedFile(e.target.files[0] || null);
     setUploadStatus("");
@@ -89,7 +111,8 @@ const TeacherGradeUpload = () => {
 
       const data = await res.json();
       if (res.ok && data.success) {
-        setUploadStatus("✅ Uploaded successfully!");
+        setUploadStatus("⏳ Import queued...");
+        setUploadStatus(await pollJob(data.jobId, token));
         setSelectedFile(null);
         setDate("");
         setSemester("");
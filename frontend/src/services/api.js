@@ -103,7 +103,9 @@ export const chatAPI = {
   // ✅ Messaging
   sendMessage: (receiverId, { text }) =>
     api.post(`/chat/messages/${receiverId}`, { text }),
-  getMessages: (partnerId) => api.get(`/chat/messages/${partnerId}`),
+  // params: { before } = next_cursor of the previous page, for older messages
+  getMessages: (partnerId, params = {}) =>
+    api.get(`/chat/messages/${partnerId}`, { params }),
 };
 
 // ========================================================